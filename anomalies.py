@@ -0,0 +1,38 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from src.models.user import User, AnomalyFlag, parse_period
+from src.services.etag import etag_validated
+
+anomalies_bp = Blueprint('anomalies', __name__)
+
+@anomalies_bp.route('/anomalies', methods=['GET'])
+@jwt_required()
+@etag_validated
+def get_anomalies():
+    """Voci segnalate come anomale (es. uno zero in più sugli stipendi), dalla più recente.
+
+    Con ?period=YYYY-MM restituisce solo le segnalazioni di quel mese.
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+
+        if not user:
+            return jsonify({'error': 'Utente non trovato'}), 404
+
+        query = AnomalyFlag.query.filter_by(user_id=user.id)
+        if request.args.get('period'):
+            period = parse_period(request.args['period'])
+            if period is None:
+                return jsonify({'error': 'Periodo non valido (usa YYYY-MM)'}), 400
+            query = query.filter_by(period=period)
+
+        flags = query.order_by(AnomalyFlag.period.desc(), AnomalyFlag.field).all()
+
+        return jsonify({
+            'anomalies': [flag.to_dict() for flag in flags],
+            'total': len(flags)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from src.models.user import User, Subscription, db
+from src.services.benchmarks import reassign_benchmarks
+from src.services.passwords import password_hasher, PasswordHashBusy, TooManyAttempts
 from datetime import timedelta
 import re
 
@@ -15,6 +17,12 @@ def validate_password(password):
     """Valida la password (minimo 8 caratteri)"""
     return len(password) >= 8
 
+def too_many_attempts(e):
+    return jsonify({'error': f'Troppi tentativi, riprova tra {e.retry_after} secondi'}), 429, {'Retry-After': str(e.retry_after)}
+
+def hashing_busy():
+    return jsonify({'error': 'Troppi accessi in corso, riprova tra poco'}), 503, {'Retry-After': '5'}
+
 @auth_bp.route('/auth/register', methods=['POST'])
 def register():
     try:
@@ -44,6 +52,10 @@ def register():
         if User.query.filter_by(email=email).first():
             return jsonify({'error': 'Email già registrata'}), 400
         
+        # Ogni registrazione costa un hash bcrypt: conta per il limite dell'IP
+        password_hasher.admit()
+        password_hasher.record_attempt()
+        
         # Crea nuovo utente
         user = User(
             email=email,
@@ -52,7 +64,7 @@ def register():
             business_name=business_name,
             business_type=business_type
         )
-        user.set_password(password)
+        user.password_hash = password_hasher.hash(password)
         
         db.session.add(user)
         db.session.commit()
@@ -78,6 +90,10 @@ def register():
             'user': user.to_dict()
         }), 201
         
+    except TooManyAttempts as e:
+        return too_many_attempts(e)
+    except PasswordHashBusy:
+        return hashing_busy()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Errore interno del server'}), 500
@@ -93,12 +109,21 @@ def login():
         email = data['email'].lower().strip()
         password = data['password']
         
+        # Rifiuta prima di bcrypt IP ed email con troppi tentativi falliti
+        password_hasher.admit(email)
+        
         # Trova l'utente
         user = User.query.filter_by(email=email).first()
         
-        if not user or not user.check_password(password):
+        if not user or not password_hasher.check(user.password_hash, password):
+            password_hasher.record_attempt(email)
             return jsonify({'error': 'Credenziali non valide'}), 401
         
+        password_hasher.record_success(email)
+        # Hash con un costo diverso da BCRYPT_LOG_ROUNDS: aggiornato in modo trasparente
+        if password_hasher.rehash(user, password):
+            db.session.commit()
+        
         # Crea token JWT
         access_token = create_access_token(
             identity=user.id,
@@ -111,7 +136,12 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except TooManyAttempts as e:
+        return too_many_attempts(e)
+    except PasswordHashBusy:
+        return hashing_busy()
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Errore interno del server'}), 500
 
 @auth_bp.route('/auth/me', methods=['GET'])
@@ -159,7 +189,11 @@ def update_profile():
         if 'business_name' in data:
             user.business_name = data['business_name'].strip()
         if 'business_type' in data:
-            user.business_type = data['business_type'].strip()
+            business_type = data['business_type'].strip()
+            if business_type != user.business_type:
+                user.business_type = business_type
+                # I mesi già inseriti passano al gruppo di confronto del nuovo tipo
+                reassign_benchmarks(user.id)
         
         db.session.commit()
         
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+# Aggiungi il percorso del progetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import random
+import time
+import tracemalloc
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import and_
+from src.models.user import db, User, FinancialData, CENTS, month_ordinal
+from src.routes.dashboard import get_trend_statistics
+from src.routes.financial import FINANCIAL_FIELDS
+
+YEARS = 20
+OTHER_USERS = 200
+REPEAT = 20
+
+def create_benchmark_app():
+    """App Flask con un database SQLite in memoria"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def populate(years):
+    """Crea un utente con `years` anni di storico più altri utenti per rendere la tabella realistica"""
+    rng = random.Random(42)
+    end_year = datetime.now().year
+    user_ids = []
+
+    for index in range(OTHER_USERS + 1):
+        user = User(email=f'bench{index}@esempio.com', first_name='Bench', last_name=str(index), password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        user_ids.append(user.id)
+
+        rows = []
+        for year in range(end_year - years + 1, end_year + 1):
+            for month in range(1, 13):
+                row = {'user_id': user.id, 'year': year, 'month': month}
+                for field in FINANCIAL_FIELDS:
+                    row[field] = rng.randint(0, 5000 * CENTS)
+                rows.append(row)
+        db.session.execute(FinancialData.__table__.insert(), rows)
+
+    db.session.commit()
+    return user_ids[0]
+
+def legacy_trend_statistics(user_id, months):
+    """Implementazione precedente: carica le righe come oggetti ORM e aggrega in Python"""
+    current_date = datetime.now()
+    start_year = current_date.year - (months // 12) - 1
+    trends_data = FinancialData.query.filter(
+        and_(
+            FinancialData.user_id == user_id,
+            FinancialData.year >= start_year
+        )
+    ).order_by(FinancialData.year.asc(), FinancialData.month.asc()).all()
+
+    total_ricavi = sum(data.ricavi_totali for data in trends_data)
+    total_costi = sum(data.totale_costi for data in trends_data)
+    total_utile = sum(data.utile_netto for data in trends_data)
+    avg_margine = sum(data.margine_percentuale for data in trends_data) / len(trends_data)
+    best_month = max(trends_data, key=lambda x: x.utile_netto)
+    worst_month = min(trends_data, key=lambda x: x.utile_netto)
+    return total_ricavi, total_costi, total_utile, avg_margine, best_month, worst_month
+
+def measure(label, func):
+    """Tempo medio e picco di memoria di una funzione"""
+    func()
+    db.session.expunge_all()
+
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func()
+        db.session.expunge_all()
+    elapsed = (time.perf_counter() - start) / REPEAT
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.session.expunge_all()
+
+    print(f"{label:<32} {elapsed * 1000:8.2f} ms   picco memoria {peak / 1024:8.1f} KiB")
+
+def run_benchmark():
+    """Confronta /dashboard/trends prima e dopo l'aggregazione in SQL"""
+    app = create_benchmark_app()
+    with app.app_context():
+        db.create_all()
+        user_id = populate(YEARS)
+        months = YEARS * 12
+
+        now = datetime.now()
+        end_period = month_ordinal(now.year, now.month)
+
+        print(f"Utente con {YEARS} anni di storico ({months} mesi), {OTHER_USERS} altri utenti")
+        measure('Python (oggetti ORM)', lambda: legacy_trend_statistics(user_id, months))
+        measure('SQL (query aggregata)', lambda: get_trend_statistics(user_id, end_period - months + 1, end_period))
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+# Aggiungi il percorso del progetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import time
+import numpy as np
+from src.models.user import CENTS
+from src.services.pnl import INPUT_FIELDS, compute_pnl, to_columns
+
+SIZES = (10_000, 1_000_000)
+REPEAT = 3
+
+class LegacyMonth:
+    """Mese con le vecchie property di FinancialData: ogni metrica ricalcolata riga per riga"""
+
+    __slots__ = INPUT_FIELDS
+
+    def __init__(self, values):
+        for field, value in zip(INPUT_FIELDS, values):
+            setattr(self, field, value)
+
+    @property
+    def ricavi_totali(self):
+        return float(self.ricavi_servizi or 0) + float(self.ricavi_prodotti or 0) + float(self.altri_ricavi or 0)
+
+    @property
+    def costi_variabili(self):
+        return float(self.costo_merci or 0) + float(self.provvigioni or 0) + float(self.marketing_variabile or 0)
+
+    @property
+    def costi_fissi(self):
+        return float(self.affitto or 0) + float(self.stipendi or 0) + float(self.utenze or 0) + float(self.marketing_fisso or 0) + float(self.altri_costi_fissi or 0)
+
+    @property
+    def totale_costi(self):
+        return self.costi_variabili + self.costi_fissi
+
+    @property
+    def utile_netto(self):
+        return self.ricavi_totali - self.totale_costi
+
+    @property
+    def margine_percentuale(self):
+        if self.ricavi_totali > 0:
+            return (self.utile_netto / self.ricavi_totali) * 100
+        return 0
+
+def legacy_metrics(months):
+    """Metriche calcolate con le property, come faceva to_dict()"""
+    return [
+        (m.ricavi_totali, m.costi_variabili, m.costi_fissi, m.totale_costi, m.utile_netto, m.margine_percentuale)
+        for m in months
+    ]
+
+def measure(label, func):
+    """Tempo migliore su REPEAT esecuzioni"""
+    best = None
+    result = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<40} {best * 1000:10.2f} ms")
+    return best, result
+
+def run_benchmark():
+    """Confronta le property per riga con il calcolo vettoriale di src.services.pnl"""
+    rng = np.random.default_rng(42)
+
+    for size in SIZES:
+        # Importi in centesimi interi, come in financial_data
+        columns = {field: rng.integers(0, 5000 * CENTS, size) for field in INPUT_FIELDS}
+        months = [LegacyMonth(values) for values in zip(*(columns[field].tolist() for field in INPUT_FIELDS))]
+
+        print(f"{size:,} mesi")
+        legacy_time, legacy = measure('property per riga', lambda: legacy_metrics(months))
+        vector_time, metrics = measure('compute_pnl (colonne NumPy)', lambda: compute_pnl(columns))
+        full_time, _ = measure('to_columns + compute_pnl (da oggetti)', lambda: compute_pnl(to_columns(months)))
+
+        # Stessi risultati: le somme in centesimi interi sono esatte
+        legacy_utile = np.fromiter((row[4] for row in legacy), dtype=np.float64, count=size)
+        difference = np.max(np.abs(legacy_utile - metrics['utile_netto'])) / CENTS
+        print(f"  speedup {legacy_time / vector_time:.0f}x (colonne), {legacy_time / full_time:.1f}x (da oggetti), "
+              f"scarto massimo utile {difference:.4f}")
+
+        del months, legacy
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,74 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import func, select
+from src.models.user import User, FinancialData, BenchmarkSketch, db, parse_period, format_period
+from src.services.benchmarks import MIN_TENANTS, get_benchmark, month_metrics, normalize_business_type
+from src.services.etag import etag_validated
+
+benchmarking_bp = Blueprint('benchmarking', __name__)
+
+def sketch_validator(user_id):
+    """Parte del validatore che dipende dagli sketch letti dalla vista.
+
+    Gli sketch cambiano anche quando scrivono gli altri utenti dello stesso
+    tipo di attività: entrano nell'ETag tipo di attività, periodo e numero,
+    totale e max(updated_at) degli sketch di quel gruppo e mese.
+    """
+    business_type = normalize_business_type(db.session.get(User, int(user_id)).business_type)
+    if request.args.get('period'):
+        period = parse_period(request.args['period'])
+    else:
+        period = db.session.scalar(select(func.max(FinancialData.period)).where(FinancialData.user_id == user_id))
+
+    rows, total, last_update = db.session.execute(
+        select(func.count(BenchmarkSketch.id), func.sum(BenchmarkSketch.count), func.max(BenchmarkSketch.updated_at))
+        .where(BenchmarkSketch.business_type == business_type, BenchmarkSketch.period == period)
+    ).one()
+    return [business_type, period, rows, total, last_update]
+
+@benchmarking_bp.route('/benchmark', methods=['GET'])
+@jwt_required()
+@etag_validated(extra=sketch_validator)
+def get_user_benchmark():
+    """Confronto con le attività dello stesso tipo per un mese (?period=YYYY-MM, default l'ultimo).
+
+    I percentili vengono letti dagli sketch precalcolati per tipo di attività e
+    mese: la richiesta non legge mai i dati degli altri utenti.
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+
+        if not user:
+            return jsonify({'error': 'Utente non trovato'}), 404
+
+        business_type = normalize_business_type(user.business_type)
+        if business_type is None:
+            return jsonify({'error': 'Imposta il tipo di attività nel profilo per vedere il confronto'}), 400
+
+        query = FinancialData.query.filter_by(user_id=user.id)
+        if request.args.get('period'):
+            period = parse_period(request.args['period'])
+            if period is None:
+                return jsonify({'error': 'Periodo non valido (usa YYYY-MM)'}), 400
+            financial_data = query.filter_by(period=period).first()
+        else:
+            financial_data = query.order_by(FinancialData.period.desc()).first()
+
+        if not financial_data:
+            return jsonify({'error': 'Nessun dato disponibile per il periodo'}), 404
+
+        metrics = get_benchmark(business_type, financial_data.period, month_metrics(financial_data))
+
+        response = {
+            'business_type': user.business_type,
+            'period': format_period(financial_data.period),
+            'metrics': metrics
+        }
+        if not metrics:
+            response['message'] = f'Confronto disponibile quando ci sono almeno {MIN_TENANTS} attività dello stesso tipo'
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,20 +1,211 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from src.models.user import User, FinancialData, db
-from sqlalchemy import func, and_
-from datetime import datetime, timedelta
+from src.models.user import User, FinancialData, db, from_cents, month_ordinal, month_from_ordinal, parse_period
+from src.services.cache import dashboard_cache
+from src.services.etag import etag_validated
+from src.services.pnl import compute_month
+from sqlalchemy import func, case, select
+from datetime import datetime
+import calendar
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Totali restituiti dal riepilogo e quelli per cui si calcola la variazione sul mese precedente
+SUMMARY_METRICS = ['ricavi_totali', 'costi_fissi', 'costi_variabili', 'totale_costi', 'utile_netto', 'margine_percentuale']
+SUMMARY_CHANGE_METRICS = ['ricavi_totali', 'costi_fissi', 'costi_variabili', 'utile_netto', 'margine_percentuale']
+
+# Numero massimo di periodi richiedibili in un solo riepilogo
+MAX_SUMMARY_PERIODS = 120
+
+def percent_change(current, previous):
+    """Espressione SQL della variazione percentuale, NULL se il precedente è assente o zero"""
+    return case(
+        (previous == 0, None),
+        else_=(current - previous) * 100.0 / previous
+    )
+
+def get_period_summaries(user_id, periods):
+    """Riepilogo di più mesi con le variazioni sul mese precedente, in un'unica query.
+    
+    I mesi richiesti e i rispettivi precedenti vengono letti dall'indice
+    (user_id, period) e affiancati con LAG(); la join con users verifica anche
+    l'esistenza dell'utente. Restituisce None se l'utente non esiste, altrimenti
+    un dizionario period -> riepilogo per i soli mesi con dati.
+    """
+    wanted = set(periods) | {period - 1 for period in periods}
+    window = {'order_by': FinancialData.period}
+    
+    lagged = select(
+        FinancialData.period,
+        FinancialData.year,
+        FinancialData.month,
+        func.lag(FinancialData.period).over(**window).label('prev_period'),
+        *[getattr(FinancialData, metric) for metric in SUMMARY_METRICS],
+        *[func.lag(getattr(FinancialData, metric)).over(**window).label(f'prev_{metric}')
+          for metric in SUMMARY_CHANGE_METRICS]
+    ).where(
+        FinancialData.user_id == user_id,
+        FinancialData.period.in_(wanted)
+    ).subquery()
+    
+    # Il mese precedente conta solo se è davvero quello adiacente
+    has_previous = lagged.c.prev_period == lagged.c.period - 1
+    
+    rows = db.session.execute(
+        select(
+            User.id.label('user_id'),
+            lagged.c.period,
+            lagged.c.year,
+            lagged.c.month,
+            has_previous.label('has_previous'),
+            *[lagged.c[metric] for metric in SUMMARY_METRICS],
+            *[percent_change(lagged.c[metric], lagged.c[f'prev_{metric}']).label(f'change_{metric}')
+              for metric in SUMMARY_CHANGE_METRICS]
+        )
+        .select_from(User)
+        .outerjoin(lagged, lagged.c.period.in_(periods))
+        .where(User.id == user_id)
+        .order_by(lagged.c.period)
+    ).all()
+    
+    if not rows:
+        return None
+    
+    summaries = {}
+    for row in rows:
+        if row.period is None:
+            continue
+        summary = {
+            'year': row.year,
+            'month': row.month,
+            'has_data': True
+        }
+        for metric in SUMMARY_METRICS:
+            summary[metric] = money(metric, row._mapping[metric])
+        summary['changes'] = {}
+        if row.has_previous:
+            summary['changes'] = {
+                metric: row._mapping[f'change_{metric}'] for metric in SUMMARY_CHANGE_METRICS
+            }
+        summaries[row.period] = summary
+    
+    return summaries
+
+def money(metric, value):
+    """Totale in euro per la risposta: gli importi sono salvati in centesimi, il margine no"""
+    if metric == 'margine_percentuale':
+        return float(value or 0)
+    return from_cents(value)
+
+def empty_summary(period):
+    """Risposta per un mese senza dati"""
+    year, month = month_from_ordinal(period)
+    return {
+        'message': 'Nessun dato disponibile per il periodo specificato',
+        'year': year,
+        'month': month,
+        'has_data': False
+    }
+
+def get_trend_statistics(user_id, start_period, end_period):
+    """Calcola le statistiche del periodo con un'unica query aggregata.
+    
+    start_period ed end_period sono inclusi e vanno espressi con month_ordinal,
+    così il filtro usa l'indice (user_id, period).
+    Totali, margine medio, mese migliore e peggiore sono calcolati dal database,
+    quindi la memoria usata non dipende dalla lunghezza dello storico.
+    """
+    ranked = select(
+        FinancialData.year,
+        FinancialData.month,
+        FinancialData.ricavi_totali,
+        FinancialData.totale_costi,
+        FinancialData.utile_netto,
+        FinancialData.margine_percentuale,
+        func.row_number().over(
+            order_by=(FinancialData.utile_netto.desc(), FinancialData.year, FinancialData.month)
+        ).label('best_rank'),
+        func.row_number().over(
+            order_by=(FinancialData.utile_netto.asc(), FinancialData.year, FinancialData.month)
+        ).label('worst_rank')
+    ).where(
+        FinancialData.user_id == user_id,
+        FinancialData.period.between(start_period, end_period)
+    ).subquery()
+    
+    def value_at(rank, column):
+        return func.max(case((rank == 1, column)))
+    
+    row = db.session.execute(select(
+        func.count(),
+        func.sum(ranked.c.ricavi_totali),
+        func.sum(ranked.c.totale_costi),
+        func.sum(ranked.c.utile_netto),
+        func.avg(ranked.c.margine_percentuale),
+        value_at(ranked.c.best_rank, ranked.c.year),
+        value_at(ranked.c.best_rank, ranked.c.month),
+        value_at(ranked.c.best_rank, ranked.c.utile_netto),
+        value_at(ranked.c.worst_rank, ranked.c.year),
+        value_at(ranked.c.worst_rank, ranked.c.month),
+        value_at(ranked.c.worst_rank, ranked.c.utile_netto)
+    )).one()
+    
+    (months_count, total_ricavi, total_costi, total_utile, avg_margine,
+     best_year, best_month, best_utile, worst_year, worst_month, worst_utile) = row
+    
+    if not months_count:
+        return {
+            'total_ricavi': 0,
+            'total_costi': 0,
+            'total_utile': 0,
+            'avg_margine': 0,
+            'best_month': None,
+            'worst_month': None,
+            'months_count': 0
+        }
+    
+    return {
+        'total_ricavi': from_cents(total_ricavi),
+        'total_costi': from_cents(total_costi),
+        'total_utile': from_cents(total_utile),
+        'avg_margine': round(float(avg_margine or 0), 2),
+        'best_month': {
+            'year': best_year,
+            'month': best_month,
+            'utile_netto': from_cents(best_utile)
+        },
+        'worst_month': {
+            'year': worst_year,
+            'month': worst_month,
+            'utile_netto': from_cents(worst_utile)
+        },
+        'months_count': months_count
+    }
+
 @dashboard_bp.route('/dashboard/summary', methods=['GET'])
 @jwt_required()
+@etag_validated
+@dashboard_cache.cached('summary')
 def get_dashboard_summary():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         
-        if not user:
-            return jsonify({'error': 'Utente non trovato'}), 404
+        # Più mesi in una sola richiesta: ?periods=2024-01,2024-02
+        periods_param = request.args.get('periods')
+        if periods_param:
+            periods = [parse_period(value.strip()) for value in periods_param.split(',') if value.strip()]
+            if not periods or None in periods:
+                return jsonify({'error': 'Periodi non validi (formato YYYY-MM)'}), 400
+            if len(periods) > MAX_SUMMARY_PERIODS:
+                return jsonify({'error': f'Massimo {MAX_SUMMARY_PERIODS} periodi per richiesta'}), 400
+            
+            summaries = get_period_summaries(user_id, periods)
+            if summaries is None:
+                return jsonify({'error': 'Utente non trovato'}), 404
+            
+            return jsonify({
+                'summaries': [summaries.get(period) or empty_summary(period) for period in periods]
+            }), 200
         
         # Parametri opzionali
         year = request.args.get('year', type=int)
@@ -26,69 +217,24 @@ def get_dashboard_summary():
             year = year or current_date.year
             month = month or current_date.month
         
-        # Trova i dati per il mese specificato
-        current_data = FinancialData.query.filter_by(
-            user_id=user_id,
-            year=year,
-            month=month
-        ).first()
-        
-        if not current_data:
-            return jsonify({
-                'message': 'Nessun dato disponibile per il periodo specificato',
-                'year': year,
-                'month': month,
-                'has_data': False
-            }), 200
-        
-        # Calcola il mese precedente per il confronto
-        prev_month = month - 1
-        prev_year = year
-        if prev_month == 0:
-            prev_month = 12
-            prev_year = year - 1
+        period = month_ordinal(year, month)
+        summaries = get_period_summaries(user_id, [period])
         
-        prev_data = FinancialData.query.filter_by(
-            user_id=user_id,
-            year=prev_year,
-            month=prev_month
-        ).first()
-        
-        # Calcola le variazioni percentuali
-        def calculate_change(current, previous):
-            if not previous or previous == 0:
-                return None
-            return ((current - previous) / previous) * 100
-        
-        summary = {
-            'year': year,
-            'month': month,
-            'has_data': True,
-            'ricavi_totali': current_data.ricavi_totali,
-            'costi_fissi': current_data.costi_fissi,
-            'costi_variabili': current_data.costi_variabili,
-            'totale_costi': current_data.totale_costi,
-            'utile_netto': current_data.utile_netto,
-            'margine_percentuale': current_data.margine_percentuale,
-            'changes': {}
-        }
+        if summaries is None:
+            return jsonify({'error': 'Utente non trovato'}), 404
         
-        if prev_data:
-            summary['changes'] = {
-                'ricavi_totali': calculate_change(current_data.ricavi_totali, prev_data.ricavi_totali),
-                'costi_fissi': calculate_change(current_data.costi_fissi, prev_data.costi_fissi),
-                'costi_variabili': calculate_change(current_data.costi_variabili, prev_data.costi_variabili),
-                'utile_netto': calculate_change(current_data.utile_netto, prev_data.utile_netto),
-                'margine_percentuale': calculate_change(current_data.margine_percentuale, prev_data.margine_percentuale)
-            }
+        if period not in summaries:
+            return jsonify(empty_summary(period)), 200
         
-        return jsonify(summary), 200
+        return jsonify(summaries[period]), 200
         
     except Exception as e:
         return jsonify({'error': 'Errore interno del server'}), 500
 
 @dashboard_bp.route('/dashboard/charts', methods=['GET'])
 @jwt_required()
+@etag_validated
+@dashboard_cache.cached('charts')
 def get_dashboard_charts():
     try:
         user_id = get_jwt_identity()
@@ -116,41 +262,43 @@ def get_dashboard_charts():
         
         ricavi_vs_costi = None
         if current_data:
+            # Tutti float in euro: le voci grezze sono centesimi interi nel modello
+            values = compute_month(current_data)
             ricavi_vs_costi = {
-                'ricavi_servizi': current_data.ricavi_servizi,
-                'ricavi_prodotti': current_data.ricavi_prodotti,
-                'altri_ricavi': current_data.altri_ricavi,
-                'costi_fissi': current_data.costi_fissi,
-                'costi_variabili': current_data.costi_variabili,
-                'utile_netto': current_data.utile_netto
+                'ricavi_servizi': values['ricavi_servizi'],
+                'ricavi_prodotti': values['ricavi_prodotti'],
+                'altri_ricavi': values['altri_ricavi'],
+                'costi_fissi': values['costi_fissi'],
+                'costi_variabili': values['costi_variabili'],
+                'utile_netto': values['utile_netto']
             }
         
-        # Dati per l'andamento mensile (ultimi 12 mesi)
-        end_date = datetime(year, month, 1)
-        start_date = end_date - timedelta(days=365)
-        
-        monthly_data = FinancialData.query.filter(
-            and_(
+        # Dati per l'andamento mensile (ultimi 12 mesi): un'unica scansione
+        # dell'indice (user_id, period), senza filtri successivi in Python
+        end_period = month_ordinal(year, month)
+        monthly_data = db.session.execute(
+            select(
+                FinancialData.year,
+                FinancialData.month,
+                FinancialData.ricavi_totali,
+                FinancialData.totale_costi,
+                FinancialData.utile_netto,
+                FinancialData.margine_percentuale
+            ).where(
                 FinancialData.user_id == user_id,
-                FinancialData.year >= start_date.year,
-                FinancialData.year <= end_date.year
-            )
-        ).order_by(FinancialData.year.asc(), FinancialData.month.asc()).all()
-        
-        # Filtra per gli ultimi 12 mesi
-        monthly_trend = []
-        for data in monthly_data:
-            data_date = datetime(data.year, data.month, 1)
-            if start_date <= data_date <= end_date:
-                monthly_trend.append({
-                    'year': data.year,
-                    'month': data.month,
-                    'month_name': data_date.strftime('%b %Y'),
-                    'ricavi_totali': data.ricavi_totali,
-                    'totale_costi': data.totale_costi,
-                    'utile_netto': data.utile_netto,
-                    'margine_percentuale': data.margine_percentuale
-                })
+                FinancialData.period.between(end_period - 12, end_period)
+            ).order_by(FinancialData.period.asc())
+        ).all()
+        
+        monthly_trend = [{
+            'year': data.year,
+            'month': data.month,
+            'month_name': f'{calendar.month_abbr[data.month]} {data.year}',
+            'ricavi_totali': from_cents(data.ricavi_totali),
+            'totale_costi': from_cents(data.totale_costi),
+            'utile_netto': from_cents(data.utile_netto),
+            'margine_percentuale': float(data.margine_percentuale or 0)
+        } for data in monthly_data]
         
         return jsonify({
             'ricavi_vs_costi': ricavi_vs_costi,
@@ -166,6 +314,8 @@ def get_dashboard_charts():
 
 @dashboard_bp.route('/dashboard/trends', methods=['GET'])
 @jwt_required()
+@etag_validated
+@dashboard_cache.cached('trends')
 def get_dashboard_trends():
     try:
         user_id = get_jwt_identity()
@@ -181,56 +331,15 @@ def get_dashboard_trends():
         if user.subscription_plan == 'free':
             months = min(months, 3)
         
-        # Calcola la data di inizio
+        if months < 1:
+            return jsonify({'error': 'Il numero di mesi deve essere almeno 1'}), 400
+        
+        # Finestra esatta: gli ultimi `months` mesi fino al mese corrente incluso
         current_date = datetime.now()
-        start_date = current_date - timedelta(days=months * 30)
+        end_period = month_ordinal(current_date.year, current_date.month)
+        start_period = end_period - months + 1
         
-        # Recupera i dati del periodo
-        trends_data = FinancialData.query.filter(
-            and_(
-                FinancialData.user_id == user_id,
-                FinancialData.year >= start_date.year
-            )
-        ).order_by(FinancialData.year.asc(), FinancialData.month.asc()).all()
-        
-        # Calcola statistiche aggregate
-        if trends_data:
-            total_ricavi = sum(data.ricavi_totali for data in trends_data)
-            total_costi = sum(data.totale_costi for data in trends_data)
-            total_utile = sum(data.utile_netto for data in trends_data)
-            avg_margine = sum(data.margine_percentuale for data in trends_data) / len(trends_data)
-            
-            # Trova il mese migliore e peggiore
-            best_month = max(trends_data, key=lambda x: x.utile_netto)
-            worst_month = min(trends_data, key=lambda x: x.utile_netto)
-            
-            statistics = {
-                'total_ricavi': total_ricavi,
-                'total_costi': total_costi,
-                'total_utile': total_utile,
-                'avg_margine': round(avg_margine, 2),
-                'best_month': {
-                    'year': best_month.year,
-                    'month': best_month.month,
-                    'utile_netto': best_month.utile_netto
-                },
-                'worst_month': {
-                    'year': worst_month.year,
-                    'month': worst_month.month,
-                    'utile_netto': worst_month.utile_netto
-                },
-                'months_count': len(trends_data)
-            }
-        else:
-            statistics = {
-                'total_ricavi': 0,
-                'total_costi': 0,
-                'total_utile': 0,
-                'avg_margine': 0,
-                'best_month': None,
-                'worst_month': None,
-                'months_count': 0
-            }
+        statistics = get_trend_statistics(user_id, start_period, end_period)
         
         return jsonify({
             'statistics': statistics,
@@ -1,6 +1,17 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, Response, jsonify, make_response, request, send_file, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from src.models.user import User, FinancialData
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from sqlalchemy import select
+from src.models.user import (
+    db, User, FinancialData, OutboxEmail, COSTI_VARIABILI_COLUMNS, COSTI_FISSI_COLUMNS,
+    month_ordinal, month_from_ordinal, parse_period, format_period
+)
+from src.services.etag import etag_validated, profile_validator
+from src.services.rendering import render_service, RenderQueueFull
+from src.services.report_cache import report_cache
+from src.services.mailer import mailer
+from src.services.pnl import compute_month, compute_pnl, to_columns, to_euros
+from src.routes.financial import FINANCIAL_FIELDS, STREAM_BATCH_SIZE, serialize_field
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -10,18 +21,135 @@ from reportlab.graphics.shapes import Drawing
 from reportlab.graphics.charts.barcharts import VerticalBarChart
 from reportlab.graphics.charts.piecharts import Pie
 from reportlab.lib.colors import HexColor
+from openpyxl import Workbook
+import csv
 import io
 import os
+import numpy as np
 import tempfile
+from concurrent.futures import TimeoutError as RenderTimeout
 from datetime import datetime
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
+from types import SimpleNamespace
 
 export_bp = Blueprint('export', __name__)
 
+# Da incrementare a ogni modifica del layout: invalida i PDF in cache
+REPORT_TEMPLATE_VERSION = 1
+
+# Ampiezza massima di un report per periodo
+MAX_REPORT_MONTHS = 36
+
+# Colonne dell'export CSV/XLSX dello storico
+SPREADSHEET_FIELDS = ['year', 'month'] + FINANCIAL_FIELDS + [
+    'ricavi_totali', 'costi_variabili', 'costi_fissi', 'totale_costi', 'utile_netto', 'margine_percentuale',
+    'updated_at'
+]
+
+# Byte accumulati prima di inviare un blocco della risposta in streaming
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Stili costruiti una sola volta per processo e riusati da ogni report
+STYLES = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=STYLES['Heading1'],
+    fontSize=24,
+    spaceAfter=30,
+    textColor=colors.HexColor('#1f2937'),
+    alignment=1  # Center
+)
+
+SUBTITLE_STYLE = ParagraphStyle(
+    'CustomSubtitle',
+    parent=STYLES['Heading2'],
+    fontSize=16,
+    spaceAfter=20,
+    textColor=colors.HexColor('#374151')
+)
+
+NORMAL_STYLE = ParagraphStyle(
+    'CustomNormal',
+    parent=STYLES['Normal'],
+    fontSize=12,
+    spaceAfter=12
+)
+
+FOOTER_STYLE = ParagraphStyle(
+    'Footer',
+    parent=STYLES['Normal'],
+    fontSize=8,
+    textColor=colors.HexColor('#6b7280'),
+    alignment=1
+)
+
+COMPANY_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+RICAVI_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
+    ('TEXTCOLOR', (0, -1), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+COSTI_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ef4444')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('BACKGROUND', (0, 3), (-1, 3), colors.HexColor('#fee2e2')),
+    ('BACKGROUND', (0, 11), (-1, 11), colors.HexColor('#fee2e2')),
+    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#fecaca')),
+    ('TEXTCOLOR', (0, -1), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, 3), (-1, 3), 'Helvetica-Bold'),
+    ('FONTNAME', (0, 11), (-1, 11), 'Helvetica-Bold'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('SPAN', (0, 4), (-1, 4)),  # Riga vuota
+])
+
+RIEPILOGO_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10b981')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('BACKGROUND', (0, -2), (-1, -1), colors.HexColor('#d1fae5')),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, -2), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+PERIOD_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+PIE_COLORS = [
+    HexColor('#ef4444'), HexColor('#f97316'), HexColor('#f59e0b'), HexColor('#84cc16'),
+    HexColor('#10b981'), HexColor('#06b6d4'), HexColor('#3b82f6'), HexColor('#8b5cf6')
+]
+
 def create_financial_pdf(user, financial_data, month, year):
     """Crea un PDF con i dati finanziari dell'utente"""
     
@@ -31,42 +159,16 @@ def create_financial_pdf(user, financial_data, month, year):
     # Crea il documento PDF
     doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*inch)
     
-    # Stili
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        textColor=colors.HexColor('#1f2937'),
-        alignment=1  # Center
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=20,
-        textColor=colors.HexColor('#374151')
-    )
-    
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12
-    )
-    
     # Contenuto del PDF
     story = []
     
     # Titolo
-    story.append(Paragraph("Conto Economico AI", title_style))
-    story.append(Paragraph(f"Report Mensile - {month}/{year}", subtitle_style))
+    story.append(Paragraph("Conto Economico AI", TITLE_STYLE))
+    story.append(Paragraph(f"Report Mensile - {month}/{year}", SUBTITLE_STYLE))
     story.append(Spacer(1, 20))
     
     # Informazioni azienda
-    story.append(Paragraph("Informazioni Azienda", subtitle_style))
+    story.append(Paragraph("Informazioni Azienda", SUBTITLE_STYLE))
     company_data = [
         ['Nome Azienda:', user.business_name or 'N/A'],
         ['Tipo Attività:', user.business_type or 'N/A'],
@@ -76,96 +178,63 @@ def create_financial_pdf(user, financial_data, month, year):
     ]
     
     company_table = Table(company_data, colWidths=[2*inch, 3*inch])
-    company_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
+    company_table.setStyle(COMPANY_TABLE_STYLE)
     
     story.append(company_table)
     story.append(Spacer(1, 30))
     
     if financial_data:
         # Calcoli
-        ricavi_totali = (financial_data.ricavi_servizi or 0) + (financial_data.ricavi_prodotti or 0) + (financial_data.altri_ricavi or 0)
-        costi_variabili = (financial_data.costo_merci or 0) + (financial_data.provvigioni or 0) + (financial_data.marketing_variabile or 0)
-        costi_fissi = (financial_data.affitto or 0) + (financial_data.stipendi or 0) + (financial_data.utenze or 0) + (financial_data.marketing_fisso or 0) + (financial_data.altri_costi_fissi or 0)
-        totale_costi = costi_variabili + costi_fissi
-        utile_netto = ricavi_totali - totale_costi
-        margine_percentuale = (utile_netto / ricavi_totali * 100) if ricavi_totali > 0 else 0
+        values = compute_month(financial_data)
+        ricavi_totali = values['ricavi_totali']
+        costi_variabili = values['costi_variabili']
+        costi_fissi = values['costi_fissi']
+        totale_costi = values['totale_costi']
+        utile_netto = values['utile_netto']
+        margine_percentuale = values['margine_percentuale']
         
         # Tabella Ricavi
-        story.append(Paragraph("Ricavi", subtitle_style))
+        story.append(Paragraph("Ricavi", SUBTITLE_STYLE))
         ricavi_data = [
             ['Voce', 'Importo (€)'],
-            ['Ricavi Servizi', f"{financial_data.ricavi_servizi or 0:,.2f}"],
-            ['Ricavi Prodotti', f"{financial_data.ricavi_prodotti or 0:,.2f}"],
-            ['Altri Ricavi', f"{financial_data.altri_ricavi or 0:,.2f}"],
+            ['Ricavi Servizi', f"{values['ricavi_servizi']:,.2f}"],
+            ['Ricavi Prodotti', f"{values['ricavi_prodotti']:,.2f}"],
+            ['Altri Ricavi', f"{values['altri_ricavi']:,.2f}"],
             ['TOTALE RICAVI', f"{ricavi_totali:,.2f}"]
         ]
         
         ricavi_table = Table(ricavi_data, colWidths=[3*inch, 2*inch])
-        ricavi_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
-            ('TEXTCOLOR', (0, -1), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        ricavi_table.setStyle(RICAVI_TABLE_STYLE)
         
         story.append(ricavi_table)
         story.append(Spacer(1, 20))
         
         # Tabella Costi
-        story.append(Paragraph("Costi", subtitle_style))
+        story.append(Paragraph("Costi", SUBTITLE_STYLE))
         costi_data = [
             ['Voce', 'Importo (€)'],
-            ['Costo Merci', f"{financial_data.costo_merci or 0:,.2f}"],
-            ['Provvigioni', f"{financial_data.provvigioni or 0:,.2f}"],
-            ['Marketing Variabile', f"{financial_data.marketing_variabile or 0:,.2f}"],
+            ['Costo Merci', f"{values['costo_merci']:,.2f}"],
+            ['Provvigioni', f"{values['provvigioni']:,.2f}"],
+            ['Marketing Variabile', f"{values['marketing_variabile']:,.2f}"],
             ['Subtotale Costi Variabili', f"{costi_variabili:,.2f}"],
             ['', ''],
-            ['Affitto', f"{financial_data.affitto or 0:,.2f}"],
-            ['Stipendi', f"{financial_data.stipendi or 0:,.2f}"],
-            ['Utenze', f"{financial_data.utenze or 0:,.2f}"],
-            ['Marketing Fisso', f"{financial_data.marketing_fisso or 0:,.2f}"],
-            ['Altri Costi Fissi', f"{financial_data.altri_costi_fissi or 0:,.2f}"],
+            ['Affitto', f"{values['affitto']:,.2f}"],
+            ['Stipendi', f"{values['stipendi']:,.2f}"],
+            ['Utenze', f"{values['utenze']:,.2f}"],
+            ['Marketing Fisso', f"{values['marketing_fisso']:,.2f}"],
+            ['Altri Costi Fissi', f"{values['altri_costi_fissi']:,.2f}"],
             ['Subtotale Costi Fissi', f"{costi_fissi:,.2f}"],
             ['TOTALE COSTI', f"{totale_costi:,.2f}"]
         ]
         
         costi_table = Table(costi_data, colWidths=[3*inch, 2*inch])
-        costi_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ef4444')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('BACKGROUND', (0, 3), (-1, 3), colors.HexColor('#fee2e2')),
-            ('BACKGROUND', (0, 11), (-1, 11), colors.HexColor('#fee2e2')),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#fecaca')),
-            ('TEXTCOLOR', (0, -1), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, 3), (-1, 3), 'Helvetica-Bold'),
-            ('FONTNAME', (0, 11), (-1, 11), 'Helvetica-Bold'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('SPAN', (0, 4), (-1, 4)),  # Riga vuota
-        ]))
+        costi_table.setStyle(COSTI_TABLE_STYLE)
         
         story.append(costi_table)
         story.append(Spacer(1, 30))
         
         # Riepilogo Finale
-        story.append(Paragraph("Riepilogo Finale", subtitle_style))
+        story.append(Paragraph("Riepilogo Finale", SUBTITLE_STYLE))
         riepilogo_data = [
             ['Indicatore', 'Valore'],
             ['Ricavi Totali', f"{ricavi_totali:,.2f} €"],
@@ -175,33 +244,17 @@ def create_financial_pdf(user, financial_data, month, year):
         ]
         
         riepilogo_table = Table(riepilogo_data, colWidths=[3*inch, 2*inch])
-        riepilogo_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10b981')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('BACKGROUND', (0, -2), (-1, -1), colors.HexColor('#d1fae5')),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, -2), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        riepilogo_table.setStyle(RIEPILOGO_TABLE_STYLE)
         
         story.append(riepilogo_table)
         
     else:
-        story.append(Paragraph("Nessun dato finanziario disponibile per il periodo selezionato.", normal_style))
+        story.append(Paragraph("Nessun dato finanziario disponibile per il periodo selezionato.", NORMAL_STYLE))
     
     # Footer
     story.append(Spacer(1, 50))
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.HexColor('#6b7280'),
-        alignment=1
-    )
-    story.append(Paragraph("Report generato da Conto Economico AI", footer_style))
-    story.append(Paragraph(f"Data generazione: {datetime.now().strftime('%d/%m/%Y %H:%M')}", footer_style))
+    story.append(Paragraph("Report generato da Conto Economico AI", FOOTER_STYLE))
+    story.append(Paragraph(f"Data generazione: {datetime.now().strftime('%d/%m/%Y %H:%M')}", FOOTER_STYLE))
     
     # Costruisci il PDF
     doc.build(story)
@@ -210,64 +263,342 @@ def create_financial_pdf(user, financial_data, month, year):
     buffer.seek(0)
     return buffer
 
-def send_email_with_pdf(user_email, pdf_buffer, month, year):
-    """Invia email con PDF allegato"""
+def create_period_pdf(user, rows, start_period, end_period):
+    """Crea un PDF con l'andamento di più mesi (report annuale o intervallo libero).
+
+    rows sono i dizionari di get_period_rows, uno per mese con dati, già
+    ordinati per periodo. Le metriche derivate sono calcolate per colonna.
+    """
     
-    # Configurazione email (da configurare con credenziali reali)
-    smtp_server = "smtp.gmail.com"
-    smtp_port = 587
-    sender_email = "noreply@contoeconomicoai.com"  # Da configurare
-    sender_password = "your_app_password"  # Da configurare
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*inch)
+    story = []
     
-    try:
-        # Crea il messaggio
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = user_email
-        msg['Subject'] = f"Report Mensile Conto Economico AI - {month}/{year}"
-        
-        # Corpo dell'email
-        body = f"""
-        Ciao,
-        
-        In allegato trovi il report mensile del tuo conto economico per {month}/{year}.
-        
-        Il report include:
-        - Riepilogo ricavi e costi
-        - Calcolo dell'utile netto
-        - Analisi del margine percentuale
-        
-        Grazie per aver scelto Conto Economico AI!
-        
-        Il team di Conto Economico AI
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Allega il PDF
-        pdf_buffer.seek(0)
-        part = MIMEBase('application', 'octet-stream')
-        part.set_payload(pdf_buffer.read())
-        encoders.encode_base64(part)
-        part.add_header(
-            'Content-Disposition',
-            f'attachment; filename="report_mensile_{month}_{year}.pdf"'
-        )
-        msg.attach(part)
+    start_label = format_period(start_period)
+    end_label = format_period(end_period)
+    
+    # Titolo
+    story.append(Paragraph("Conto Economico AI", TITLE_STYLE))
+    story.append(Paragraph(f"Report Periodo - {start_label} / {end_label}", SUBTITLE_STYLE))
+    story.append(Spacer(1, 20))
+    
+    # Informazioni azienda
+    story.append(Paragraph("Informazioni Azienda", SUBTITLE_STYLE))
+    company_table = Table([
+        ['Nome Azienda:', user.business_name or 'N/A'],
+        ['Tipo Attività:', user.business_type or 'N/A'],
+        ['Proprietario:', f"{user.first_name} {user.last_name}"],
+        ['Email:', user.email],
+        ['Data Report:', datetime.now().strftime('%d/%m/%Y')]
+    ], colWidths=[2*inch, 3*inch])
+    company_table.setStyle(COMPANY_TABLE_STYLE)
+    story.append(company_table)
+    story.append(Spacer(1, 30))
+    
+    if rows:
+        metrics = period_metrics(rows)
+        columns = metrics['columns']
+        totals = metrics['totals']
+        
+        # Tabella per mese con utile cumulato dall'inizio dell'anno
+        story.append(Paragraph("Andamento Mensile", SUBTITLE_STYLE))
+        monthly_data = [['Mese', 'Ricavi (€)', 'Costi (€)', 'Utile (€)', 'Margine %', 'Utile YTD (€)']]
+        for index, period in enumerate(columns['period']):
+            monthly_data.append([
+                format_period(period),
+                f"{columns['ricavi_totali'][index]:,.2f}",
+                f"{columns['totale_costi'][index]:,.2f}",
+                f"{columns['utile_netto'][index]:,.2f}",
+                f"{columns['margine_percentuale'][index]:.2f}%",
+                f"{columns['utile_ytd'][index]:,.2f}"
+            ])
+        monthly_data.append([
+            'TOTALE',
+            f"{totals['ricavi_totali']:,.2f}",
+            f"{totals['totale_costi']:,.2f}",
+            f"{totals['utile_netto']:,.2f}",
+            f"{totals['margine_percentuale']:.2f}%",
+            ''
+        ])
+        
+        monthly_table = Table(monthly_data, colWidths=[0.9*inch] + [1.07*inch] * 5, repeatRows=1)
+        monthly_table.setStyle(PERIOD_TABLE_STYLE)
+        story.append(monthly_table)
+        story.append(Spacer(1, 30))
         
-        # Invia l'email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, user_email, text)
-        server.quit()
+        # Ricavi e costi per mese
+        story.append(Paragraph("Ricavi e Costi", SUBTITLE_STYLE))
+        story.append(period_bar_chart(columns))
+        story.append(Spacer(1, 20))
         
-        return True
+        # Composizione dei costi del periodo
+        cost_items = [(field, totals[field]) for field in COSTI_VARIABILI_COLUMNS + COSTI_FISSI_COLUMNS if totals[field] > 0]
+        if cost_items:
+            story.append(Paragraph("Composizione dei Costi", SUBTITLE_STYLE))
+            story.append(cost_pie_chart(cost_items))
+            story.append(Spacer(1, 20))
         
-    except Exception as e:
-        print(f"Errore nell'invio email: {str(e)}")
-        return False
+        # Riepilogo del periodo
+        story.append(Paragraph("Riepilogo del Periodo", SUBTITLE_STYLE))
+        riepilogo_table = Table([
+            ['Indicatore', 'Valore'],
+            ['Mesi con dati', str(len(rows))],
+            ['Ricavi Totali', f"{totals['ricavi_totali']:,.2f} €"],
+            ['Costi Totali', f"{totals['totale_costi']:,.2f} €"],
+            ['Utile Netto', f"{totals['utile_netto']:,.2f} €"],
+            ['Margine %', f"{totals['margine_percentuale']:.2f}%"]
+        ], colWidths=[3*inch, 2*inch])
+        riepilogo_table.setStyle(RIEPILOGO_TABLE_STYLE)
+        story.append(riepilogo_table)
+        
+    else:
+        story.append(Paragraph("Nessun dato finanziario disponibile per il periodo selezionato.", NORMAL_STYLE))
+    
+    # Footer
+    story.append(Spacer(1, 50))
+    story.append(Paragraph("Report generato da Conto Economico AI", FOOTER_STYLE))
+    story.append(Paragraph(f"Data generazione: {datetime.now().strftime('%d/%m/%Y %H:%M')}", FOOTER_STYLE))
+    
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+def period_metrics(rows):
+    """Metriche del report per periodo, calcolate per colonna dal motore del conto economico"""
+    inputs = to_columns(rows)
+    metrics = compute_pnl(inputs)
+    periods = np.array([row['period'] for row in rows], dtype=np.int64)
+    
+    # Utile cumulato, azzerato a ogni cambio di anno
+    utile = metrics['utile_netto']
+    years = (periods - 1) // 12
+    year_start = np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+    cumulative = np.cumsum(utile)
+    offsets = np.repeat(cumulative[year_start] - utile[year_start], np.diff(np.r_[year_start, len(utile)]))
+    
+    # Somme in centesimi interi, esatte; la conversione in euro avviene solo qui
+    metrics['utile_ytd'] = cumulative - offsets
+    columns = {name: values.tolist() for name, values in to_euros(metrics).items()}
+    columns['period'] = periods.tolist()
+    
+    # Totali del periodo: stesse formule applicate alla somma delle voci
+    totals = compute_month({field: values.sum() for field, values in inputs.items()})
+    return {'columns': columns, 'totals': totals}
+
+def period_bar_chart(columns):
+    """Grafico a barre di ricavi e costi per mese"""
+    drawing = Drawing(450, 200)
+    chart = VerticalBarChart()
+    chart.x = 40
+    chart.y = 30
+    chart.width = 400
+    chart.height = 150
+    chart.data = [columns['ricavi_totali'], columns['totale_costi']]
+    chart.categoryAxis.categoryNames = [format_period(period)[2:] for period in columns['period']]
+    chart.categoryAxis.labels.fontSize = 7
+    chart.categoryAxis.labels.angle = 45 if len(columns['period']) > 12 else 0
+    chart.categoryAxis.labels.boxAnchor = 'ne' if len(columns['period']) > 12 else 'n'
+    chart.valueAxis.valueMin = min(0, min(columns['ricavi_totali'] + columns['totale_costi']))
+    chart.valueAxis.labels.fontSize = 7
+    chart.bars[0].fillColor = HexColor('#3b82f6')
+    chart.bars[1].fillColor = HexColor('#ef4444')
+    drawing.add(chart)
+    return drawing
+
+def cost_pie_chart(cost_items):
+    """Grafico a torta della composizione dei costi del periodo"""
+    drawing = Drawing(450, 200)
+    pie = Pie()
+    pie.x = 150
+    pie.y = 20
+    pie.width = 160
+    pie.height = 160
+    pie.data = [value for _, value in cost_items]
+    pie.labels = [field.replace('_', ' ').title() for field, _ in cost_items]
+    pie.slices.fontSize = 7
+    for index in range(len(cost_items)):
+        pie.slices[index].fillColor = PIE_COLORS[index % len(PIE_COLORS)]
+    drawing.add(pie)
+    return drawing
+
+def get_period_rows(user_id, start_period, end_period):
+    """Righe dei mesi nell'intervallo con una sola query sull'indice (user_id, period)"""
+    columns = [FinancialData.period, FinancialData.updated_at] + [
+        getattr(FinancialData, field) for field in FINANCIAL_FIELDS
+    ]
+    result = db.session.execute(
+        select(*columns)
+        .where(
+            FinancialData.user_id == user_id,
+            FinancialData.period.between(start_period, end_period)
+        )
+        .order_by(FinancialData.period)
+    )
+    return [dict(row._mapping) for row in result]
+
+def report_context(user, financial_data=None):
+    """Copia in oggetti semplici (serializzabili) i dati usati dai report PDF"""
+    user_info = SimpleNamespace(
+        business_name=user.business_name,
+        business_type=user.business_type,
+        first_name=user.first_name,
+        last_name=user.last_name,
+        email=user.email
+    )
+    data_info = None
+    if financial_data:
+        data_info = SimpleNamespace(**{field: getattr(financial_data, field) for field in FINANCIAL_FIELDS})
+    return user_info, data_info
+
+def render_report(user_info, data_info, month, year):
+    """Eseguita nei processi del pool: restituisce i byte del PDF"""
+    return create_financial_pdf(user_info, data_info, month, year).getvalue()
+
+def render_period_report(user_info, rows, start_period, end_period):
+    """Eseguita nei processi del pool: restituisce i byte del PDF del periodo"""
+    return create_period_pdf(user_info, rows, start_period, end_period).getvalue()
+
+def report_cache_key(user, *parts):
+    """Chiave della cache dei PDF: cambia con i dati, il profilo o il template"""
+    return report_cache.make_key(
+        user.id, *parts, REPORT_TEMPLATE_VERSION,
+        user.business_name, user.business_type, user.first_name, user.last_name, user.email
+    )
+
+def monthly_cache_key(user, financial_data, month, year):
+    updated_at = financial_data.updated_at.isoformat() if financial_data and financial_data.updated_at else None
+    return report_cache_key(user, year, month, updated_at)
+
+def period_cache_key(user, rows, start_period, end_period):
+    # Il numero di righe cambia con le cancellazioni, max(updated_at) con le modifiche
+    updated_at = max((row['updated_at'] for row in rows if row['updated_at']), default=None)
+    return report_cache_key(
+        user, 'period', start_period, end_period, len(rows),
+        updated_at.isoformat() if updated_at else None
+    )
+
+def submit_render(user, cache_key, fn, *args, keep_result=False):
+    """Accoda un rendering nel pool di processi; il PDF finisce nella cache"""
+    return render_service.submit(
+        user.id, fn, *args,
+        keep_result=keep_result,
+        on_result=lambda content: report_cache.set(cache_key, content)
+    )
+
+def submit_report(user, financial_data, month, year, keep_result=False):
+    """Accoda il rendering del report mensile"""
+    user_info, data_info = report_context(user, financial_data)
+    return submit_render(
+        user, monthly_cache_key(user, financial_data, month, year),
+        render_report, user_info, data_info, month, year,
+        keep_result=keep_result
+    )
+
+def submit_period_report(user, rows, start_period, end_period, keep_result=False):
+    """Accoda il rendering del report per periodo"""
+    user_info, _ = report_context(user)
+    # updated_at serve solo alla chiave della cache
+    data = [{key: value for key, value in row.items() if key != 'updated_at'} for row in rows]
+    return submit_render(
+        user, period_cache_key(user, rows, start_period, end_period),
+        render_period_report, user_info, data, start_period, end_period,
+        keep_result=keep_result
+    )
+
+def get_report_pdf(user, financial_data, month, year):
+    """Byte del PDF: dalla cache se già generato, altrimenti dal pool di processi"""
+    content = report_cache.get(monthly_cache_key(user, financial_data, month, year))
+    if content is not None:
+        return content
+    
+    job_id = submit_report(user, financial_data, month, year)
+    return render_service.wait(job_id)
+
+def send_pdf(cache_key, download_name, submit):
+    """Risposta con il PDF, senza file temporanei.
+
+    Un report già in cache viene servito dal suo file (sendfile del server
+    WSGI), altrimenti dai byte in memoria prodotti dal job restituito da
+    submit(). L'ETag è la chiave della cache: per le richieste GET valgono
+    If-None-Match e Range.
+    """
+    # Il client ha già questa versione del report: nessun rendering
+    if request.method == 'GET' and request.if_none_match.contains(cache_key):
+        response = make_response('', 304)
+        response.set_etag(cache_key)
+        return response
+    
+    def respond(source):
+        try:
+            response = send_file(
+                source,
+                as_attachment=True,
+                download_name=download_name,
+                mimetype='application/pdf',
+                etag=cache_key,
+                conditional=True
+            )
+        except RequestedRangeNotSatisfiable as e:
+            # 416 con Content-Range: bytes */<dimensione>, non un errore del server
+            return e.get_response()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    path = report_cache.get_path(cache_key)
+    if path is not None:
+        try:
+            return respond(path)
+        except FileNotFoundError:
+            # Eliminato da un'eviction tra la lettura della cache e l'apertura
+            pass
+    
+    return respond(io.BytesIO(render_service.wait(submit())))
+
+def send_report(user, financial_data, month, year):
+    """Risposta con il PDF del report mensile"""
+    return send_pdf(
+        monthly_cache_key(user, financial_data, month, year),
+        f'report_mensile_{month}_{year}.pdf',
+        lambda: submit_report(user, financial_data, month, year)
+    )
+
+def send_period_report(user, rows, start_period, end_period):
+    """Risposta con il PDF del report per periodo"""
+    return send_pdf(
+        period_cache_key(user, rows, start_period, end_period),
+        f'report_{format_period(start_period)}_{format_period(end_period)}.pdf',
+        lambda: submit_period_report(user, rows, start_period, end_period)
+    )
+
+def send_email_with_pdf(user_email, pdf_buffer, month, year, user_id=None, commit=True):
+    """Accoda nella outbox l'email con il PDF allegato; l'invio avviene in background"""
+    
+    # Corpo dell'email
+    body = f"""
+    Ciao,
+    
+    In allegato trovi il report mensile del tuo conto economico per {month}/{year}.
+    
+    Il report include:
+    - Riepilogo ricavi e costi
+    - Calcolo dell'utile netto
+    - Analisi del margine percentuale
+    
+    Grazie per aver scelto Conto Economico AI!
+    
+    Il team di Conto Economico AI
+    """
+    
+    pdf_buffer.seek(0)
+    return mailer.enqueue(
+        user_email,
+        f"Report Mensile Conto Economico AI - {month}/{year}",
+        body,
+        attachment=pdf_buffer.read(),
+        attachment_name=f"report_mensile_{month}_{year}.pdf",
+        user_id=user_id,
+        commit=commit
+    )
 
 @export_bp.route('/generate-pdf', methods=['POST'])
 @jwt_required()
@@ -291,21 +622,135 @@ def generate_pdf():
             year=year
         ).first()
         
-        # Genera il PDF
-        pdf_buffer = create_financial_pdf(user, financial_data, month, year)
+        # Modalità asincrona: restituisce subito il job id da interrogare
+        if data.get('async'):
+            cached = report_cache.get(monthly_cache_key(user, financial_data, month, year))
+            if cached is not None:
+                job_id = render_service.store(user.id, cached)
+            else:
+                job_id = submit_report(user, financial_data, month, year, keep_result=True)
+            return jsonify({
+                'job_id': job_id,
+                'status_url': f'/api/export/jobs/{job_id}'
+            }), 202
+        
+        # PDF dalla cache o generato nel pool di processi
+        return send_report(user, financial_data, month, year)
+        
+    except RenderQueueFull:
+        return jsonify({'error': 'Troppi report in generazione, riprova tra poco'}), 503, {'Retry-After': '5'}
+    except RenderTimeout:
+        return jsonify({'error': 'Generazione del report troppo lenta, riprova più tardi'}), 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def resolve_report_period(data):
+    """Intervallo del report per periodo: anno intero ('year') oppure 'start'/'end' (YYYY-MM)"""
+    if data.get('start') or data.get('end'):
+        start_period = parse_period(data.get('start'))
+        end_period = parse_period(data.get('end'))
+        if start_period is None or end_period is None:
+            return None, None, 'start e end devono essere nel formato YYYY-MM'
+    else:
+        try:
+            year = int(data.get('year', datetime.now().year))
+        except (TypeError, ValueError):
+            return None, None, 'Anno non valido'
+        start_period, end_period = month_ordinal(year, 1), month_ordinal(year, 12)
+    
+    if end_period < start_period:
+        return None, None, 'end deve essere successivo a start'
+    if end_period - start_period + 1 > MAX_REPORT_MONTHS:
+        return None, None, f'Il report può coprire al massimo {MAX_REPORT_MONTHS} mesi'
+    return start_period, end_period, None
+
+@export_bp.route('/generate-period-pdf', methods=['POST'])
+@jwt_required()
+def generate_period_pdf():
+    """Genera PDF del report annuale o di un intervallo di mesi"""
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        if not user:
+            return jsonify({'error': 'Utente non trovato'}), 404
         
-        # Salva temporaneamente il file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_file.write(pdf_buffer.getvalue())
-        temp_file.close()
+        data = request.get_json() or {}
+        start_period, end_period, error = resolve_report_period(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Tutti i mesi dell'intervallo con una sola query
+        rows = get_period_rows(user.id, start_period, end_period)
+        
+        if data.get('async'):
+            cached = report_cache.get(period_cache_key(user, rows, start_period, end_period))
+            if cached is not None:
+                job_id = render_service.store(user.id, cached)
+            else:
+                job_id = submit_period_report(user, rows, start_period, end_period, keep_result=True)
+            return jsonify({
+                'job_id': job_id,
+                'status_url': f'/api/export/jobs/{job_id}'
+            }), 202
+        
+        return send_period_report(user, rows, start_period, end_period)
+        
+    except RenderQueueFull:
+        return jsonify({'error': 'Troppi report in generazione, riprova tra poco'}), 503, {'Retry-After': '5'}
+    except RenderTimeout:
+        return jsonify({'error': 'Generazione del report troppo lenta, riprova più tardi'}), 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@export_bp.route('/report/<int:year>', methods=['GET'])
+@jwt_required()
+def download_annual_report(year):
+    """Scarica il PDF del report annuale (con supporto a ETag e Range)"""
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
         
-        return send_file(
-            temp_file.name,
-            as_attachment=True,
-            download_name=f'report_mensile_{month}_{year}.pdf',
-            mimetype='application/pdf'
-        )
+        if not user:
+            return jsonify({'error': 'Utente non trovato'}), 404
+        
+        start_period, end_period = month_ordinal(year, 1), month_ordinal(year, 12)
+        rows = get_period_rows(user.id, start_period, end_period)
+        return send_period_report(user, rows, start_period, end_period)
+        
+    except RenderQueueFull:
+        return jsonify({'error': 'Troppi report in generazione, riprova tra poco'}), 503, {'Retry-After': '5'}
+    except RenderTimeout:
+        return jsonify({'error': 'Generazione del report troppo lenta, riprova più tardi'}), 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@export_bp.route('/report/<int:year>/<int:month>', methods=['GET'])
+@jwt_required()
+def download_report(year, month):
+    """Scarica il PDF del report mensile (con supporto a ETag e Range)"""
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
         
+        if not user:
+            return jsonify({'error': 'Utente non trovato'}), 404
+        
+        if month < 1 or month > 12:
+            return jsonify({'error': 'Mese non valido'}), 400
+        
+        financial_data = FinancialData.query.filter_by(
+            user_id=user_id,
+            month=month,
+            year=year
+        ).first()
+        
+        return send_report(user, financial_data, month, year)
+        
+    except RenderQueueFull:
+        return jsonify({'error': 'Troppi report in generazione, riprova tra poco'}), 503, {'Retry-After': '5'}
+    except RenderTimeout:
+        return jsonify({'error': 'Generazione del report troppo lenta, riprova più tardi'}), 504
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -336,22 +781,120 @@ def send_email():
             year=year
         ).first()
         
-        # Genera il PDF
-        pdf_buffer = create_financial_pdf(user, financial_data, month, year)
+        # PDF dalla cache o generato nel pool di processi
+        pdf_buffer = io.BytesIO(get_report_pdf(user, financial_data, month, year))
         
-        # Invia l'email
-        success = send_email_with_pdf(email, pdf_buffer, month, year)
-        
-        if success:
-            return jsonify({'message': 'Email inviata con successo'}), 200
-        else:
-            return jsonify({'error': 'Errore nell\'invio dell\'email'}), 500
+        # Accoda l'email: la consegna avviene in background con retry
+        message = send_email_with_pdf(email, pdf_buffer, month, year, user_id=user.id)
         
+        return jsonify({
+            'message': 'Email in coda di invio',
+            'email': message.to_dict()
+        }), 202
+        
+    except RenderQueueFull:
+        return jsonify({'error': 'Troppi report in generazione, riprova tra poco'}), 503, {'Retry-After': '5'}
+    except RenderTimeout:
+        return jsonify({'error': 'Generazione del report troppo lenta, riprova più tardi'}), 504
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@export_bp.route('/emails/<int:email_id>', methods=['GET'])
+@jwt_required()
+def get_email_status(email_id):
+    """Stato di consegna di un'email accodata"""
+    message = OutboxEmail.query.filter_by(id=email_id, user_id=get_jwt_identity()).first()
+    
+    if not message:
+        return jsonify({'error': 'Email non trovata'}), 404
+    
+    return jsonify(message.to_dict()), 200
+
+def spreadsheet_header():
+    return ['Anno', 'Mese'] + [field.replace('_', ' ').title() for field in SPREADSHEET_FIELDS[2:]]
+
+def spreadsheet_rows(user_id):
+    """Storico dell'utente letto a blocchi dal cursore, un mese alla volta"""
+    result = db.session.execute(
+        select(*(getattr(FinancialData, field) for field in SPREADSHEET_FIELDS))
+        .where(FinancialData.user_id == user_id)
+        .order_by(FinancialData.period)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    for row in result:
+        yield [serialize_field(field, value) for field, value in zip(SPREADSHEET_FIELDS, row)]
+
+def stream_csv(user_id):
+    """CSV scritto riga per riga e inviato a blocchi di STREAM_CHUNK_BYTES"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(spreadsheet_header())
+    
+    for row in spreadsheet_rows(user_id):
+        writer.writerow(row)
+        if buffer.tell() >= STREAM_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
+
+def stream_xlsx(user_id):
+    """XLSX in modalità write-only: le righe finiscono su disco, non in memoria.
+
+    Non è uno streaming vero: openpyxl scrive il foglio nel file zip solo al
+    salvataggio, dopo l'ultima riga. Il workbook viene quindi completato in un
+    file temporaneo anonimo (eliminato alla chiusura) e solo dopo inviato a
+    blocchi: il primo byte arriva a export finito. Per l'invio immediato c'è
+    il CSV (stream_csv).
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Conto Economico')
+    sheet.append(spreadsheet_header())
+    for row in spreadsheet_rows(user_id):
+        sheet.append(row)
+    
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+@export_bp.route('/csv', methods=['GET'])
+@jwt_required()
+@etag_validated
+def export_csv():
+    """Export CSV di tutto lo storico finanziario"""
+    user_id = get_jwt_identity()
+    return Response(
+        stream_with_context(stream_csv(user_id)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename="conto_economico.csv"'}
+    )
+
+@export_bp.route('/xlsx', methods=['GET'])
+@jwt_required()
+@etag_validated
+def export_xlsx():
+    """Export Excel di tutto lo storico finanziario.
+
+    A differenza di /csv la risposta non parte subito: il workbook viene
+    costruito per intero su disco e poi inviato (vedi stream_xlsx). Per
+    storici molto lunghi conviene l'export CSV, che invia le righe man mano.
+    """
+    user_id = get_jwt_identity()
+    return Response(
+        stream_with_context(stream_xlsx(user_id)),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': 'attachment; filename="conto_economico.xlsx"'}
+    )
+
 @export_bp.route('/preview-data', methods=['POST'])
 @jwt_required()
+@etag_validated(extra=profile_validator)
 def preview_data():
     """Anteprima dei dati per il PDF"""
     try:
@@ -375,13 +918,8 @@ def preview_data():
         if not financial_data:
             return jsonify({'error': 'Nessun dato disponibile per il periodo selezionato'}), 404
         
-        # Calcoli
-        ricavi_totali = (financial_data.ricavi_servizi or 0) + (financial_data.ricavi_prodotti or 0) + (financial_data.altri_ricavi or 0)
-        costi_variabili = (financial_data.costo_merci or 0) + (financial_data.provvigioni or 0) + (financial_data.marketing_variabile or 0)
-        costi_fissi = (financial_data.affitto or 0) + (financial_data.stipendi or 0) + (financial_data.utenze or 0) + (financial_data.marketing_fisso or 0) + (financial_data.altri_costi_fissi or 0)
-        totale_costi = costi_variabili + costi_fissi
-        utile_netto = ricavi_totali - totale_costi
-        margine_percentuale = (utile_netto / ricavi_totali * 100) if ricavi_totali > 0 else 0
+        # Voci e metriche come float, con le formule del motore condiviso
+        values = compute_month(financial_data)
         
         return jsonify({
             'user': {
@@ -394,27 +932,44 @@ def preview_data():
                 'month': month,
                 'year': year
             },
-            'data': {
-                'ricavi_servizi': financial_data.ricavi_servizi or 0,
-                'ricavi_prodotti': financial_data.ricavi_prodotti or 0,
-                'altri_ricavi': financial_data.altri_ricavi or 0,
-                'ricavi_totali': ricavi_totali,
-                'costo_merci': financial_data.costo_merci or 0,
-                'provvigioni': financial_data.provvigioni or 0,
-                'marketing_variabile': financial_data.marketing_variabile or 0,
-                'costi_variabili': costi_variabili,
-                'affitto': financial_data.affitto or 0,
-                'stipendi': financial_data.stipendi or 0,
-                'utenze': financial_data.utenze or 0,
-                'marketing_fisso': financial_data.marketing_fisso or 0,
-                'altri_costi_fissi': financial_data.altri_costi_fissi or 0,
-                'costi_fissi': costi_fissi,
-                'totale_costi': totale_costi,
-                'utile_netto': utile_netto,
-                'margine_percentuale': margine_percentuale
-            }
+            'data': values
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+@export_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_render_job(job_id):
+    """Stato di un report generato in modalità asincrona"""
+    job = render_service.get_job(job_id, get_jwt_identity())
+    
+    if not job:
+        return jsonify({'error': 'Job non trovato'}), 404
+    
+    job = {key: value for key, value in job.items() if key != 'owner'}
+    job['job_id'] = job_id
+    if job['status'] == 'done':
+        job['download_url'] = f'/api/export/jobs/{job_id}/pdf'
+    
+    return jsonify(job), 200
+
+@export_bp.route('/jobs/<job_id>/pdf', methods=['GET'])
+@jwt_required()
+def download_render_job(job_id):
+    """Scarica il PDF di un job asincrono completato"""
+    path = render_service.get_result_path(job_id, get_jwt_identity())
+    
+    if not path:
+        return jsonify({'error': 'Report non disponibile'}), 404
+    
+    response = send_file(
+        path,
+        as_attachment=True,
+        download_name='report_mensile.pdf',
+        mimetype='application/pdf',
+        conditional=True
+    )
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
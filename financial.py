@@ -1,11 +1,92 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from src.models.user import User, FinancialData, db
+from src.models.user import (
+    User, FinancialData, db, MAX_AMOUNT_CENTS, TOTAL_COLUMNS, from_cents, to_cents,
+    month_ordinal, parse_period, format_period
+)
+from src.services.cache import dashboard_cache
+from src.services.anomalies import score_months, remove_anomaly_month
+from src.services.benchmarks import update_benchmarks, remove_benchmark_month
+from src.services.etag import etag_validated
+from src.services.forecasting import update_forecast, remove_forecast_month
 from datetime import datetime
-from sqlalchemy import and_
+from decimal import InvalidOperation
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import csv
+import io
+import json
 
 financial_bp = Blueprint('financial', __name__)
 
+# Voci del conto economico modificabili dall'utente
+FINANCIAL_FIELDS = [
+    'ricavi_servizi', 'ricavi_prodotti', 'altri_ricavi',
+    'costo_merci', 'provvigioni', 'marketing_variabile',
+    'affitto', 'stipendi', 'utenze', 'marketing_fisso', 'altri_costi_fissi'
+]
+
+# Numero di righe validate e inserite per ogni blocco dell'import massivo
+IMPORT_CHUNK_SIZE = 500
+
+# Modalità di scrittura: 'create' non tocca i mesi esistenti, 'merge' li aggiorna
+WRITE_MODES = ('create', 'merge')
+
+# Colonne del vincolo unique_user_month_year usate come target dell'upsert
+UNIQUE_MONTH_COLUMNS = ['user_id', 'month', 'year']
+
+UPSERT_INSERTS = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert
+}
+
+# Campi di to_dict selezionabili con ?fields=
+PROJECTION_FIELDS = [
+    'id', 'user_id', 'month', 'year', *FINANCIAL_FIELDS,
+    'ricavi_totali', 'costi_variabili', 'costi_fissi', 'totale_costi', 'utile_netto', 'margine_percentuale',
+    'created_at', 'updated_at'
+]
+
+# Dimensione massima di una pagina di GET /financial-data
+MAX_PAGE_SIZE = 500
+
+# Righe lette per volta dal cursore lato server nelle risposte in streaming
+STREAM_BATCH_SIZE = 500
+
+STREAM_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json'
+}
+
+def serialize_field(field, value):
+    """Serializza un singolo campo come FinancialData.to_dict"""
+    if field in ('created_at', 'updated_at'):
+        return value.isoformat() if value else None
+    if field in ('id', 'user_id', 'month', 'year'):
+        return value
+    if field in FINANCIAL_FIELDS or field in TOTAL_COLUMNS:
+        return from_cents(value)
+    if field == 'margine_percentuale':
+        return float(value or 0)
+    return value or 0
+
+def months_written(user_id, items):
+    """Aggiorna nella transazione corrente i dati derivati dei mesi scritti.
+
+    Modello di previsione, sketch dei benchmark e finestra delle anomalie
+    vengono aggiornati in modo incrementale; restituisce le anomalie trovate.
+    """
+    update_forecast(user_id, items)
+    update_benchmarks(user_id, items)
+    return score_months(user_id, items)
+
+def month_deleted(user_id, period):
+    """Toglie un mese eliminato dai dati derivati (da chiamare prima del commit)"""
+    remove_forecast_month(user_id, period)
+    remove_benchmark_month(user_id, period)
+    remove_anomaly_month(user_id, period)
+
 def check_plan_limits(user, year, month):
     """Verifica i limiti del piano dell'utente"""
     if user.subscription_plan == 'free':
@@ -22,8 +103,188 @@ def check_plan_limits(user, year, month):
     
     return True, None
 
+def iter_import_rows(stream, fmt):
+    """Legge il corpo della richiesta riga per riga (CSV o NDJSON) senza caricarlo tutto in memoria"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    
+    for line_num, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_num, None, 'JSON non valido'
+            continue
+        if not isinstance(row, dict):
+            yield line_num, None, 'Ogni riga deve essere un oggetto JSON'
+            continue
+        yield line_num, row, None
+
+def parse_amounts(row):
+    """Converte in centesimi interi le voci presenti nel payload (importi in euro)"""
+    amounts = {}
+    for field in FINANCIAL_FIELDS:
+        if field not in row:
+            continue
+        raw = row[field]
+        if raw is None or (isinstance(raw, str) and not raw.strip()):
+            amounts[field] = 0
+            continue
+        try:
+            amounts[field] = to_cents(str(raw).strip())
+        except (InvalidOperation, ValueError, OverflowError):
+            # Decimal non valido, NaN o infinito
+            return None, f'Valore non valido per il campo {field}'
+        if abs(amounts[field]) > MAX_AMOUNT_CENTS:
+            return None, f'Valore fuori limite per il campo {field}'
+    
+    return amounts, None
+
+def parse_financial_row(user, row):
+    """Valida un mese del payload e restituisce i valori da scrivere e le voci fornite.
+    
+    I limiti del piano vanno verificati a parte con check_plan_limits.
+    """
+    try:
+        month = int(row.get('month'))
+        year = int(row.get('year'))
+    except (TypeError, ValueError):
+        return None, None, 'Mese e anno sono obbligatori'
+    
+    if not (1 <= month <= 12):
+        return None, None, 'Il mese deve essere tra 1 e 12'
+    
+    if year < 2000 or year > datetime.now().year + 1:
+        return None, None, 'Anno non valido'
+    
+    amounts, error = parse_amounts(row)
+    if error:
+        return None, None, error
+    
+    values = {'user_id': user.id, 'month': month, 'year': year}
+    for field in FINANCIAL_FIELDS:
+        values[field] = amounts.get(field, 0)
+    
+    return values, frozenset(amounts), None
+
+def upsert_financial_data(rows, mode='create'):
+    """Scrive uno o più mesi con un unico INSERT ... ON CONFLICT sul vincolo unique_user_month_year.
+    
+    rows è una lista di coppie (valori, voci fornite). In modalità 'create' i mesi già
+    esistenti vengono lasciati invariati; in modalità 'merge' vengono aggiornate solo le
+    voci fornite. Restituisce i record scritti.
+    """
+    dialect = db.session.get_bind().dialect.name
+    insert = UPSERT_INSERTS.get(dialect)
+    if insert is None:
+        return write_financial_data(rows, mode)
+    
+    # In modalità merge le righe con le stesse voci fornite condividono lo stesso SET
+    if mode == 'merge':
+        groups = {}
+        for values, provided in rows:
+            groups.setdefault(provided, []).append(values)
+    else:
+        groups = {None: [values for values, _ in rows]}
+    
+    written = []
+    for provided, group in groups.items():
+        stmt = insert(FinancialData).values(group)
+        
+        if mode == 'merge':
+            set_ = {field: stmt.excluded[field] for field in provided}
+            set_['updated_at'] = datetime.utcnow()
+            stmt = stmt.on_conflict_do_update(index_elements=UNIQUE_MONTH_COLUMNS, set_=set_)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=UNIQUE_MONTH_COLUMNS)
+        
+        written.extend(db.session.scalars(
+            stmt.returning(FinancialData),
+            execution_options={'populate_existing': True}
+        ).all())
+    
+    return written
+
+def write_financial_data(rows, mode='create'):
+    """Scrittura riga per riga (SELECT e poi INSERT o UPDATE) per i database senza ON CONFLICT.
+
+    Stessa semantica di upsert_financial_data, senza l'atomicità del vincolo:
+    due scritture concorrenti dello stesso mese possono ancora collidere.
+    """
+    existing = {}
+    for values, _ in rows:
+        item = FinancialData.query.filter_by(
+            user_id=values['user_id'], month=values['month'], year=values['year']
+        ).first()
+        if item is not None:
+            existing[(item.year, item.month)] = item
+    
+    written = []
+    for values, provided in rows:
+        item = existing.get((values['year'], values['month']))
+        if item is None:
+            item = FinancialData(**values)
+            db.session.add(item)
+            existing[(values['year'], values['month'])] = item
+        elif mode == 'merge':
+            for field in provided:
+                setattr(item, field, values[field])
+            item.updated_at = datetime.utcnow()
+        else:
+            continue
+        if item not in written:
+            written.append(item)
+    
+    db.session.flush()
+    # Ricarica i totali calcolati dal database
+    for item in written:
+        db.session.refresh(item)
+    return written
+
+def write_import_chunk(chunk, mode, errors, anomalies):
+    """Scrive un blocco di righe valide, segnala i mesi già esistenti e raccoglie le anomalie"""
+    written = upsert_financial_data([(values, provided) for _, values, provided in chunk], mode)
+    
+    if mode == 'create' and len(written) < len(chunk):
+        inserted = {(item.year, item.month) for item in written}
+        for line_num, values, _ in chunk:
+            if (values['year'], values['month']) not in inserted:
+                errors.append({'line': line_num, 'error': 'Dati già esistenti per questo mese/anno'})
+    
+    if written:
+        anomalies.extend(months_written(written[0].user_id, written))
+    return len(written)
+
+def stream_financial_data(query, fields, fmt):
+    """Genera la risposta un mese alla volta leggendo le righe a blocchi dal cursore"""
+    dumps = current_app.json.dumps
+    
+    if fmt == 'json':
+        yield '{"data":['
+    
+    for index, row in enumerate(query.yield_per(STREAM_BATCH_SIZE)):
+        if fields:
+            item = {field: serialize_field(field, value) for field, value in zip(fields, row[1:])}
+        else:
+            item = row.to_dict()
+        
+        if fmt == 'ndjson':
+            yield dumps(item) + '\n'
+        else:
+            yield (',' if index else '') + dumps(item)
+    
+    if fmt == 'json':
+        yield ']}'
+
 @financial_bp.route('/financial-data', methods=['GET'])
 @jwt_required()
+@etag_validated
 def get_financial_data():
     try:
         user_id = get_jwt_identity()
@@ -36,19 +297,81 @@ def get_financial_data():
         year = request.args.get('year', type=int)
         month = request.args.get('month', type=int)
         
+        # Paginazione keyset: ?limit=N&cursor=YYYY-MM (ultimo mese della pagina precedente)
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        
+        if limit is not None and not (1 <= limit <= MAX_PAGE_SIZE):
+            return jsonify({'error': f'Il parametro limit deve essere tra 1 e {MAX_PAGE_SIZE}'}), 400
+        
+        # Streaming: ?stream=ndjson (un mese per riga) oppure ?stream=json (stesso formato, inviato a blocchi)
+        stream = request.args.get('stream')
+        if stream and stream not in STREAM_MIMETYPES:
+            return jsonify({'error': 'Formato di streaming non valido (usa ndjson o json)'}), 400
+        if stream and (limit or cursor):
+            return jsonify({'error': 'Lo streaming non è compatibile con la paginazione'}), 400
+        
+        # Proiezione: ?fields=year,month,utile_netto
+        fields = None
+        if request.args.get('fields'):
+            fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+            invalid = [field for field in fields if field not in PROJECTION_FIELDS]
+            if not fields or invalid:
+                return jsonify({'error': f'Campi non validi: {", ".join(invalid)}'}), 400
+        
         query = FinancialData.query.filter_by(user_id=user_id)
         
-        if year:
-            query = query.filter_by(year=year)
-        if month:
+        # I filtri per anno diventano intervalli sull'indice (user_id, period)
+        if year and month:
+            query = query.filter(FinancialData.period == month_ordinal(year, month))
+        elif year:
+            query = query.filter(FinancialData.period.between(month_ordinal(year, 1), month_ordinal(year, 12)))
+        elif month:
             query = query.filter_by(month=month)
         
+        if cursor:
+            cursor_period = parse_period(cursor)
+            if cursor_period is None:
+                return jsonify({'error': 'Cursore non valido'}), 400
+            query = query.filter(FinancialData.period < cursor_period)
+        
         # Ordina per anno e mese decrescente
-        financial_data = query.order_by(FinancialData.year.desc(), FinancialData.month.desc()).all()
+        query = query.order_by(FinancialData.period.desc())
         
-        return jsonify({
-            'data': [item.to_dict() for item in financial_data]
-        }), 200
+        # Con la proiezione si leggono dal database solo le colonne richieste
+        if fields:
+            query = query.with_entities(FinancialData.period, *[getattr(FinancialData, field) for field in fields])
+        
+        if stream:
+            return Response(
+                stream_with_context(stream_financial_data(query, fields, stream)),
+                mimetype=STREAM_MIMETYPES[stream]
+            )
+        
+        # Una riga in più indica se esiste una pagina successiva
+        if limit:
+            query = query.limit(limit + 1)
+        
+        rows = query.all()
+        
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = format_period(rows[-1].period)
+        
+        if fields:
+            data = [
+                {field: serialize_field(field, value) for field, value in zip(fields, row[1:])}
+                for row in rows
+            ]
+        else:
+            data = [item.to_dict() for item in rows]
+        
+        result = {'data': data}
+        if limit:
+            result['next_cursor'] = next_cursor
+        
+        return jsonify(result), 200
         
     except Exception as e:
         return jsonify({'error': 'Errore interno del server'}), 500
@@ -56,6 +379,12 @@ def get_financial_data():
 @financial_bp.route('/financial-data', methods=['POST'])
 @jwt_required()
 def create_financial_data():
+    """Salva uno o più mesi.
+    
+    Il corpo può essere un singolo mese, una lista di mesi oppure {"months": [...]}.
+    Con mode=create (default) i mesi già esistenti non vengono toccati, con
+    mode=merge vengono aggiornate le sole voci fornite.
+    """
     try:
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
@@ -65,98 +394,194 @@ def create_financial_data():
         
         data = request.get_json()
         
-        # Validazione dati richiesti
-        if not data.get('month') or not data.get('year'):
-            return jsonify({'error': 'Mese e anno sono obbligatori'}), 400
+        mode = request.args.get('mode')
+        if not mode and isinstance(data, dict):
+            mode = data.get('mode')
+        mode = mode or 'create'
         
-        month = data['month']
-        year = data['year']
+        if mode not in WRITE_MODES:
+            return jsonify({'error': 'Modalità non valida (usa create o merge)'}), 400
         
-        # Validazione mese e anno
-        if not (1 <= month <= 12):
-            return jsonify({'error': 'Il mese deve essere tra 1 e 12'}), 400
+        if isinstance(data, list) or (isinstance(data, dict) and 'months' in data):
+            return save_financial_months(user, data if isinstance(data, list) else data['months'], mode)
         
-        if year < 2000 or year > datetime.now().year + 1:
-            return jsonify({'error': 'Anno non valido'}), 400
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Payload non valido'}), 400
+        
+        # Validazione mese, anno e importi
+        values, provided, error = parse_financial_row(user, data)
+        if error:
+            return jsonify({'error': error}), 400
         
         # Verifica limiti del piano
-        is_allowed, error_msg = check_plan_limits(user, year, month)
+        is_allowed, error_msg = check_plan_limits(user, values['year'], values['month'])
         if not is_allowed:
             return jsonify({'error': error_msg}), 403
         
-        # Verifica se esistono già dati per questo mese/anno
-        existing = FinancialData.query.filter_by(
-            user_id=user_id, 
-            month=month, 
-            year=year
-        ).first()
+        written = upsert_financial_data([(values, provided)], mode)
         
-        if existing:
+        if not written:
+            db.session.rollback()
             return jsonify({'error': 'Dati già esistenti per questo mese/anno'}), 400
         
-        # Crea nuovo record
-        financial_data = FinancialData(
-            user_id=user_id,
-            month=month,
-            year=year,
-            ricavi_servizi=data.get('ricavi_servizi', 0),
-            ricavi_prodotti=data.get('ricavi_prodotti', 0),
-            altri_ricavi=data.get('altri_ricavi', 0),
-            costo_merci=data.get('costo_merci', 0),
-            provvigioni=data.get('provvigioni', 0),
-            marketing_variabile=data.get('marketing_variabile', 0),
-            affitto=data.get('affitto', 0),
-            stipendi=data.get('stipendi', 0),
-            utenze=data.get('utenze', 0),
-            marketing_fisso=data.get('marketing_fisso', 0),
-            altri_costi_fissi=data.get('altri_costi_fissi', 0)
-        )
-        
-        db.session.add(financial_data)
+        anomalies = months_written(user.id, written)
         db.session.commit()
+        dashboard_cache.bump_version(user_id)
         
         return jsonify({
             'message': 'Dati finanziari salvati con successo',
-            'data': financial_data.to_dict()
-        }), 201
+            'data': written[0].to_dict(),
+            'anomalies': [flag.to_dict() for flag in anomalies]
+        }), 201 if mode == 'create' else 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Errore interno del server'}), 500
 
+def save_financial_months(user, months, mode):
+    """Salva un payload multi-mese con un unico upsert e segnala gli errori per mese"""
+    if not isinstance(months, list):
+        return jsonify({'error': 'Il campo months deve essere una lista'}), 400
+    
+    rows = []
+    errors = []
+    seen = set()
+    
+    for index, row in enumerate(months):
+        if not isinstance(row, dict):
+            errors.append({'index': index, 'error': 'Payload non valido'})
+            continue
+        
+        values, provided, error = parse_financial_row(user, row)
+        if not error:
+            is_allowed, error = check_plan_limits(user, values['year'], values['month'])
+            if is_allowed and (values['year'], values['month']) in seen:
+                error = 'Mese/anno duplicato nel payload'
+        if error:
+            errors.append({'index': index, 'error': error})
+            continue
+        
+        seen.add((values['year'], values['month']))
+        rows.append((index, values, provided))
+    
+    written = upsert_financial_data([(values, provided) for _, values, provided in rows], mode) if rows else []
+    
+    if mode == 'create' and len(written) < len(rows):
+        inserted = {(item.year, item.month) for item in written}
+        for index, values, _ in rows:
+            if (values['year'], values['month']) not in inserted:
+                errors.append({'index': index, 'error': 'Dati già esistenti per questo mese/anno'})
+    
+    anomalies = months_written(user.id, written) if written else []
+    db.session.commit()
+    dashboard_cache.bump_version(user.id)
+    
+    return jsonify({
+        'message': f'{len(written)} mesi salvati con successo',
+        'data': [item.to_dict() for item in written],
+        'anomalies': [flag.to_dict() for flag in anomalies],
+        'errors': sorted(errors, key=lambda e: e['index'])
+    }), 201 if written else 400
+
+@financial_bp.route('/financial-data/import', methods=['POST'])
+@jwt_required()
+def import_financial_data():
+    """Import massivo di più mesi da CSV o NDJSON in un'unica transazione"""
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        if not user:
+            return jsonify({'error': 'Utente non trovato'}), 404
+        
+        # Formato dal parametro esplicito o dal Content-Type
+        fmt = request.args.get('format')
+        if not fmt:
+            fmt = 'csv' if request.mimetype in ('text/csv', 'application/csv') else 'ndjson'
+        
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({'error': 'Formato non supportato (usa csv o ndjson)'}), 400
+        
+        mode = request.args.get('mode', 'create')
+        if mode not in WRITE_MODES:
+            return jsonify({'error': 'Modalità non valida (usa create o merge)'}), 400
+        
+        imported = 0
+        errors = []
+        anomalies = []
+        seen = set()
+        chunk = []
+        
+        for line_num, row, error in iter_import_rows(request.stream, fmt):
+            if not error:
+                values, provided, error = parse_financial_row(user, row)
+            if not error:
+                is_allowed, error = check_plan_limits(user, values['year'], values['month'])
+            if not error and (values['year'], values['month']) in seen:
+                error = 'Mese/anno duplicato nel file'
+            if error:
+                errors.append({'line': line_num, 'error': error})
+                continue
+            
+            seen.add((values['year'], values['month']))
+            chunk.append((line_num, values, provided))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                imported += write_import_chunk(chunk, mode, errors, anomalies)
+                chunk = []
+        
+        if chunk:
+            imported += write_import_chunk(chunk, mode, errors, anomalies)
+        
+        db.session.commit()
+        dashboard_cache.bump_version(user_id)
+        
+        return jsonify({
+            'message': f'{imported} mesi importati con successo',
+            'imported': imported,
+            'errors': sorted(errors, key=lambda e: e['line']),
+            'anomalies': [flag.to_dict() for flag in anomalies]
+        }), 201 if imported else 400
+        
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({'error': 'Il file deve essere codificato in UTF-8'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Errore interno del server'}), 500
+
 @financial_bp.route('/financial-data/<int:data_id>', methods=['PUT'])
 @jwt_required()
 def update_financial_data(data_id):
     try:
         user_id = get_jwt_identity()
         
-        # Trova i dati e verifica che appartengano all'utente
-        financial_data = FinancialData.query.filter_by(
-            id=data_id, 
-            user_id=user_id
+        data = request.get_json() or {}
+        
+        amounts, error = parse_amounts(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Un solo UPDATE ... RETURNING, filtrato anche per utente
+        financial_data = db.session.scalars(
+            update(FinancialData)
+            .where(FinancialData.id == data_id, FinancialData.user_id == user_id)
+            .values(updated_at=datetime.utcnow(), **amounts)
+            .returning(FinancialData),
+            execution_options={'populate_existing': True}
         ).first()
         
         if not financial_data:
+            db.session.rollback()
             return jsonify({'error': 'Dati non trovati'}), 404
         
-        data = request.get_json()
-        
-        # Aggiorna i campi forniti
-        fields = [
-            'ricavi_servizi', 'ricavi_prodotti', 'altri_ricavi',
-            'costo_merci', 'provvigioni', 'marketing_variabile',
-            'affitto', 'stipendi', 'utenze', 'marketing_fisso', 'altri_costi_fissi'
-        ]
-        
-        for field in fields:
-            if field in data:
-                setattr(financial_data, field, data[field])
-        
+        anomalies = months_written(user_id, [financial_data])
         db.session.commit()
+        dashboard_cache.bump_version(user_id)
         
         return jsonify({
             'message': 'Dati aggiornati con successo',
-            'data': financial_data.to_dict()
+            'data': financial_data.to_dict(),
+            'anomalies': [flag.to_dict() for flag in anomalies]
         }), 200
         
     except Exception as e:
@@ -178,8 +603,10 @@ def delete_financial_data(data_id):
         if not financial_data:
             return jsonify({'error': 'Dati non trovati'}), 404
         
+        month_deleted(user_id, financial_data.period)
         db.session.delete(financial_data)
         db.session.commit()
+        dashboard_cache.bump_version(user_id)
         
         return jsonify({'message': 'Dati eliminati con successo'}), 200
         
@@ -189,6 +616,7 @@ def delete_financial_data(data_id):
 
 @financial_bp.route('/financial-data/<int:year>/<int:month>', methods=['GET'])
 @jwt_required()
+@etag_validated
 def get_financial_data_by_month(year, month):
     try:
         user_id = get_jwt_identity()
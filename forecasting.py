@@ -0,0 +1,57 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from src.models.user import User, db, format_period
+from src.routes.stripe_routes import check_plan_limits
+from src.services.etag import etag_validated
+from src.services.forecasting import (
+    MODEL_VERSION, MIN_HORIZON, MAX_HORIZON, get_model, refit_user, forecast
+)
+
+forecasting_bp = Blueprint('forecasting', __name__)
+
+@forecasting_bp.route('/forecast', methods=['GET'])
+@jwt_required()
+@etag_validated
+def get_forecast():
+    """Analisi predittive (piano Premium): previsione di ogni voce per i prossimi mesi.
+
+    La previsione viene calcolata dal modello salvato dell'utente, aggiornato a
+    ogni scrittura dei dati; il modello viene creato alla prima richiesta.
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+
+        if not user:
+            return jsonify({'error': 'Utente non trovato'}), 404
+
+        if not check_plan_limits(user, 'predictive_analytics'):
+            return jsonify({'error': 'Le analisi predittive sono disponibili solo con il piano Premium'}), 403
+
+        horizon = request.args.get('horizon', 6, type=int)
+        if horizon is None or not MIN_HORIZON <= horizon <= MAX_HORIZON:
+            return jsonify({'error': f'horizon deve essere tra {MIN_HORIZON} e {MAX_HORIZON} mesi'}), 400
+
+        model = get_model(user.id)
+        if model is None or model.model_version != MODEL_VERSION:
+            model = refit_user(user.id)
+            db.session.commit()
+
+        if not model.observations:
+            return jsonify({'error': 'Nessun dato disponibile per la previsione'}), 404
+
+        return jsonify({
+            'horizon': horizon,
+            'model': {
+                'version': model.model_version,
+                'observations': model.observations,
+                'last_period': format_period(model.last_period),
+                'fitted_at': model.fitted_at.isoformat() if model.fitted_at else None,
+                'updated_at': model.updated_at.isoformat() if model.updated_at else None
+            },
+            'forecast': forecast(model, horizon)
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
@@ -13,6 +13,15 @@ from src.routes.financial import financial_bp
 from src.routes.dashboard import dashboard_bp
 from src.routes.export import export_bp
 from src.routes.stripe_routes import stripe_bp
+from src.routes.simulator import simulator_bp
+from src.routes.forecasting import forecasting_bp
+from src.routes.benchmarking import benchmarking_bp
+from src.routes.anomalies import anomalies_bp
+from src.services.cache import dashboard_cache
+from src.services.rendering import render_service, montecarlo_service
+from src.services.report_cache import report_cache
+from src.services.mailer import mailer
+from src.services.passwords import password_hasher
 from datetime import timedelta
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
@@ -40,12 +49,56 @@ app.config['MAIL_USE_TLS'] = True
 app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER')
+app.config['MAIL_OUTBOX_BATCH_SIZE'] = int(os.environ.get('MAIL_OUTBOX_BATCH_SIZE', 20))
+app.config['MAIL_OUTBOX_MAX_ATTEMPTS'] = int(os.environ.get('MAIL_OUTBOX_MAX_ATTEMPTS', 6))
+app.config['MAIL_OUTBOX_RETENTION_DAYS'] = int(os.environ.get('MAIL_OUTBOX_RETENTION_DAYS', 30))
+
+# ——— Configurazione Cache Dashboard ———
+# 'sqlite' condivide cache e invalidazioni tra tutti i worker gunicorn
+app.config['DASHBOARD_CACHE_BACKEND'] = os.environ.get('DASHBOARD_CACHE_BACKEND', 'sqlite')
+app.config['DASHBOARD_CACHE_SIZE'] = int(os.environ.get('DASHBOARD_CACHE_SIZE', 10000))
+app.config['DASHBOARD_CACHE_PATH'] = os.path.join(os.path.dirname(__file__), 'instance', 'dashboard_cache.db')
+
+# ——— Configurazione Rendering PDF ———
+app.config['PDF_RENDER_WORKERS'] = int(os.environ.get('PDF_RENDER_WORKERS', 2))
+app.config['PDF_RENDER_QUEUE_LIMIT'] = int(os.environ.get('PDF_RENDER_QUEUE_LIMIT', 8))
+app.config['PDF_RENDER_TIMEOUT'] = int(os.environ.get('PDF_RENDER_TIMEOUT', 30))
+app.config['PDF_RENDER_JOBS_DIR'] = os.path.join(os.path.dirname(__file__), 'instance', 'render_jobs')
+app.config['REPORT_CACHE_DIR'] = os.path.join(os.path.dirname(__file__), 'instance', 'report_cache')
+app.config['REPORT_CACHE_MAX_BYTES'] = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+
+# ——— Configurazione Simulazioni Monte Carlo ———
+# Pool separato dal rendering PDF: le simulazioni non rallentano i report
+app.config['MONTECARLO_WORKERS'] = int(os.environ.get('MONTECARLO_WORKERS', 2))
+app.config['MONTECARLO_QUEUE_LIMIT'] = int(os.environ.get('MONTECARLO_QUEUE_LIMIT', 8))
+app.config['MONTECARLO_TIMEOUT'] = int(os.environ.get('MONTECARLO_TIMEOUT', 30))
+app.config['MONTECARLO_JOBS_DIR'] = os.path.join(os.path.dirname(__file__), 'instance', 'montecarlo_jobs')
+
+# ——— Configurazione Hashing Password ———
+# Costo bcrypt degli hash nuovi: gli hash esistenti si aggiornano al login
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_QUEUE_LIMIT'] = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', 8))
+app.config['PASSWORD_HASH_TIMEOUT'] = int(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+app.config['AUTH_ATTEMPT_WINDOW'] = int(os.environ.get('AUTH_ATTEMPT_WINDOW', 300))
+app.config['AUTH_MAX_ATTEMPTS_PER_IP'] = int(os.environ.get('AUTH_MAX_ATTEMPTS_PER_IP', 30))
+app.config['AUTH_MAX_ATTEMPTS_PER_EMAIL'] = int(os.environ.get('AUTH_MAX_ATTEMPTS_PER_EMAIL', 10))
+app.config['AUTH_MAX_ATTEMPTS_PER_ACCOUNT'] = int(os.environ.get('AUTH_MAX_ATTEMPTS_PER_ACCOUNT', 50))
+app.config['AUTH_ACCOUNT_DELAY'] = float(os.environ.get('AUTH_ACCOUNT_DELAY', 0.5))
+app.config['AUTH_ACCOUNT_MAX_DELAY'] = float(os.environ.get('AUTH_ACCOUNT_MAX_DELAY', 5))
+app.config['AUTH_PROXY_COUNT'] = int(os.environ.get('AUTH_PROXY_COUNT', 0))
 
 # ——— Inizializza le altre estensioni ———
 bcrypt.init_app(app)
 jwt = JWTManager(app)
-cors = CORS(app, origins="*")
+cors = CORS(app, origins="*", expose_headers=["ETag"])
 mail = Mail(app)
+dashboard_cache.init_app(app)
+render_service.init_app(app)
+montecarlo_service.init_app(app)
+report_cache.init_app(app)
+mailer.init_app(app)
+password_hasher.init_app(app)
 
 # ——— Registra i Blueprint ———
 app.register_blueprint(auth_bp, url_prefix='/api')
@@ -53,6 +106,10 @@ app.register_blueprint(financial_bp, url_prefix='/api')
 app.register_blueprint(dashboard_bp, url_prefix='/api')
 app.register_blueprint(export_bp, url_prefix='/api/export')
 app.register_blueprint(stripe_bp, url_prefix='/api/stripe')
+app.register_blueprint(simulator_bp, url_prefix='/api')
+app.register_blueprint(forecasting_bp, url_prefix='/api')
+app.register_blueprint(benchmarking_bp, url_prefix='/api')
+app.register_blueprint(anomalies_bp, url_prefix='/api')
 
 # ——— JWT Error Handlers ———
 @jwt.expired_token_loader
@@ -86,7 +143,13 @@ def health_check():
     return jsonify({
         'status': 'OK',
         'message': 'Conto Economico AI API is running',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'dashboard_cache': dashboard_cache.stats(),
+        'pdf_render': render_service.stats(),
+        'montecarlo': montecarlo_service.stats(),
+        'report_cache': report_cache.stats(),
+        'email_outbox': mailer.stats(),
+        'password_hashing': password_hasher.stats()
     }), 200
 
 if __name__ == '__main__':
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+# Aggiungi il percorso del progetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import Integer, MetaData, inspect, text
+from sqlalchemy.schema import CreateColumn, CreateTable
+from src.models.user import db, User, FinancialData, AMOUNT_COLUMNS, TOTAL_COLUMNS, CENTS
+from src.main import app
+
+# Righe copiate per ogni transazione durante la ricostruzione di una tabella
+BATCH_SIZE = 1000
+
+def get_columns(conn, table_name):
+    """Restituisce i nomi delle colonne presenti nel database per la tabella"""
+    return {column['name'] for column in inspect(conn).get_columns(table_name)}
+
+def get_decimal_amounts(conn):
+    """Voci di financial_data ancora salvate in euro (Numeric) invece che in centesimi"""
+    types = {column['name']: column['type'] for column in inspect(conn).get_columns('financial_data')}
+    return [name for name in AMOUNT_COLUMNS if name in types and not isinstance(types[name], Integer)]
+
+def rebuild_financial_data(batch_size=BATCH_SIZE):
+    """Ricostruisce financial_data (SQLite) secondo lo schema attuale del modello.
+
+    SQLite non permette di aggiungere colonne generate STORED né di modificare i
+    vincoli: la tabella viene ricreata come financial_data_new e le righe copiate a
+    blocchi, con un commit per blocco. Se lo script si interrompe, al riavvio la
+    copia riprende dall'ultimo id copiato. Le voci ancora in euro vengono
+    convertite in centesimi durante la copia.
+    """
+    new_name = 'financial_data_new'
+
+    # Lo schema nuovo deve poter risolvere la foreign key verso users
+    metadata = MetaData()
+    User.__table__.to_metadata(metadata)
+    new_table = FinancialData.__table__.to_metadata(metadata, name=new_name)
+
+    with db.engine.begin() as conn:
+        if not inspect(conn).has_table(new_name):
+            conn.execute(CreateTable(new_table))
+        old_columns = get_columns(conn, 'financial_data')
+        decimal_amounts = get_decimal_amounts(conn)
+
+    # Solo le colonne scrivibili presenti in entrambe le tabelle
+    names = [
+        column.name for column in FinancialData.__table__.columns
+        if column.computed is None and column.name in old_columns
+    ]
+    columns = ', '.join(names)
+    values = ', '.join(
+        f'CAST(ROUND({name} * {CENTS}) AS INTEGER)' if name in decimal_amounts else name
+        for name in names
+    )
+
+    copied = 0
+    while True:
+        with db.engine.begin() as conn:
+            last_id = conn.execute(text(f'SELECT COALESCE(MAX(id), 0) FROM {new_name}')).scalar()
+            result = conn.execute(
+                text(
+                    f'INSERT INTO {new_name} ({columns}) '
+                    f'SELECT {values} FROM financial_data WHERE id > :last_id ORDER BY id LIMIT :batch_size'
+                ),
+                {'last_id': last_id, 'batch_size': batch_size}
+            )
+        if result.rowcount <= 0:
+            break
+        copied += result.rowcount
+        print(f"Copiate {copied} righe di financial_data")
+
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP TABLE financial_data'))
+        conn.execute(text(f'ALTER TABLE {new_name} RENAME TO financial_data'))
+        for index in FinancialData.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+def add_derived_columns(batch_size=BATCH_SIZE):
+    """Aggiunge le colonne generate del modello (totali del conto economico, periodo)"""
+    derived = [column for column in FinancialData.__table__.columns if column.computed is not None]
+
+    with db.engine.begin() as conn:
+        missing = [column for column in derived if column.name not in get_columns(conn, 'financial_data')]
+        if not missing:
+            return False
+
+        if conn.dialect.name == 'postgresql':
+            # PostgreSQL calcola le colonne STORED per tutte le righe esistenti
+            # riscrivendo la tabella una sola volta
+            for column in missing:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE financial_data ADD COLUMN {ddl}'))
+            return True
+
+    rebuild_financial_data(batch_size)
+    return True
+
+def convert_amounts_to_cents(batch_size=BATCH_SIZE):
+    """Converte le voci di financial_data da Numeric(10, 2) in euro a centesimi interi"""
+    with db.engine.begin() as conn:
+        pending = get_decimal_amounts(conn)
+        if not pending:
+            return False
+
+        if conn.dialect.name == 'postgresql':
+            # I totali generati dipendono dalle voci: vanno tolti prima di cambiarne
+            # il tipo e ricreati dopo. Ogni ALTER TABLE riscrive la tabella una volta
+            existing = get_columns(conn, 'financial_data')
+            derived = [
+                column for column in FinancialData.__table__.columns
+                if column.name in TOTAL_COLUMNS + ('margine_percentuale',)
+            ]
+            drops = [f'DROP COLUMN {column.name}' for column in derived if column.name in existing]
+            if drops:
+                conn.execute(text(f'ALTER TABLE financial_data {", ".join(drops)}'))
+            alters = ', '.join(
+                f'ALTER COLUMN {name} TYPE BIGINT USING ROUND({name} * {CENTS})::bigint' for name in pending
+            )
+            conn.execute(text(f'ALTER TABLE financial_data {alters}'))
+            adds = ', '.join(
+                f'ADD COLUMN {CreateColumn(column).compile(dialect=conn.dialect)}' for column in derived
+            )
+            conn.execute(text(f'ALTER TABLE financial_data {adds}'))
+            return True
+
+    rebuild_financial_data(batch_size)
+    return True
+
+def create_missing_indexes():
+    """Crea gli indici del modello non ancora presenti nel database"""
+    with db.engine.begin() as conn:
+        existing = {index['name'] for index in inspect(conn).get_indexes('financial_data')}
+        missing = [index for index in FinancialData.__table__.indexes if index.name not in existing]
+        for index in missing:
+            index.create(conn)
+    return bool(missing)
+
+# Migrazioni in ordine di applicazione; ognuna verifica da sola se è già stata eseguita
+MIGRATIONS = [
+    ('Colonne generate di financial_data (totali e periodo)', add_derived_columns),
+    ('Indice (user_id, period) su financial_data', create_missing_indexes),
+    ('Importi di financial_data in centesimi interi', convert_amounts_to_cents),
+]
+
+def migrate():
+    """Applica le migrazioni mancanti al database"""
+    with app.app_context():
+        db.create_all()
+        for description, migration in MIGRATIONS:
+            if migration():
+                print(f"Migrazione applicata: {description}")
+            else:
+                print(f"Migrazione già presente: {description}")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+# Aggiungi il percorso del progetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+from sqlalchemy import delete, insert, select
+from src.models.user import db, User, FinancialData, BenchmarkSketch, BenchmarkEntry
+from src.services.benchmarks import SketchUpdates, normalize_business_type, month_metrics
+from src.main import app
+
+# Righe di financial_data lette per blocco
+BATCH_SIZE = 1000
+
+def rebuild_benchmarks(batch_size=BATCH_SIZE):
+    """Ricostruisce da zero sketch e contributi dei benchmark per tipo di attività.
+
+    Serve alla prima installazione (dati già presenti) o dopo un cambio del
+    formato degli sketch; gli aggiornamenti incrementali delle scritture non
+    sono coordinati con lo script, che va quindi lanciato a scritture ferme.
+    """
+    with app.app_context():
+        db.session.execute(delete(BenchmarkEntry))
+        db.session.execute(delete(BenchmarkSketch))
+
+        # Gli sketch sono piccoli (tipi di attività x mesi x metriche): restano in memoria
+        updates = SketchUpdates()
+        after_id = 0
+        entries = 0
+
+        while True:
+            rows = db.session.execute(
+                select(
+                    FinancialData.id, FinancialData.user_id, FinancialData.period, User.business_type,
+                    FinancialData.ricavi_totali, FinancialData.utile_netto, FinancialData.margine_percentuale
+                )
+                .join(User, User.id == FinancialData.user_id)
+                .where(FinancialData.id > after_id)
+                .order_by(FinancialData.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            batch = []
+            for row in rows:
+                business_type = normalize_business_type(row.business_type)
+                if business_type is None:
+                    continue
+                values = month_metrics(row)
+                updates.apply(business_type, row.period, values, 1)
+                batch.append({'user_id': row.user_id, 'period': row.period, 'business_type': business_type, **values})
+
+            if batch:
+                db.session.execute(insert(BenchmarkEntry), batch)
+            entries += len(batch)
+            after_id = rows[-1].id
+            print(f"Mesi elaborati fino all'id {after_id}: {entries} contributi")
+
+        updates.flush()
+        db.session.commit()
+
+    print(f"Completato: {entries} contributi")
+    return entries
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ricostruisce gli sketch dei benchmark per tipo di attività')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    rebuild_benchmarks(args.batch_size)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+# Aggiungi il percorso del progetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import or_, select
+from src.models.user import db, User, FinancialData, ForecastModel
+from src.routes.stripe_routes import PLANS
+from src.services.forecasting import build_state, lock_model, month_values, save_state
+from src.services.pnl import INPUT_FIELDS
+from src.main import app
+
+# Utenti rielaborati per blocco: un blocco = una transazione
+BATCH_SIZE = 200
+
+def forecast_plans():
+    """Piani che includono le analisi predittive"""
+    return [plan for plan, config in PLANS.items() if config['limits'].get('predictive_analytics')]
+
+def next_users(after_id, batch_size):
+    """Prossimo blocco di utenti con le analisi predittive o con un modello già salvato"""
+    return db.session.scalars(
+        select(User.id)
+        .outerjoin(ForecastModel, ForecastModel.user_id == User.id)
+        .where(
+            User.id > after_id,
+            or_(User.subscription_plan.in_(forecast_plans()), ForecastModel.id.is_not(None))
+        )
+        .order_by(User.id)
+        .limit(batch_size)
+    ).all()
+
+def load_batch_months(user_ids):
+    """Storico di tutti gli utenti del blocco con una sola query"""
+    months = {user_id: [] for user_id in user_ids}
+    rows = db.session.execute(
+        select(FinancialData.user_id, FinancialData.period, *(getattr(FinancialData, field) for field in INPUT_FIELDS))
+        .where(FinancialData.user_id.in_(user_ids))
+        .order_by(FinancialData.user_id, FinancialData.period)
+    )
+    for row in rows:
+        months[row.user_id].append((row.period, month_values(row)))
+    return months
+
+def refit_forecasts(batch_size=BATCH_SIZE, workers=None, pause=0.2):
+    """Ricalcola da zero i modelli di previsione di tutti gli utenti interessati"""
+    start = time.perf_counter()
+    refitted = 0
+
+    with app.app_context(), ProcessPoolExecutor(max_workers=workers) as executor:
+        after_id = 0
+        while True:
+            user_ids = next_users(after_id, batch_size)
+            if not user_ids:
+                break
+
+            months = load_batch_months(user_ids)
+            # Il fit gira nei processi del pool, la scrittura nel processo principale
+            states = executor.map(build_state, [months[user_id] for user_id in user_ids], chunksize=16)
+            for user_id, state in zip(user_ids, states):
+                save_state(user_id, state, lock_model(user_id), refit=True)
+            db.session.commit()
+
+            refitted += len(user_ids)
+            after_id = user_ids[-1]
+            print(f"Modelli ricalcolati: {refitted} (ultimo utente {after_id})")
+            # Lascia respirare il database condiviso con l'applicazione web
+            time.sleep(pause)
+
+    print(f"Completato in {time.perf_counter() - start:.1f}s: {refitted} modelli")
+    return refitted
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ricalcola i modelli delle analisi predittive (job notturno)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help='processi per il fit (default: CPU disponibili)')
+    parser.add_argument('--pause', type=float, default=0.2, help='secondi di pausa tra un blocco e il successivo')
+    parser.add_argument('--nice', type=int, default=10, help='riduce la priorità del processo e dei worker')
+    args = parser.parse_args()
+
+    if args.nice and hasattr(os, 'nice'):
+        os.nice(args.nice)
+
+    refit_forecasts(args.batch_size, args.workers, args.pause)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+# Aggiungi il percorso del progetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import time
+import numpy as np
+from sqlalchemy import delete, insert, select
+from src.models.user import db, FinancialData, AnomalyStats, AnomalyFlag, CENTS
+from src.services.anomalies import WINDOW, RollingStats, anomalous, score_block, to_log
+from src.services.pnl import INPUT_FIELDS
+from src.main import app
+
+# Utenti rielaborati per blocco: un blocco = una transazione
+BATCH_SIZE = 500
+
+def next_users(after_id, batch_size):
+    return db.session.scalars(
+        select(FinancialData.user_id)
+        .where(FinancialData.user_id > after_id)
+        .group_by(FinancialData.user_id)
+        .order_by(FinancialData.user_id)
+        .limit(batch_size)
+    ).all()
+
+def load_block(user_ids):
+    """Mesi degli utenti del blocco come array NumPy ordinati per utente e periodo"""
+    rows = db.session.execute(
+        select(FinancialData.user_id, FinancialData.period, *(getattr(FinancialData, field) for field in INPUT_FIELDS))
+        .where(FinancialData.user_id.in_(user_ids))
+        .order_by(FinancialData.user_id, FinancialData.period)
+    ).all()
+    users = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    periods = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    cents = np.array([[value or 0 for value in row[2:]] for row in rows], dtype=np.int64).reshape(-1, len(INPUT_FIELDS))
+    values = cents / CENTS
+    return users, periods, values
+
+def rescore_block(user_ids):
+    """Ricalcola segnalazioni e finestre di un blocco di utenti; restituisce le anomalie trovate"""
+    users, periods, values = load_block(user_ids)
+    scores, mean, valid = score_block(users, values)
+
+    rows, columns = np.nonzero(anomalous(scores, mean, values) & valid[:, None])
+    flags = [
+        {
+            'user_id': int(users[row]),
+            'period': int(periods[row]),
+            'field': INPUT_FIELDS[column],
+            'value': round(float(values[row, column]), 2),
+            'expected': round(float(np.expm1(mean[row, column])), 2),
+            'score': round(float(scores[row, column]), 2)
+        }
+        for row, column in zip(rows, columns)
+    ]
+
+    # Finestra di ogni utente: gli ultimi WINDOW mesi del blocco
+    log_values = to_log(values)
+    ends = np.r_[np.flatnonzero(users[1:] != users[:-1]) + 1, len(users)]
+    starts = np.r_[0, ends[:-1]]
+    states = []
+    for start, end in zip(starts, ends):
+        stats = RollingStats()
+        for row in range(max(start, end - WINDOW), end):
+            stats.set_month(int(periods[row]), log_values[row])
+        states.append({'user_id': int(users[start]), 'state': stats.to_json()})
+
+    db.session.execute(delete(AnomalyFlag).where(AnomalyFlag.user_id.in_(user_ids)))
+    db.session.execute(delete(AnomalyStats).where(AnomalyStats.user_id.in_(user_ids)))
+    if flags:
+        db.session.execute(insert(AnomalyFlag), flags)
+    if states:
+        db.session.execute(insert(AnomalyStats), states)
+    return len(flags)
+
+def rescore_anomalies(batch_size=BATCH_SIZE, pause=0.2):
+    """Rivaluta tutta financial_data e ricostruisce le finestre mobili degli utenti"""
+    start = time.perf_counter()
+    users = 0
+    anomalies = 0
+
+    with app.app_context():
+        after_id = 0
+        while True:
+            user_ids = next_users(after_id, batch_size)
+            if not user_ids:
+                break
+            anomalies += rescore_block(user_ids)
+            db.session.commit()
+
+            users += len(user_ids)
+            after_id = user_ids[-1]
+            print(f"Utenti rivalutati: {users}, anomalie: {anomalies} (ultimo utente {after_id})")
+            # Lascia respirare il database condiviso con l'applicazione web
+            time.sleep(pause)
+
+    print(f"Completato in {time.perf_counter() - start:.1f}s: {users} utenti, {anomalies} anomalie")
+    return anomalies
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rivaluta le anomalie di tutti i mesi inseriti')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=0.2, help='secondi di pausa tra un blocco e il successivo')
+    args = parser.parse_args()
+
+    rescore_anomalies(args.batch_size, args.pause)
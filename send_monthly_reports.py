@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+# Aggiungi il percorso del progetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import io
+import time
+from datetime import datetime
+from sqlalchemy import and_, select
+from src.models.user import db, User, FinancialData, ReportDelivery, month_ordinal, format_period
+from src.routes.export import submit_report, send_email_with_pdf
+from src.services.rendering import render_service
+from src.main import app
+
+# Piani che includono l'invio del report via email
+REPORT_PLANS = ('pro', 'premium')
+
+# Utenti elaborati per blocco: un blocco = una transazione
+BATCH_SIZE = 100
+
+def previous_month():
+    """Mese appena concluso (il job gira a inizio mese)"""
+    now = datetime.now()
+    if now.month == 1:
+        return 12, now.year - 1
+    return now.month - 1, now.year
+
+def pending_users(period, after_id, batch_size):
+    """Prossimo blocco di utenti paganti senza report per il periodo, con i dati del mese.
+
+    Una sola query per blocco: l'outer join su financial_data carica il mese di
+    tutti gli utenti del blocco, quello su report_deliveries esclude chi è già
+    stato servito da un'esecuzione precedente. Le righe arrivano dal cursore
+    con yield_per invece di essere materializzate tutte insieme.
+    """
+    return db.session.execute(
+        select(User, FinancialData)
+        .outerjoin(FinancialData, and_(FinancialData.user_id == User.id, FinancialData.period == period))
+        .outerjoin(ReportDelivery, and_(ReportDelivery.user_id == User.id, ReportDelivery.period == period))
+        .where(
+            User.subscription_plan.in_(REPORT_PLANS),
+            User.id > after_id,
+            ReportDelivery.id.is_(None)
+        )
+        .order_by(User.id)
+        .limit(batch_size)
+        .execution_options(yield_per=batch_size)
+    )
+
+def process_batch(month, year, after_id, batch_size, stats):
+    """Genera in parallelo i PDF di un blocco e accoda le email; restituisce l'ultimo id elaborato"""
+    period = month_ordinal(year, month)
+    jobs = []
+    skipped = []
+    last_id = None
+
+    for user, financial_data in pending_users(period, after_id, batch_size):
+        last_id = user.id
+        if financial_data is None:
+            # Nessun dato per il mese: niente email, ma l'utente risulta elaborato
+            skipped.append(user.id)
+            continue
+        jobs.append((user.id, user.email, submit_report(user, financial_data, month, year)))
+
+    # Chiude la transazione di lettura: durante il rendering non si tiene
+    # aperto nulla sul database condiviso con l'applicazione web
+    db.session.commit()
+
+    reports = []
+    for user_id, email, job_id in jobs:
+        try:
+            reports.append((user_id, email, render_service.wait(job_id)))
+        except Exception as e:
+            # Nessuna riga in report_deliveries: la prossima esecuzione ci riprova
+            print(f"Report non generato per l'utente {user_id}: {str(e)}")
+            stats['failed'] += 1
+
+    # Tutte le scritture a PDF pronti, in un'unica transazione breve:
+    # email e avanzamento insieme, dopo un crash nessun doppio invio
+    for user_id in skipped:
+        db.session.add(ReportDelivery(user_id=user_id, period=period, status='skipped'))
+        stats['skipped'] += 1
+
+    messages = [
+        (user_id, send_email_with_pdf(email, io.BytesIO(pdf_bytes), month, year, user_id=user_id, commit=False))
+        for user_id, email, pdf_bytes in reports
+    ]
+    db.session.flush()
+    for user_id, message in messages:
+        db.session.add(ReportDelivery(user_id=user_id, period=period, status='queued', email_id=message.id))
+        stats['queued'] += 1
+
+    db.session.commit()
+    return last_id
+
+def send_monthly_reports(month, year, batch_size=BATCH_SIZE, workers=2, pause=0.5, limit=None):
+    """Accoda il report mensile per tutti gli utenti Pro e Premium"""
+    # Pool piccolo e a bassa priorità: il job non deve togliere CPU ai worker web
+    app.config['PDF_RENDER_WORKERS'] = workers
+    app.config['PDF_RENDER_QUEUE_LIMIT'] = batch_size
+    render_service.init_app(app)
+
+    stats = {'queued': 0, 'skipped': 0, 'failed': 0}
+    start = time.perf_counter()
+
+    with app.app_context():
+        after_id = 0
+        processed = 0
+        while limit is None or processed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - processed)
+            last_id = process_batch(month, year, after_id, size, stats)
+            if last_id is None:
+                break
+            after_id = last_id
+            processed += size
+            print(
+                f"Report {format_period(month_ordinal(year, month))}: "
+                f"{stats['queued']} accodati, {stats['skipped']} senza dati, {stats['failed']} errori "
+                f"(ultimo utente {after_id})"
+            )
+            # Lascia respirare il database condiviso con l'applicazione web
+            time.sleep(pause)
+
+    print(f"Completato in {time.perf_counter() - start:.1f}s: {stats}")
+    return stats
+
+if __name__ == '__main__':
+    default_month, default_year = previous_month()
+    parser = argparse.ArgumentParser(description='Accoda il report mensile via email per gli utenti Pro e Premium')
+    parser.add_argument('--month', type=int, default=default_month)
+    parser.add_argument('--year', type=int, default=default_year)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=2, help='processi di rendering PDF')
+    parser.add_argument('--pause', type=float, default=0.5, help='secondi di pausa tra un blocco e il successivo')
+    parser.add_argument('--limit', type=int, default=None, help='numero massimo di utenti in questa esecuzione')
+    parser.add_argument('--nice', type=int, default=10, help='riduce la priorità del processo e dei worker di rendering')
+    args = parser.parse_args()
+
+    if args.nice and hasattr(os, 'nice'):
+        os.nice(args.nice)
+
+    send_monthly_reports(args.month, args.year, args.batch_size, args.workers, args.pause, args.limit)
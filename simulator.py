@@ -0,0 +1,254 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from src.models.user import (
+    User, FinancialData, db, format_period, RICAVI_COLUMNS, COSTI_VARIABILI_COLUMNS, COSTI_FISSI_COLUMNS
+)
+from src.routes.stripe_routes import check_plan_limits
+from src.services.cache import dashboard_cache
+from src.services.etag import etag_validated
+from src.services.montecarlo import (
+    MODEL_VERSION, fit_distributions, sample_chunk, chunk_sizes, chunk_seeds, summarize
+)
+from src.services.pnl import INPUT_FIELDS, compute_pnl, to_columns, to_euros
+from src.services.rendering import montecarlo_service, RenderQueueFull
+from concurrent.futures import TimeoutError as RenderTimeout
+from sqlalchemy import select
+import numpy as np
+
+simulator_bp = Blueprint('simulator', __name__)
+
+# Leve dello scenario e voci su cui agiscono; 'costi' muove insieme costi fissi e variabili
+LEVERS = {
+    'ricavi': RICAVI_COLUMNS,
+    'costi': COSTI_VARIABILI_COLUMNS + COSTI_FISSI_COLUMNS,
+    'costi_variabili': COSTI_VARIABILI_COLUMNS,
+    'costi_fissi': COSTI_FISSI_COLUMNS
+}
+
+# Griglia di default, come gli slider del simulatore: da 0 a +100% in passi dell'1%
+DEFAULT_AXIS = {'min': 0, 'max': 100, 'steps': 101}
+
+MAX_AXIS_STEPS = 201
+MAX_GRID_POINTS = 250_000
+
+# Parametri della simulazione Monte Carlo
+MONTECARLO_MIN_MONTHS = 3
+MONTECARLO_DEFAULT_SAMPLES = 50_000
+MONTECARLO_MAX_SAMPLES = 200_000
+MONTECARLO_MAX_HORIZON = 12
+
+# Metriche restituibili per ogni punto della griglia
+GRID_METRICS = ('ricavi_totali', 'totale_costi', 'utile_netto', 'margine_percentuale')
+DEFAULT_GRID_METRICS = ('utile_netto', 'margine_percentuale')
+
+def get_base_months(user_id, months):
+    """Ultimi `months` mesi con dati dell'utente, dal più vecchio al più recente"""
+    rows = db.session.execute(
+        select(FinancialData.period, *(getattr(FinancialData, field) for field in INPUT_FIELDS))
+        .where(FinancialData.user_id == user_id)
+        .order_by(FinancialData.period.desc())
+        .limit(months)
+    ).all()
+    return rows[::-1]
+
+def base_scenario(rows):
+    """Mese medio del periodo: media di ogni voce, metriche dal motore del conto economico"""
+    columns = to_euros(to_columns(rows))
+    averages = {field: np.array([values.mean()]) for field, values in columns.items()}
+    metrics = compute_pnl(averages)
+    base = {field: round(float(values[0]), 2) for field, values in averages.items()}
+    base.update({metric: float(values[0]) for metric, values in metrics.items()})
+    return base
+
+def parse_axis(spec):
+    """Valori percentuali di una leva da {'min', 'max', 'steps'}; None se non validi"""
+    try:
+        low = float(spec.get('min', DEFAULT_AXIS['min']))
+        high = float(spec.get('max', DEFAULT_AXIS['max']))
+        steps = int(spec.get('steps', DEFAULT_AXIS['steps']))
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if steps < 1 or steps > MAX_AXIS_STEPS or high < low:
+        return None
+    return np.linspace(low, high, steps)
+
+def evaluate_grid(base, axes):
+    """Valuta tutti gli scenari della griglia in un'unica chiamata vettoriale.
+
+    axes è una lista ordinata di (leva, percentuali); ogni leva di ricavo è un
+    aumento, ogni leva di costo una riduzione. Le voci del mese base vengono
+    scalate per broadcasting su una griglia con una dimensione per leva, poi
+    appiattite e passate a compute_pnl.
+    """
+    shape = tuple(len(values) for _, values in axes)
+    factors = {field: np.ones(shape) for field in INPUT_FIELDS}
+
+    for index, (lever, values) in enumerate(axes):
+        # Percentuali disposte lungo la dimensione della leva
+        view = [1] * len(axes)
+        view[index] = len(values)
+        sign = 1 if lever == 'ricavi' else -1
+        factor = (1 + sign * values / 100).reshape(view)
+        for field in LEVERS[lever]:
+            factors[field] = factors[field] * factor
+
+    columns = {field: (base[field] * factors[field]).ravel() for field in INPUT_FIELDS}
+    return shape, compute_pnl(columns)
+
+@simulator_bp.route('/simulator/evaluate', methods=['POST'])
+@jwt_required()
+@etag_validated
+def evaluate_scenarios():
+    """Griglia di scenari "E se..." sui mesi reali dell'utente.
+
+    Corpo: leve 'ricavi' e 'costi' oppure 'costi_variabili'/'costi_fissi' separate,
+    ciascuna {'min', 'max', 'steps'} in punti percentuali; 'months' mesi di base
+    (default 12) e 'metrics' da restituire. I risultati sono array appiattiti in
+    ordine row-major secondo 'shape' e 'axes'.
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+
+        if not user:
+            return jsonify({'error': 'Utente non trovato'}), 404
+
+        data = request.get_json(silent=True) or {}
+
+        try:
+            months = int(data.get('months', 12))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'months deve essere un intero'}), 400
+        if months < 1:
+            return jsonify({'error': 'Il numero di mesi deve essere almeno 1'}), 400
+
+        metrics = data.get('metrics', DEFAULT_GRID_METRICS)
+        if not isinstance(metrics, (list, tuple)) or not set(metrics) <= set(GRID_METRICS):
+            return jsonify({'error': f'metrics deve essere un sottoinsieme di {", ".join(GRID_METRICS)}'}), 400
+
+        # Leve separate per costi fissi e variabili, oppure una sola leva 'costi'
+        separate = 'costi_variabili' in data or 'costi_fissi' in data
+        if separate and 'costi' in data:
+            return jsonify({'error': 'Usa la leva costi oppure costi_variabili/costi_fissi, non entrambe'}), 400
+        levers = ['ricavi', 'costi_variabili', 'costi_fissi'] if separate else ['ricavi', 'costi']
+
+        axes = []
+        for lever in levers:
+            if lever in data:
+                spec = data[lever]
+            elif separate and lever != 'ricavi':
+                # Leva di costo non richiesta: resta ferma a 0%
+                spec = {'min': 0, 'max': 0, 'steps': 1}
+            else:
+                spec = DEFAULT_AXIS
+            values = parse_axis(spec)
+            if values is None:
+                return jsonify({'error': f'Leva {lever} non valida: min <= max e steps tra 1 e {MAX_AXIS_STEPS}'}), 400
+            axes.append((lever, values))
+
+        if int(np.prod([len(values) for _, values in axes])) > MAX_GRID_POINTS:
+            return jsonify({'error': f'La griglia può contenere al massimo {MAX_GRID_POINTS} scenari'}), 400
+
+        rows = get_base_months(user.id, months)
+        if not rows:
+            return jsonify({'error': 'Nessun dato disponibile per la simulazione'}), 404
+
+        base = base_scenario(rows)
+        shape, results = evaluate_grid(base, axes)
+
+        response = {
+            'base': base,
+            'base_period': {
+                'months': len(rows),
+                'start': format_period(rows[0].period),
+                'end': format_period(rows[-1].period)
+            },
+            'axes': {lever: values.round(4).tolist() for lever, values in axes},
+            'shape': list(shape)
+        }
+        for metric in metrics:
+            response[metric] = results[metric].tolist()
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def run_montecarlo(user_id, distributions, samples, horizon, seed):
+    """Distribuisce il campionamento sui processi del pool e ne aggrega i blocchi"""
+    job_ids = []
+    try:
+        for size, chunk_seed in zip(chunk_sizes(samples), chunk_seeds(seed)):
+            job_ids.append(montecarlo_service.submit(user_id, sample_chunk, distributions, size, horizon, chunk_seed))
+        chunks = []
+        for job_id in list(job_ids):
+            chunks.append(montecarlo_service.wait(job_id))
+            job_ids.remove(job_id)
+    finally:
+        # Blocchi non attesi (coda piena, timeout): il pool li completa e li dimentica
+        for job_id in job_ids:
+            montecarlo_service.discard(job_id)
+    return summarize(chunks)
+
+@simulator_bp.route('/simulator/montecarlo', methods=['GET'])
+@jwt_required()
+@etag_validated
+@dashboard_cache.cached(f'montecarlo:v{MODEL_VERSION}')
+def montecarlo_simulation():
+    """Simulazione Monte Carlo dei mesi futuri (piano Premium).
+
+    Ogni voce del conto economico viene stimata dagli ultimi 'months' mesi
+    (default 24) e campionata 'samples' volte su un orizzonte di 'horizon'
+    mesi. Con lo stesso 'seed' il risultato è identico; la risposta resta in
+    cache finché i dati dell'utente non cambiano.
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+
+        if not user:
+            return jsonify({'error': 'Utente non trovato'}), 404
+
+        if not check_plan_limits(user, 'advanced_simulator'):
+            return jsonify({'error': 'Il simulatore avanzato è disponibile solo con il piano Premium'}), 403
+
+        months = request.args.get('months', 24, type=int)
+        samples = request.args.get('samples', MONTECARLO_DEFAULT_SAMPLES, type=int)
+        horizon = request.args.get('horizon', 1, type=int)
+        seed = request.args.get('seed', 0, type=int)
+
+        if months is None or months < MONTECARLO_MIN_MONTHS:
+            return jsonify({'error': f'Servono almeno {MONTECARLO_MIN_MONTHS} mesi di storico'}), 400
+        if samples is None or not 1000 <= samples <= MONTECARLO_MAX_SAMPLES:
+            return jsonify({'error': f'samples deve essere tra 1000 e {MONTECARLO_MAX_SAMPLES}'}), 400
+        if horizon is None or not 1 <= horizon <= MONTECARLO_MAX_HORIZON:
+            return jsonify({'error': f'horizon deve essere tra 1 e {MONTECARLO_MAX_HORIZON} mesi'}), 400
+        if seed is None or seed < 0:
+            return jsonify({'error': 'seed deve essere un intero non negativo'}), 400
+
+        rows = get_base_months(user.id, months)
+        if len(rows) < MONTECARLO_MIN_MONTHS:
+            return jsonify({'error': f'Servono almeno {MONTECARLO_MIN_MONTHS} mesi di dati per la simulazione'}), 404
+
+        distributions = fit_distributions(rows)
+        result = run_montecarlo(user.id, distributions, samples, horizon, seed)
+
+        result.update({
+            'horizon': horizon,
+            'seed': seed,
+            'model_version': MODEL_VERSION,
+            'base_period': {
+                'months': len(rows),
+                'start': format_period(rows[0].period),
+                'end': format_period(rows[-1].period)
+            },
+            'distributions': distributions
+        })
+        return jsonify(result), 200
+
+    except RenderQueueFull:
+        return jsonify({'error': 'Troppe simulazioni in corso, riprova tra poco'}), 503, {'Retry-After': '5'}
+    except RenderTimeout:
+        return jsonify({'error': 'Simulazione troppo lenta, riduci il numero di campioni'}), 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
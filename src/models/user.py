@@ -1,11 +1,430 @@
-
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 
 class User(db.Model):
+    __tablename__ = 'users'
+    
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(128), nullable=False)
+    first_name = db.Column(db.String(80), nullable=False)
+    last_name = db.Column(db.String(80), nullable=False)
+    business_name = db.Column(db.String(120))
+    business_type = db.Column(db.String(50))
+    subscription_plan = db.Column(db.String(20), default='free')
+    stripe_customer_id = db.Column(db.String(100))
+    subscription_status = db.Column(db.String(50), default='active')  # active, canceled, past_due
+    subscription_end_date = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relazioni
+    financial_data = db.relationship('FinancialData', backref='user', lazy=True, cascade='all, delete-orphan')
+    subscription = db.relationship('Subscription', backref='user', lazy=True, uselist=False)
+
+    def set_password(self, password):
+        """Hash e salva la password"""
+        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+
+    def check_password(self, password):
+        """Verifica la password"""
+        return bcrypt.check_password_hash(self.password_hash, password)
+
+    def __repr__(self):
+        return f'<User {self.email}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'email': self.email,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'business_name': self.business_name,
+            'business_type': self.business_type,
+            'subscription_plan': self.subscription_plan,
+            'subscription_status': self.subscription_status,
+            'subscription_end_date': self.subscription_end_date.isoformat() if self.subscription_end_date else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+# Voci che compongono i totali del conto economico
+RICAVI_COLUMNS = ('ricavi_servizi', 'ricavi_prodotti', 'altri_ricavi')
+COSTI_VARIABILI_COLUMNS = ('costo_merci', 'provvigioni', 'marketing_variabile')
+COSTI_FISSI_COLUMNS = ('affitto', 'stipendi', 'utenze', 'marketing_fisso', 'altri_costi_fissi')
+AMOUNT_COLUMNS = RICAVI_COLUMNS + COSTI_VARIABILI_COLUMNS + COSTI_FISSI_COLUMNS
+
+# Totali in centesimi (il margine è una percentuale)
+TOTAL_COLUMNS = ('ricavi_totali', 'costi_variabili', 'costi_fissi', 'totale_costi', 'utile_netto')
+
+# Importi salvati e calcolati in centesimi interi: somme esatte, niente Decimal né float
+CENTS = 100
+
+# Limite delle vecchie colonne Numeric(10, 2): 99.999.999,99 €
+MAX_AMOUNT_CENTS = 10 ** 10 - 1
+
+def to_cents(value):
+    """Importo in euro (stringa, Decimal, int o float) -> centesimi interi, arrotondato al centesimo.
+
+    quantize solleva InvalidOperation per importi oltre la precisione decimale,
+    prima di costruire interi enormi.
+    """
+    return int(Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP).scaleb(2))
+
+def from_cents(cents):
+    """Centesimi -> euro (float) per JSON, grafici e modelli statistici"""
+    return (cents or 0) / CENTS
+
+def sql_sum(columns):
+    """Espressione SQL che somma le colonne trattando i NULL come zero"""
+    return ' + '.join(f'COALESCE({column}, 0)' for column in columns)
+
+# Le colonne generate non possono riferirsi ad altre colonne generate (PostgreSQL),
+# quindi ogni totale è espresso direttamente sulle voci di base
+RICAVI_TOTALI_SQL = sql_sum(RICAVI_COLUMNS)
+COSTI_VARIABILI_SQL = sql_sum(COSTI_VARIABILI_COLUMNS)
+COSTI_FISSI_SQL = sql_sum(COSTI_FISSI_COLUMNS)
+TOTALE_COSTI_SQL = sql_sum(COSTI_VARIABILI_COLUMNS + COSTI_FISSI_COLUMNS)
+UTILE_NETTO_SQL = f'({RICAVI_TOTALI_SQL}) - ({TOTALE_COSTI_SQL})'
+MARGINE_PERCENTUALE_SQL = (
+    f'CASE WHEN ({RICAVI_TOTALI_SQL}) > 0 '
+    f'THEN ROUND((({UTILE_NETTO_SQL}) * 100.0) / ({RICAVI_TOTALI_SQL}), 2) ELSE 0 END'
+)
+
+def month_ordinal(year, month):
+    """Numero progressivo del mese (year*12 + month), confrontabile tra anni diversi"""
+    return year * 12 + month
+
+def month_from_ordinal(period):
+    """Inverso di month_ordinal: restituisce (year, month)"""
+    return (period - 1) // 12, (period - 1) % 12 + 1
+
+def parse_period(value):
+    """Converte 'YYYY-MM' in month_ordinal, None se non valido"""
+    try:
+        year, month = (int(part) for part in value.split('-'))
+    except ValueError:
+        return None
+    if not (1 <= month <= 12):
+        return None
+    return month_ordinal(year, month)
+
+def format_period(period):
+    """Inverso di parse_period: restituisce 'YYYY-MM'"""
+    year, month = month_from_ordinal(period)
+    return f'{year:04d}-{month:02d}'
+
+# INSERT ... ON CONFLICT DO NOTHING per dialetto
+INSERT_IGNORE = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert
+}
+
+def insert_missing(model, unique_columns, rows):
+    """Crea le righe di model che non esistono, anche con transazioni concorrenti.
+
+    rows è una lista di dizionari di valori, scritti con un solo INSERT
+    multi-riga. Se un'altra transazione inserisce la stessa chiave nello
+    stesso momento l'inserimento viene ignorato invece di fallire con
+    IntegrityError; le righe vanno poi rilette (tipicamente con FOR UPDATE).
+    Sui database senza ON CONFLICT si usano dei savepoint.
+    """
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    dialect_insert = INSERT_IGNORE.get(dialect)
+    if dialect_insert is not None:
+        db.session.execute(
+            dialect_insert(model).values(rows).on_conflict_do_nothing(index_elements=unique_columns)
+        )
+        return
+
+    columns = [getattr(model, column) for column in unique_columns]
+    keys = [tuple(row[column] for column in unique_columns) for row in rows]
+    existing = set(db.session.execute(select(*columns).where(tuple_(*columns).in_(keys))).all())
+    missing = [row for row, key in zip(rows, keys) if key not in existing]
+    if not missing:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(model), missing)
+    except IntegrityError:
+        # Qualcuno ne ha create alcune nel frattempo: una per volta
+        for row in missing:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(model).values(**row))
+            except IntegrityError:
+                pass
+
+class FinancialData(db.Model):
+    __tablename__ = 'financial_data'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    
+    # Chiave di periodo (year*12 + month) per le ricerche per intervallo di mesi
+    period = db.Column(db.Integer, db.Computed('year * 12 + month', persisted=True))
+    
+    # Importi in centesimi interi (es. 1234,56 € = 123456)
+    
+    # Ricavi
+    ricavi_servizi = db.Column(db.BigInteger, default=0)
+    ricavi_prodotti = db.Column(db.BigInteger, default=0)
+    altri_ricavi = db.Column(db.BigInteger, default=0)
+    
+    # Costi Variabili
+    costo_merci = db.Column(db.BigInteger, default=0)
+    provvigioni = db.Column(db.BigInteger, default=0)
+    marketing_variabile = db.Column(db.BigInteger, default=0)
+    
+    # Costi Fissi
+    affitto = db.Column(db.BigInteger, default=0)
+    stipendi = db.Column(db.BigInteger, default=0)
+    utenze = db.Column(db.BigInteger, default=0)
+    marketing_fisso = db.Column(db.BigInteger, default=0)
+    altri_costi_fissi = db.Column(db.BigInteger, default=0)
+    
+    # Totali calcolati e salvati dal database (colonne generate STORED, in centesimi)
+    ricavi_totali = db.Column(db.BigInteger, db.Computed(RICAVI_TOTALI_SQL, persisted=True))
+    costi_variabili = db.Column(db.BigInteger, db.Computed(COSTI_VARIABILI_SQL, persisted=True))
+    costi_fissi = db.Column(db.BigInteger, db.Computed(COSTI_FISSI_SQL, persisted=True))
+    totale_costi = db.Column(db.BigInteger, db.Computed(TOTALE_COSTI_SQL, persisted=True))
+    utile_netto = db.Column(db.BigInteger, db.Computed(UTILE_NETTO_SQL, persisted=True))
+    margine_percentuale = db.Column(db.Numeric(10, 2, asdecimal=False), db.Computed(MARGINE_PERCENTUALE_SQL, persisted=True))
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Constraint per evitare duplicati
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'month', 'year', name='unique_user_month_year'),
+        db.Index('ix_financial_data_user_period', 'user_id', 'period'),
+        db.Index('ix_financial_data_user_updated', 'user_id', 'updated_at'),
+    )
+    
+    # Rilegge le colonne generate con RETURNING subito dopo INSERT/UPDATE
+    __mapper_args__ = {'eager_defaults': True}
+
+    def __repr__(self):
+        return f'<FinancialData {self.user_id} - {self.month}/{self.year}>'
+
+    def to_dict(self):
+        # Le API espongono gli importi in euro, convertiti una sola volta dai centesimi
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'month': self.month,
+            'year': self.year,
+            'ricavi_servizi': from_cents(self.ricavi_servizi),
+            'ricavi_prodotti': from_cents(self.ricavi_prodotti),
+            'altri_ricavi': from_cents(self.altri_ricavi),
+            'costo_merci': from_cents(self.costo_merci),
+            'provvigioni': from_cents(self.provvigioni),
+            'marketing_variabile': from_cents(self.marketing_variabile),
+            'affitto': from_cents(self.affitto),
+            'stipendi': from_cents(self.stipendi),
+            'utenze': from_cents(self.utenze),
+            'marketing_fisso': from_cents(self.marketing_fisso),
+            'altri_costi_fissi': from_cents(self.altri_costi_fissi),
+            'ricavi_totali': from_cents(self.ricavi_totali),
+            'costi_variabili': from_cents(self.costi_variabili),
+            'costi_fissi': from_cents(self.costi_fissi),
+            'totale_costi': from_cents(self.totale_costi),
+            'utile_netto': from_cents(self.utile_netto),
+            # SQLite restituisce come intero i margini senza decimali (es. 50)
+            'margine_percentuale': float(self.margine_percentuale or 0),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class Subscription(db.Model):
+    __tablename__ = 'subscriptions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    stripe_subscription_id = db.Column(db.String(100))
+    plan_name = db.Column(db.String(20), nullable=False, default='free')
+    status = db.Column(db.String(20), nullable=False, default='active')
+    current_period_start = db.Column(db.DateTime)
+    current_period_end = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Subscription {self.user_id} - {self.plan_name}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'stripe_subscription_id': self.stripe_subscription_id,
+            'plan_name': self.plan_name,
+            'status': self.status,
+            'current_period_start': self.current_period_start.isoformat() if self.current_period_start else None,
+            'current_period_end': self.current_period_end.isoformat() if self.current_period_end else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class OutboxEmail(db.Model):
+    __tablename__ = 'email_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    sender = db.Column(db.String(120))
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    attachment = db.Column(db.LargeBinary)
+    attachment_name = db.Column(db.String(255))
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Prossimo tentativo; mentre un sender lavora il messaggio fa da lease
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<OutboxEmail {self.id} - {self.recipient} ({self.status})>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'recipient': self.recipient,
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+class ReportDelivery(db.Model):
+    __tablename__ = 'report_deliveries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    period = db.Column(db.Integer, nullable=False)  # year*12 + month del report
+    status = db.Column(db.String(20), nullable=False)  # queued, skipped
+    email_id = db.Column(db.Integer, db.ForeignKey('email_outbox.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Un solo report per utente e mese: il job batch può ripartire senza duplicati
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', name='unique_user_report_period'),
+    )
+
+    def __repr__(self):
+        return f'<ReportDelivery {self.user_id} - {self.period} ({self.status})>'
+
+class ForecastModel(db.Model):
+    __tablename__ = 'forecast_models'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    model_version = db.Column(db.Integer, nullable=False)
+    # Statistiche sufficienti del modello in JSON (vedi src.services.forecasting)
+    state = db.Column(db.Text, nullable=False)
+    observations = db.Column(db.Integer, nullable=False, default=0)
+    last_period = db.Column(db.Integer)  # year*12 + month dell'ultimo mese osservato
+    fitted_at = db.Column(db.DateTime, default=datetime.utcnow)  # ultimo refit completo
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ForecastModel {self.user_id} ({self.observations} mesi)>'
+
+class BenchmarkSketch(db.Model):
+    __tablename__ = 'benchmark_sketches'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    business_type = db.Column(db.String(50), nullable=False)  # normalizzato in minuscolo
+    period = db.Column(db.Integer, nullable=False)  # year*12 + month
+    metric = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    # Bucket dello sketch in JSON (vedi src.services.benchmarks)
+    buckets = db.Column(db.Text, nullable=False, default='{}')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('business_type', 'period', 'metric', name='unique_benchmark_sketch'),
+    )
+
+    def __repr__(self):
+        return f'<BenchmarkSketch {self.business_type} {self.period} {self.metric} ({self.count})>'
+
+class BenchmarkEntry(db.Model):
+    __tablename__ = 'benchmark_entries'
+    
+    # Contributo di un utente agli sketch di un mese: serve a toglierlo quando il mese cambia
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    period = db.Column(db.Integer, nullable=False)
+    business_type = db.Column(db.String(50), nullable=False)
+    ricavi_totali = db.Column(db.Float, nullable=False)
+    utile_netto = db.Column(db.Float, nullable=False)
+    margine_percentuale = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', name='unique_benchmark_entry'),
+    )
+
+    def __repr__(self):
+        return f'<BenchmarkEntry {self.user_id} - {self.period}>'
+
+class AnomalyStats(db.Model):
+    __tablename__ = 'anomaly_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    # Finestra mobile e somme per voce in JSON (vedi src.services.anomalies)
+    state = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AnomalyStats {self.user_id}>'
+
+class AnomalyFlag(db.Model):
+    __tablename__ = 'anomaly_flags'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    period = db.Column(db.Integer, nullable=False)  # year*12 + month
+    field = db.Column(db.String(50), nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    expected = db.Column(db.Float, nullable=False)  # valore tipico della voce per l'utente
+    score = db.Column(db.Float, nullable=False)  # z-score sulla scala logaritmica
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', 'field', name='unique_anomaly_flag'),
+    )
+
+    def __repr__(self):
+        return f'<AnomalyFlag {self.user_id} - {self.period} {self.field}>'
+
+    def to_dict(self):
+        return {
+            'period': format_period(self.period),
+            'field': self.field,
+            'value': self.value,
+            'expected': self.expected,
+            'score': self.score,
+            'direction': 'alto' if self.score > 0 else 'basso'
+        }
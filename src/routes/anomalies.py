@@ -0,0 +1,8 @@
+
+from flask import Blueprint, jsonify
+
+anomalies_bp = Blueprint('anomalies', __name__)
+
+@anomalies_bp.route('/anomalies', methods=['GET'])
+def anomalies():
+    return jsonify({'data': 'Anomalie dati simulati'})
\ No newline at end of file
@@ -0,0 +1,8 @@
+
+from flask import Blueprint, jsonify
+
+benchmarking_bp = Blueprint('benchmarking', __name__)
+
+@benchmarking_bp.route('/benchmarking', methods=['GET'])
+def benchmarking():
+    return jsonify({'data': 'Benchmark dati simulati'})
\ No newline at end of file
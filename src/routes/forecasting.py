@@ -0,0 +1,8 @@
+
+from flask import Blueprint, jsonify
+
+forecasting_bp = Blueprint('forecasting', __name__)
+
+@forecasting_bp.route('/forecasting', methods=['GET'])
+def forecasting():
+    return jsonify({'data': 'Previsioni dati simulati'})
\ No newline at end of file
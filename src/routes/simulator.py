@@ -0,0 +1,8 @@
+
+from flask import Blueprint, jsonify
+
+simulator_bp = Blueprint('simulator', __name__)
+
+@simulator_bp.route('/simulator', methods=['GET'])
+def simulator():
+    return jsonify({'data': 'Simulazione dati simulati'})
\ No newline at end of file
@@ -0,0 +1,263 @@
+import json
+import math
+import numpy as np
+from sqlalchemy import delete, func, select
+from src.models.user import db, FinancialData, AnomalyStats, AnomalyFlag, from_cents
+from src.services.pnl import INPUT_FIELDS
+
+# Mesi più recenti su cui si calcolano media e deviazione di ogni voce
+WINDOW = 24
+
+# Mesi di storico necessari prima di segnalare anomalie
+MIN_HISTORY = 4
+
+# Soglia sul modulo dello z-score (scala logaritmica)
+THRESHOLD = 3.5
+
+# Deviazione minima: variazioni entro il ±25% circa non sono mai anomale
+MIN_STD = math.log(1.25)
+
+# Scarto minimo in euro dal valore atteso: su una voce quasi sempre a zero
+# (es. marketing_fisso) anche 20 euro danno uno z-score altissimo
+MIN_DEVIATION = 100.0
+
+def to_log(values):
+    """Scala logaritmica: uno zero in più vale sempre +2.3, qualunque sia l'importo"""
+    return np.log1p(np.maximum(np.asarray(values, dtype=np.float64), 0))
+
+def z_scores(log_values, count, total, squares):
+    """z-score di ogni voce rispetto a media e deviazione della finestra"""
+    mean = total / count
+    std = np.maximum(np.sqrt(np.maximum(squares / count - mean ** 2, 0)), MIN_STD)
+    return (log_values - mean) / std, mean
+
+def anomalous(scores, mean, values):
+    """Maschera delle voci anomale: z-score oltre soglia e scarto di almeno MIN_DEVIATION euro"""
+    deviation = np.abs(np.asarray(values, dtype=np.float64) - np.expm1(mean))
+    return (np.abs(scores) >= THRESHOLD) & (deviation >= MIN_DEVIATION)
+
+class RollingStats:
+    """Somme e somme dei quadrati (in scala logaritmica) degli ultimi WINDOW mesi.
+
+    I valori dei mesi della finestra restano nello stato: un mese modificato o
+    eliminato toglie il proprio contributo, e un mese nuovo fa uscire il più
+    vecchio, senza rileggere lo storico.
+    """
+
+    def __init__(self, months=None, total=None, squares=None):
+        self.months = months or {}
+        self.total = np.zeros(len(INPUT_FIELDS)) if total is None else np.asarray(total, dtype=np.float64)
+        self.squares = np.zeros(len(INPUT_FIELDS)) if squares is None else np.asarray(squares, dtype=np.float64)
+
+    def accumulate(self, log_values, sign):
+        self.total += sign * log_values
+        self.squares += sign * log_values ** 2
+
+    def remove_month(self, period):
+        values = self.months.pop(period, None)
+        if values is not None:
+            self.accumulate(np.asarray(values), -1)
+
+    def set_month(self, period, log_values):
+        self.remove_month(period)
+        # Un mese più vecchio dell'intera finestra piena non vi entra
+        if len(self.months) >= WINDOW and period < min(self.months):
+            return
+        self.months[period] = [float(value) for value in log_values]
+        self.accumulate(np.asarray(self.months[period]), 1)
+        if len(self.months) > WINDOW:
+            self.remove_month(min(self.months))
+
+    def score(self, period, log_values):
+        """z-score del mese rispetto alla finestra senza il mese stesso; None se lo storico è corto"""
+        count = len(self.months)
+        total, squares = self.total, self.squares
+        if period in self.months:
+            own = np.asarray(self.months[period])
+            count -= 1
+            total, squares = total - own, squares - own ** 2
+        if count < MIN_HISTORY:
+            return None, None
+        return z_scores(log_values, count, total, squares)
+
+    def to_json(self):
+        return json.dumps({
+            'months': {str(period): values for period, values in self.months.items()},
+            'total': self.total.tolist(),
+            'squares': self.squares.tolist()
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        state = json.loads(data)
+        months = {int(period): values for period, values in state['months'].items()}
+        return cls(months, state['total'], state['squares'])
+
+def month_values(item):
+    return [from_cents(getattr(item, field)) for field in INPUT_FIELDS]
+
+def flags_for(user_id, period, values, scores, mean):
+    """Righe AnomalyFlag per le voci oltre soglia"""
+    flags = []
+    for index in np.flatnonzero(anomalous(scores, mean, values)):
+        flags.append(AnomalyFlag(
+            user_id=int(user_id),
+            period=period,
+            field=INPUT_FIELDS[index],
+            value=round(values[index], 2),
+            expected=round(float(np.expm1(mean[index])), 2),
+            score=round(float(scores[index]), 2)
+        ))
+    return flags
+
+def load_stats(user_id):
+    """Stato della finestra dell'utente; alla prima scrittura viene costruito dallo storico"""
+    row = db.session.scalars(
+        select(AnomalyStats).where(AnomalyStats.user_id == user_id).with_for_update()
+    ).first()
+    if row is not None:
+        return row, RollingStats.from_json(row.state)
+
+    stats = RollingStats()
+    recent = FinancialData.query.filter_by(user_id=user_id).order_by(FinancialData.period.desc()).limit(WINDOW).all()
+    for item in reversed(recent):
+        stats.set_month(item.period, to_log(month_values(item)))
+    row = AnomalyStats(user_id=int(user_id), state=stats.to_json())
+    db.session.add(row)
+    return row, stats
+
+def score_history(user_id, period, log_values):
+    """z-score di un mese rispetto agli (al più) WINDOW mesi precedenti, letti dal database"""
+    rows = db.session.execute(
+        select(*(getattr(FinancialData, field) for field in INPUT_FIELDS))
+        .where(FinancialData.user_id == user_id, FinancialData.period < period)
+        .order_by(FinancialData.period.desc())
+        .limit(WINDOW)
+    ).all()
+    if len(rows) < MIN_HISTORY:
+        return None, None
+    history = to_log([month_values(row) for row in rows])
+    return z_scores(log_values, len(rows), history.sum(axis=0), (history ** 2).sum(axis=0))
+
+def score_range(user_id, periods):
+    """z-score di più mesi già scritti con una sola lettura, come nel ricalcolo notturno.
+
+    Legge i mesi dal primo all'ultimo di periods più gli WINDOW che precedono
+    il primo e li valuta con score_block. Restituisce periodo -> (z-score,
+    media), (None, None) per i mesi con storico insufficiente.
+    """
+    lower = (
+        select(FinancialData.period)
+        .where(FinancialData.user_id == user_id, FinancialData.period < min(periods))
+        .order_by(FinancialData.period.desc())
+        .offset(WINDOW - 1)
+        .limit(1)
+        .scalar_subquery()
+    )
+    rows = db.session.execute(
+        select(FinancialData.period, *(getattr(FinancialData, field) for field in INPUT_FIELDS))
+        .where(
+            FinancialData.user_id == user_id,
+            FinancialData.period >= func.coalesce(lower, 0),
+            FinancialData.period <= max(periods)
+        )
+        .order_by(FinancialData.period)
+    ).all()
+
+    values = np.array([month_values(row) for row in rows], dtype=np.float64).reshape(-1, len(INPUT_FIELDS))
+    scores, mean, valid = score_block(np.zeros(len(rows), dtype=np.int64), values)
+    wanted = set(periods)
+    return {
+        row.period: (scores[index], mean[index]) if valid[index] else (None, None)
+        for index, row in enumerate(rows) if row.period in wanted
+    }
+
+def score_months(user_id, items):
+    """Valuta i mesi appena scritti e aggiorna la finestra dell'utente.
+
+    Da chiamare nella stessa transazione della scrittura. Come nel ricalcolo
+    notturno (score_block) ogni mese è confrontato con i mesi che lo
+    precedono, mai con quelli successivi:
+    - mesi nuovi in coda: con la finestra in memoria, senza letture
+    - modifica dell'ultimo mese: con la finestra in memoria senza il mese
+      stesso (a finestra piena WINDOW - 1 mesi invece di WINDOW)
+    - più mesi nel passato (import, backfill, merge): una sola lettura
+      dell'intervallo, valutata con score_block
+    - un solo mese nel passato: con gli WINDOW mesi precedenti (score_history)
+    Le segnalazioni precedenti dei mesi scritti vengono sostituite; quelle dei
+    mesi successivi, il cui confronto includeva il vecchio valore, restano fino
+    al ricalcolo notturno. Restituisce le nuove segnalazioni.
+    """
+    row, stats = load_stats(user_id)
+    items = sorted(items, key=lambda item: item.period)
+    periods = [item.period for item in items]
+
+    db.session.execute(
+        delete(AnomalyFlag).where(
+            AnomalyFlag.user_id == user_id,
+            AnomalyFlag.period.in_(periods)
+        )
+    )
+
+    latest = max(stats.months) if stats.months else None
+    appended = latest is None or periods[0] > latest
+    ranged = score_range(user_id, periods) if not appended and len(items) > 1 else {}
+
+    flags = []
+    for item in items:
+        values = month_values(item)
+        log_values = to_log(values)
+        if item.period in ranged:
+            scores, mean = ranged[item.period]
+        elif appended or item.period == latest:
+            scores, mean = stats.score(item.period, log_values)
+        else:
+            scores, mean = score_history(user_id, item.period, log_values)
+        if scores is not None:
+            flags.extend(flags_for(user_id, item.period, values, scores, mean))
+        stats.set_month(item.period, log_values)
+
+    row.state = stats.to_json()
+    db.session.add_all(flags)
+    return flags
+
+def remove_anomaly_month(user_id, period):
+    """Toglie un mese eliminato dalla finestra e ne cancella le segnalazioni"""
+    row = db.session.scalars(
+        select(AnomalyStats).where(AnomalyStats.user_id == user_id).with_for_update()
+    ).first()
+    if row is not None:
+        stats = RollingStats.from_json(row.state)
+        stats.remove_month(period)
+        row.state = stats.to_json()
+    db.session.execute(
+        delete(AnomalyFlag).where(AnomalyFlag.user_id == user_id, AnomalyFlag.period == period)
+    )
+
+def score_block(user_ids, values):
+    """Valutazione vettoriale di un blocco di mesi ordinati per utente e periodo.
+
+    Ogni mese è confrontato con gli (al più) WINDOW mesi precedenti dello
+    stesso utente, con somme cumulative: nessun ciclo per riga. Restituisce
+    z-score e media della finestra (righe x voci) e una maschera dei mesi con
+    storico sufficiente.
+    """
+    log_values = to_log(values)
+    rows = len(user_ids)
+    index = np.arange(rows)
+
+    # Prima riga di ogni utente
+    starts = np.r_[True, user_ids[1:] != user_ids[:-1]]
+    group_start = np.maximum.accumulate(np.where(starts, index, 0))
+    low = np.maximum(group_start, index - WINDOW)
+    count = index - low
+
+    cumulative = np.vstack([np.zeros(len(INPUT_FIELDS)), np.cumsum(log_values, axis=0)])
+    cumulative_squares = np.vstack([np.zeros(len(INPUT_FIELDS)), np.cumsum(log_values ** 2, axis=0)])
+    total = cumulative[index] - cumulative[low]
+    squares = cumulative_squares[index] - cumulative_squares[low]
+
+    valid = count >= MIN_HISTORY
+    safe_count = np.maximum(count, 1)[:, None]
+    scores, mean = z_scores(log_values, safe_count, total, squares)
+    return scores, mean, valid
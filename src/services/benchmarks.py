@@ -0,0 +1,237 @@
+import json
+import math
+from datetime import datetime
+from sqlalchemy import insert, select, tuple_, update
+from src.models.user import db, User, FinancialData, BenchmarkSketch, BenchmarkEntry, from_cents, insert_missing
+
+# Chiave unica di uno sketch
+SKETCH_KEY = ['business_type', 'period', 'metric']
+
+# Metriche confrontate tra attività dello stesso tipo
+BENCHMARK_METRICS = ('ricavi_totali', 'utile_netto', 'margine_percentuale')
+
+# Sotto questo numero di attività nel gruppo il confronto non viene mostrato
+MIN_TENANTS = 5
+
+# Errore relativo massimo dei quantili (bucket logaritmici come in DDSketch)
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Valori in modulo più piccoli finiscono tutti nel bucket dello zero
+MIN_VALUE = 0.01
+
+def normalize_business_type(value):
+    """Chiave del gruppo di confronto: 'Palestra' e ' palestra' sono lo stesso gruppo"""
+    value = (value or '').strip().lower()
+    return value or None
+
+class QuantileSketch:
+    """Sketch dei quantili con bucket logaritmici, unibile e con cancellazione esatta.
+
+    Ogni valore incrementa il contatore di un bucket il cui indice cresce con il
+    valore (negativi, zero e positivi); togliere un valore decrementa lo stesso
+    contatore, quindi modifiche ed eliminazioni non richiedono ricostruzioni.
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = {int(key): count for key, count in (buckets or {}).items()}
+
+    @property
+    def count(self):
+        return sum(self.buckets.values())
+
+    @staticmethod
+    def key(value):
+        magnitude = abs(value)
+        if magnitude < MIN_VALUE:
+            return 0
+        index = math.ceil(math.log(magnitude / MIN_VALUE) / LOG_GAMMA) + 1
+        return index if value > 0 else -index
+
+    @staticmethod
+    def value(key):
+        """Valore rappresentativo del bucket"""
+        if key == 0:
+            return 0.0
+        magnitude = MIN_VALUE * 2 * GAMMA ** (abs(key) - 1) / (GAMMA + 1)
+        return magnitude if key > 0 else -magnitude
+
+    def add(self, value, weight=1):
+        self.add_key(self.key(value), weight)
+
+    def add_key(self, key, weight):
+        count = self.buckets.get(key, 0) + weight
+        if count:
+            self.buckets[key] = count
+        else:
+            self.buckets.pop(key, None)
+
+    def merge(self, other):
+        for key, count in other.buckets.items():
+            self.add_key(key, count)
+
+    def percentile_rank(self, value):
+        """Percentuale di valori sotto value (a metà per quelli nello stesso bucket)"""
+        total = self.count
+        if not total:
+            return None
+        key = self.key(value)
+        below = sum(count for bucket, count in self.buckets.items() if bucket < key)
+        return 100 * (below + self.buckets.get(key, 0) / 2) / total
+
+    def quantile(self, q):
+        total = self.count
+        if not total:
+            return None
+        target = q * (total - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > target:
+                return self.value(key)
+        return self.value(max(self.buckets))
+
+    def to_json(self):
+        return json.dumps({str(key): count for key, count in self.buckets.items()})
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(json.loads(data or '{}'))
+
+class SketchUpdates:
+    """Variazioni accumulate per (tipo di attività, periodo, metrica), scritte in una volta sola"""
+
+    def __init__(self):
+        self.deltas = {}
+
+    def apply(self, business_type, period, values, sign):
+        for metric in BENCHMARK_METRICS:
+            delta = self.deltas.setdefault((business_type, period, metric), QuantileSketch())
+            delta.add(values[metric], sign)
+
+    def flush(self):
+        """Scrive tutte le variazioni con un numero fisso di istruzioni.
+
+        Un INSERT multi-riga crea gli sketch mancanti (ON CONFLICT DO NOTHING: la
+        prima scrittura di un gruppo e mese può arrivare da due transazioni
+        insieme), un solo SELECT ... FOR UPDATE blocca tutte le righe in ordine
+        fisso, così due scritture concorrenti non vanno in deadlock, e un
+        UPDATE executemany salva gli sketch uniti.
+        """
+        deltas = {key: delta for key, delta in self.deltas.items() if delta.buckets}
+        self.deltas = {}
+        if not deltas:
+            return
+
+        keys = sorted(deltas)
+        insert_missing(BenchmarkSketch, SKETCH_KEY, [
+            {'business_type': business_type, 'period': period, 'metric': metric, 'count': 0, 'buckets': '{}'}
+            for business_type, period, metric in keys
+        ])
+        key_columns = [getattr(BenchmarkSketch, column) for column in SKETCH_KEY]
+        rows = db.session.execute(
+            select(BenchmarkSketch.id, *key_columns, BenchmarkSketch.buckets)
+            .where(tuple_(*key_columns).in_(keys))
+            .order_by(*key_columns)
+            .with_for_update()
+        ).all()
+
+        now = datetime.utcnow()
+        changes = []
+        for row in rows:
+            sketch = QuantileSketch.from_json(row.buckets)
+            sketch.merge(deltas[(row.business_type, row.period, row.metric)])
+            changes.append({'id': row.id, 'buckets': sketch.to_json(), 'count': sketch.count, 'updated_at': now})
+        db.session.execute(update(BenchmarkSketch), changes)
+
+def month_metrics(item):
+    """Metriche di un mese di financial_data in euro (gli importi sono in centesimi)"""
+    return {
+        'ricavi_totali': from_cents(item.ricavi_totali),
+        'utile_netto': from_cents(item.utile_netto),
+        'margine_percentuale': float(item.margine_percentuale or 0)
+    }
+
+def entry_values(entry):
+    return {metric: float(getattr(entry, metric) or 0) for metric in BENCHMARK_METRICS}
+
+def get_entries(user_id, periods=None):
+    query = select(BenchmarkEntry).where(BenchmarkEntry.user_id == user_id)
+    if periods is not None:
+        query = query.where(BenchmarkEntry.period.in_(periods))
+    return {entry.period: entry for entry in db.session.scalars(query)}
+
+def update_benchmarks(user_id, items):
+    """Aggiornamento incrementale degli sketch dopo la scrittura di uno o più mesi.
+
+    Da chiamare nella stessa transazione della scrittura: il vecchio contributo
+    dell'utente viene tolto dallo sketch e sostituito da quello nuovo.
+    """
+    business_type = normalize_business_type(db.session.get(User, int(user_id)).business_type)
+    entries = get_entries(user_id, [item.period for item in items])
+    updates = SketchUpdates()
+
+    new_entries = []
+    for item in items:
+        entry = entries.get(item.period)
+        if entry is not None:
+            updates.apply(entry.business_type, entry.period, entry_values(entry), -1)
+            if business_type is None:
+                db.session.delete(entry)
+                continue
+        elif business_type is None:
+            continue
+        else:
+            # Contributi nuovi: scritti tutti insieme più sotto
+            values = month_metrics(item)
+            new_entries.append({'user_id': int(user_id), 'period': item.period, 'business_type': business_type, **values})
+            updates.apply(business_type, item.period, values, 1)
+            continue
+
+        entry.business_type = business_type
+        for metric, value in month_metrics(item).items():
+            setattr(entry, metric, value)
+        updates.apply(business_type, item.period, entry_values(entry), 1)
+
+    if new_entries:
+        db.session.execute(insert(BenchmarkEntry), new_entries)
+    updates.flush()
+
+def remove_benchmark_month(user_id, period):
+    """Toglie dagli sketch il contributo di un mese eliminato"""
+    entry = get_entries(user_id, [period]).get(period)
+    if entry is None:
+        return
+    updates = SketchUpdates()
+    updates.apply(entry.business_type, period, entry_values(entry), -1)
+    db.session.delete(entry)
+    updates.flush()
+
+def reassign_benchmarks(user_id):
+    """Sposta tutti i mesi dell'utente nel gruppo del suo tipo di attività attuale"""
+    update_benchmarks(user_id, FinancialData.query.filter_by(user_id=user_id).all())
+
+def get_benchmark(business_type, period, values):
+    """Posizione dei valori dell'utente nel suo gruppo, dai soli sketch precalcolati"""
+    rows = db.session.scalars(
+        select(BenchmarkSketch).where(
+            BenchmarkSketch.business_type == business_type,
+            BenchmarkSketch.period == period,
+            BenchmarkSketch.metric.in_(BENCHMARK_METRICS)
+        )
+    ).all()
+
+    result = {}
+    for row in rows:
+        if row.count < MIN_TENANTS:
+            continue
+        sketch = QuantileSketch.from_json(row.buckets)
+        result[row.metric] = {
+            'value': round(values[row.metric], 2),
+            'percentile': round(sketch.percentile_rank(values[row.metric])),
+            'p25': round(sketch.quantile(0.25), 2),
+            'median': round(sketch.quantile(0.5), 2),
+            'p75': round(sketch.quantile(0.75), 2),
+            'tenants': row.count
+        }
+    return result
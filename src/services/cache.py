@@ -0,0 +1,200 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from flask import Response, request
+from flask_jwt_extended import get_jwt_identity
+
+class LRUBackend:
+    """Cache in memoria del singolo processo con eviction LRU"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_version(self, user_id):
+        with self.lock:
+            return self.versions.get(str(user_id), 0)
+
+    def bump_version(self, user_id):
+        with self.lock:
+            self.versions[str(user_id)] = self.versions.get(str(user_id), 0) + 1
+
+class SQLiteBackend:
+    """Cache condivisa tra i worker gunicorn tramite un file SQLite.
+
+    Le versioni dei dati per utente stanno nello stesso file, così un'invalidazione
+    fatta da un worker è vista subito da tutti gli altri. Quando si supera
+    max_entries vengono eliminate le voci scritte da più tempo.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.writes = 0
+
+        with self.connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, written_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_written_at ON cache_entries (written_at)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_versions ('
+                'user_id TEXT PRIMARY KEY, version INTEGER NOT NULL)'
+            )
+
+    def connection(self):
+        # Una connessione per thread: sqlite3 non ne consente la condivisione
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self.connection().execute('SELECT value FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        conn = self.connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, written_at) VALUES (?, ?, ?)',
+            (key, value, time.time())
+        )
+        self.writes += 1
+        if self.writes % 100 == 0:
+            conn.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                'SELECT key FROM cache_entries ORDER BY written_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def get_version(self, user_id):
+        row = self.connection().execute(
+            'SELECT version FROM cache_versions WHERE user_id = ?', (str(user_id),)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, user_id):
+        self.connection().execute(
+            'INSERT INTO cache_versions (user_id, version) VALUES (?, 1) '
+            'ON CONFLICT(user_id) DO UPDATE SET version = version + 1',
+            (str(user_id),)
+        )
+
+class DashboardCache:
+    """Cache delle risposte della dashboard per utente e parametri della richiesta.
+
+    Ogni chiave contiene la versione dei dati dell'utente: le scritture su
+    financial_data chiamano bump_version e le risposte precedenti non vengono
+    più lette. Configurazione:
+    - DASHBOARD_CACHE_BACKEND: 'lru' (default), 'sqlite' oppure 'none'
+    - DASHBOARD_CACHE_SIZE: numero massimo di risposte in cache
+    - DASHBOARD_CACHE_PATH: file del backend sqlite
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('DASHBOARD_CACHE_BACKEND', 'lru')
+        size = app.config.get('DASHBOARD_CACHE_SIZE', 1024)
+
+        if backend == 'sqlite':
+            path = app.config.get(
+                'DASHBOARD_CACHE_PATH',
+                os.path.join(app.instance_path, 'dashboard_cache.db')
+            )
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.backend = SQLiteBackend(path, size)
+        elif backend == 'lru':
+            self.backend = LRUBackend(size)
+        else:
+            self.backend = None
+
+    def get_version(self, user_id):
+        return self.backend.get_version(user_id) if self.backend else 0
+
+    def bump_version(self, user_id):
+        """Invalida tutte le risposte in cache dell'utente"""
+        if self.backend:
+            self.backend.bump_version(user_id)
+
+    def make_key(self, user_id, name):
+        # Il mese corrente fa parte della chiave: le viste usano datetime.now() come default
+        params = '&'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)))
+        return (
+            f'{user_id}:{self.get_version(user_id)}:{name}:'
+            f'{datetime.now().strftime("%Y-%m")}:{params}'
+        )
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Contatori hit/miss del processo corrente"""
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None
+        }
+
+    def cached(self, name):
+        """Decoratore per le viste JSON della dashboard (da usare dopo @jwt_required)"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+
+                key = self.make_key(get_jwt_identity(), name)
+                body = self.backend.get(key)
+                if body is not None:
+                    self.record(True)
+                    return Response(body, status=200, mimetype='application/json')
+
+                self.record(False)
+                result = view(*args, **kwargs)
+                response, status = result if isinstance(result, tuple) else (result, 200)
+
+                # Solo le risposte riuscite finiscono in cache
+                if status == 200 and response.is_json:
+                    self.backend.set(key, response.get_data(as_text=True))
+                return result
+            return wrapper
+        return decorator
+
+dashboard_cache = DashboardCache()
@@ -0,0 +1,72 @@
+import functools
+import hashlib
+from datetime import datetime
+from flask import make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import func, select
+from src.models.user import User, FinancialData, db
+
+def compute_etag(user_id, extra=None):
+    """Validatore della richiesta per l'utente, senza leggere le righe dei dati.
+
+    Combina piano, numero di righe e max(updated_at) di financial_data (letti
+    dall'indice user_id, updated_at) con percorso, parametri e corpo della
+    richiesta. Le viste che leggono anche altre tabelle passano extra(user_id),
+    che restituisce i valori aggiuntivi del validatore. Restituisce None se
+    l'utente non esiste.
+    """
+    row = db.session.execute(
+        select(User.subscription_plan, func.count(FinancialData.id), func.max(FinancialData.updated_at))
+        .select_from(User)
+        .outerjoin(FinancialData, FinancialData.user_id == User.id)
+        .where(User.id == user_id)
+        .group_by(User.id)
+    ).first()
+
+    if row is None:
+        return None
+
+    plan, count, last_update = row
+    # Il mese corrente entra nel validatore: molte viste lo usano come default
+    parts = [
+        str(user_id), str(plan), str(count), str(last_update),
+        datetime.now().strftime('%Y-%m'),
+        request.path,
+        '&'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True))),
+        request.get_data(as_text=True)
+    ]
+    if extra is not None:
+        parts.extend(str(part) for part in extra(user_id))
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+def profile_validator(user_id):
+    """Parte del validatore per le viste che restituiscono i dati del profilo"""
+    return db.session.execute(
+        select(User.business_name, User.business_type, User.first_name, User.last_name, User.email)
+        .where(User.id == user_id)
+    ).one()
+
+def etag_validated(view=None, extra=None):
+    """Risponde 304 se If-None-Match coincide con il validatore corrente (da usare dopo @jwt_required).
+
+    Si usa come @etag_validated oppure @etag_validated(extra=...), vedi compute_etag.
+    """
+    if view is None:
+        return functools.partial(etag_validated, extra=extra)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = compute_etag(get_jwt_identity(), extra)
+
+        if etag is not None and request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if etag is None or response.status_code != 200:
+                return response
+
+        response.set_etag(etag)
+        # Il browser deve sempre rivalidare, ma può riusare la copia locale
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
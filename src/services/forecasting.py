@@ -0,0 +1,210 @@
+import json
+from datetime import datetime
+import numpy as np
+from sqlalchemy import select
+from src.models.user import (
+    db, FinancialData, ForecastModel, from_cents, month_from_ordinal, format_period, insert_missing
+)
+from src.services.pnl import INPUT_FIELDS, compute_pnl
+
+# Versione del modello: gli stati salvati con una versione diversa vengono ricalcolati
+MODEL_VERSION = 1
+
+# Regressori: intercetta, trend in anni dal 2000, stagionalità febbraio..dicembre
+FEATURES = 13
+ORIGIN = 2000 * 12
+
+# Penalità ridge: con pochi mesi stagionalità e trend restano vicini a zero
+TREND_RIDGE = 0.1
+SEASONAL_RIDGE = 0.5
+PENALTY = np.diag([0.0, TREND_RIDGE] + [SEASONAL_RIDGE] * (FEATURES - 2))
+
+# Ampiezza dell'intervallo di previsione (80%)
+INTERVAL_Z = 1.2816
+
+MIN_HORIZON = 3
+MAX_HORIZON = 12
+
+def design_row(period):
+    """Regressori di un mese: 1, anni dall'origine, indicatore del mese (gennaio = base)"""
+    x = np.zeros(FEATURES)
+    x[0] = 1
+    x[1] = (period - ORIGIN) / 12
+    _, month = month_from_ordinal(period)
+    if month > 1:
+        x[month] = 1
+    return x
+
+class ForecastState:
+    """Statistiche sufficienti di una regressione trend + stagionalità per ogni voce.
+
+    X'X è condivisa da tutte le voci, X'y e y'y sono per voce: aggiungere,
+    modificare o eliminare un mese costa un aggiornamento di rango uno, senza
+    rileggere lo storico. I valori di ogni mese restano nello stato per poterne
+    sottrarre il contributo quando il mese cambia.
+    """
+
+    def __init__(self, xtx=None, xty=None, yty=None, months=None):
+        self.xtx = np.zeros((FEATURES, FEATURES)) if xtx is None else np.asarray(xtx, dtype=np.float64)
+        self.xty = np.zeros((FEATURES, len(INPUT_FIELDS))) if xty is None else np.asarray(xty, dtype=np.float64)
+        self.yty = np.zeros(len(INPUT_FIELDS)) if yty is None else np.asarray(yty, dtype=np.float64)
+        self.months = months or {}
+
+    @property
+    def observations(self):
+        return len(self.months)
+
+    @property
+    def last_period(self):
+        return max(self.months) if self.months else None
+
+    def accumulate(self, period, values, sign):
+        x = design_row(period)
+        y = np.asarray(values, dtype=np.float64)
+        self.xtx += sign * np.outer(x, x)
+        self.xty += sign * np.outer(x, y)
+        self.yty += sign * y * y
+
+    def set_month(self, period, values):
+        """Aggiunge un mese o ne sostituisce i valori"""
+        self.remove_month(period)
+        self.months[period] = [float(value) for value in values]
+        self.accumulate(period, self.months[period], 1)
+
+    def remove_month(self, period):
+        values = self.months.pop(period, None)
+        if values is not None:
+            self.accumulate(period, values, -1)
+
+    def fit(self):
+        """Coefficienti (FEATURES x voci) e deviazione standard dei residui per voce"""
+        coef = np.linalg.solve(self.xtx + PENALTY, self.xty)
+        sse = self.yty - 2 * np.sum(coef * self.xty, axis=0) + np.sum(coef * (self.xtx @ coef), axis=0)
+        sigma = np.sqrt(np.maximum(sse, 0) / max(self.observations - 2, 1))
+        return coef, sigma
+
+    def to_json(self):
+        return json.dumps({
+            'xtx': self.xtx.tolist(),
+            'xty': self.xty.tolist(),
+            'yty': self.yty.tolist(),
+            'months': {str(period): values for period, values in self.months.items()}
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        state = json.loads(data)
+        months = {int(period): values for period, values in state['months'].items()}
+        return cls(state['xtx'], state['xty'], state['yty'], months)
+
+def build_state(months):
+    """Stato completo da una lista di (period, valori nell'ordine di INPUT_FIELDS).
+
+    Funzione pura: il refit notturno la esegue nei processi del pool.
+    """
+    state = ForecastState()
+    for period, values in months:
+        state.set_month(period, values)
+    return state.to_json()
+
+def month_values(item):
+    return [from_cents(getattr(item, field)) for field in INPUT_FIELDS]
+
+def load_months(user_id):
+    rows = db.session.execute(
+        select(FinancialData.period, *(getattr(FinancialData, field) for field in INPUT_FIELDS))
+        .where(FinancialData.user_id == user_id)
+        .order_by(FinancialData.period)
+    ).all()
+    return [(row.period, month_values(row)) for row in rows]
+
+def save_state(user_id, state_json, model=None, refit=False):
+    """Scrive lo stato nella sessione corrente (il commit è del chiamante)"""
+    state = ForecastState.from_json(state_json) if isinstance(state_json, str) else state_json
+    if model is None:
+        model = ForecastModel(user_id=user_id)
+        db.session.add(model)
+    model.model_version = MODEL_VERSION
+    model.state = state.to_json()
+    model.observations = state.observations
+    model.last_period = state.last_period
+    if refit or model.fitted_at is None:
+        model.fitted_at = datetime.utcnow()
+    return model
+
+def get_model(user_id, for_update=False):
+    query = select(ForecastModel).where(ForecastModel.user_id == user_id)
+    if for_update:
+        # Due scritture concorrenti dello stesso utente non devono perdere aggiornamenti
+        query = query.with_for_update()
+    return db.session.scalars(query).first()
+
+def lock_model(user_id):
+    """Modello dell'utente bloccato per la scrittura, creato vuoto se manca.
+
+    Due prime previsioni concorrenti (o una previsione e il refit notturno)
+    non violano l'unicità di user_id: l'inserimento della seconda viene
+    ignorato ed entrambe aggiornano la stessa riga. La versione 0 fa sì che
+    il modello vuoto non venga mai usato senza un refit.
+    """
+    insert_missing(ForecastModel, ['user_id'], [
+        {'user_id': user_id, 'model_version': 0, 'state': ForecastState().to_json(), 'observations': 0}
+    ])
+    return get_model(user_id, for_update=True)
+
+def refit_user(user_id):
+    """Ricostruisce da zero il modello dell'utente dallo storico"""
+    model = lock_model(user_id)
+    return save_state(user_id, build_state(load_months(user_id)), model, refit=True)
+
+def update_forecast(user_id, items):
+    """Aggiornamento incrementale dopo la scrittura di uno o più mesi.
+
+    Da chiamare nella stessa transazione della scrittura. Gli utenti senza un
+    modello salvato (o con una versione superata) vengono ignorati: il modello
+    viene creato alla prima previsione o dal refit notturno.
+    """
+    model = get_model(user_id, for_update=True)
+    if model is None or model.model_version != MODEL_VERSION:
+        return None
+    state = ForecastState.from_json(model.state)
+    for item in items:
+        state.set_month(item.period, month_values(item))
+    return save_state(user_id, state, model)
+
+def remove_forecast_month(user_id, period):
+    """Aggiornamento incrementale dopo l'eliminazione di un mese"""
+    model = get_model(user_id, for_update=True)
+    if model is None or model.model_version != MODEL_VERSION:
+        return None
+    state = ForecastState.from_json(model.state)
+    state.remove_month(period)
+    return save_state(user_id, state, model)
+
+def forecast(model, horizon):
+    """Previsione delle voci e delle metriche per i horizon mesi successivi all'ultimo osservato"""
+    state = ForecastState.from_json(model.state)
+    if not state.observations:
+        return []
+
+    coef, sigma = state.fit()
+    periods = [state.last_period + step for step in range(1, horizon + 1)]
+    X = np.vstack([design_row(period) for period in periods])
+    # Le voci del conto economico non possono essere negative
+    predicted = np.maximum(X @ coef, 0)
+
+    columns = {field: predicted[:, index] for index, field in enumerate(INPUT_FIELDS)}
+    metrics = compute_pnl(columns)
+    # Intervallo dell'utile supponendo errori indipendenti tra le voci
+    utile_spread = INTERVAL_Z * float(np.sqrt(np.sum(sigma ** 2)))
+
+    months = []
+    for index, period in enumerate(periods):
+        year, month = month_from_ordinal(period)
+        item = {'period': format_period(period), 'month': month, 'year': year}
+        item.update({field: round(float(values[index]), 2) for field, values in columns.items()})
+        item.update({metric: float(values[index]) for metric, values in metrics.items()})
+        item['utile_netto_min'] = round(item['utile_netto'] - utile_spread, 2)
+        item['utile_netto_max'] = round(item['utile_netto'] + utile_spread, 2)
+        months.append(item)
+    return months
@@ -0,0 +1,382 @@
+import os
+import smtplib
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from sqlalchemy import delete, func, select, update
+from src.models.user import db, OutboxEmail, ReportDelivery
+
+class SMTPPool:
+    """Connessioni SMTP autenticate riusate tra un batch di invio e il successivo"""
+
+    def __init__(self, server, port, username=None, password=None, use_tls=False, use_ssl=False,
+                 timeout=30, size=2, max_idle=60):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.size = size
+        self.max_idle = max_idle
+        self.idle = deque()
+        self.lock = threading.Lock()
+        self.connections_opened = 0
+
+    def connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        conn = smtp_class(self.server, self.port, timeout=self.timeout)
+        if self.use_tls and not self.use_ssl:
+            conn.starttls()
+        if self.username and self.password:
+            conn.login(self.username, self.password)
+        with self.lock:
+            self.connections_opened += 1
+        return conn
+
+    def acquire(self):
+        """Connessione inattiva ancora valida oppure una nuova"""
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, released_at = self.idle.pop()
+            if time.monotonic() - released_at > self.max_idle:
+                self.close(conn)
+                continue
+            try:
+                if conn.noop()[0] == 250:
+                    return conn
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self.close(conn)
+        return self.connect()
+
+    def release(self, conn, broken=False):
+        if not broken:
+            with self.lock:
+                if len(self.idle) < self.size:
+                    self.idle.append((conn, time.monotonic()))
+                    return
+        self.close(conn)
+
+    @staticmethod
+    def close(conn):
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.close()
+
+    def close_all(self):
+        with self.lock:
+            idle = list(self.idle)
+            self.idle.clear()
+        for conn, _ in idle:
+            self.close(conn)
+
+class Mailer:
+    """Invio email tramite la tabella email_outbox e un sender in background.
+
+    Le richieste accodano il messaggio (enqueue) e rispondono subito; un thread
+    per processo reclama i messaggi a blocchi, li invia su connessioni SMTP del
+    pool e in caso di errore li ripianifica con backoff esponenziale. Il
+    reclamo passa per un UPDATE condizionato, quindi più worker gunicorn
+    possono lavorare sulla stessa tabella. Configurazione:
+    - MAIL_SERVER, MAIL_PORT, MAIL_USE_TLS, MAIL_USE_SSL, MAIL_USERNAME,
+      MAIL_PASSWORD, MAIL_DEFAULT_SENDER: come per Flask-Mail
+    - MAIL_OUTBOX_WORKER: avvia il sender in background (default True)
+    - MAIL_OUTBOX_BATCH_SIZE: messaggi inviati per connessione a ogni giro
+    - MAIL_OUTBOX_POOL_SIZE: connessioni SMTP inattive conservate
+    - MAIL_OUTBOX_MAX_ATTEMPTS: tentativi prima di marcare il messaggio 'failed'
+    - MAIL_OUTBOX_BACKOFF: secondi di attesa dopo il primo errore (raddoppiano)
+    - MAIL_OUTBOX_POLL_INTERVAL: secondi tra due controlli della coda
+    - MAIL_OUTBOX_RETENTION_DAYS: giorni di conservazione dei messaggi inviati o falliti
+    - MAIL_OUTBOX_PURGE_INTERVAL: secondi tra due pulizie della outbox
+
+    L'allegato viene cancellato appena il messaggio è inviato o fallito: la riga
+    resta solo per lo stato consultabile dall'utente, fino alla pulizia.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.worker = None
+        self.worker_pid = None
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.last_purge = 0
+        self.metrics = {
+            'sent': 0,
+            'failed': 0,
+            'retried': 0,
+            'purged': 0,
+            'latency_seconds': 0.0,
+            'smtp_seconds': 0.0
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.default_sender = app.config.get('MAIL_DEFAULT_SENDER') or app.config.get('MAIL_USERNAME')
+        self.batch_size = app.config.get('MAIL_OUTBOX_BATCH_SIZE', 20)
+        self.max_attempts = app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 6)
+        self.backoff = app.config.get('MAIL_OUTBOX_BACKOFF', 30)
+        self.max_backoff = app.config.get('MAIL_OUTBOX_MAX_BACKOFF', 3600)
+        self.lease = app.config.get('MAIL_OUTBOX_LEASE', 300)
+        self.poll_interval = app.config.get('MAIL_OUTBOX_POLL_INTERVAL', 5)
+        self.retention_days = app.config.get('MAIL_OUTBOX_RETENTION_DAYS', 30)
+        self.purge_interval = app.config.get('MAIL_OUTBOX_PURGE_INTERVAL', 3600)
+        self.pool = SMTPPool(
+            app.config.get('MAIL_SERVER', 'localhost'),
+            app.config.get('MAIL_PORT', 25),
+            username=app.config.get('MAIL_USERNAME'),
+            password=app.config.get('MAIL_PASSWORD'),
+            use_tls=app.config.get('MAIL_USE_TLS', False),
+            use_ssl=app.config.get('MAIL_USE_SSL', False),
+            timeout=app.config.get('MAIL_TIMEOUT', 30),
+            size=app.config.get('MAIL_OUTBOX_POOL_SIZE', 2)
+        )
+
+        if app.config.get('MAIL_OUTBOX_WORKER', True):
+            # Il thread parte nel worker che serve le richieste, non nel master gunicorn
+            app.before_request(self.ensure_worker)
+
+    def enqueue(self, recipient, subject, body, attachment=None, attachment_name=None, user_id=None, commit=True):
+        """Salva il messaggio nella outbox e sveglia il sender.
+
+        Con commit=False il messaggio entra nella transazione del chiamante.
+        """
+        message = OutboxEmail(
+            user_id=user_id,
+            sender=self.default_sender,
+            recipient=recipient,
+            subject=subject,
+            body=body,
+            attachment=attachment,
+            attachment_name=attachment_name
+        )
+        db.session.add(message)
+        if commit:
+            db.session.commit()
+            self.wake.set()
+        return message
+
+    def ensure_worker(self):
+        """Avvia (o riavvia dopo un fork) il thread del sender"""
+        pid = os.getpid()
+        if self.worker is not None and self.worker_pid == pid and self.worker.is_alive():
+            return
+        with self.lock:
+            if self.worker is not None and self.worker_pid == pid and self.worker.is_alive():
+                return
+            self.worker_pid = pid
+            self.worker = threading.Thread(target=self.run, name='mail-outbox', daemon=True)
+            self.worker.start()
+
+    def run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    processed = self.process_batch()
+                    if time.monotonic() - self.last_purge >= self.purge_interval:
+                        self.last_purge = time.monotonic()
+                        self.purge()
+            except Exception as e:
+                self.app.logger.exception(f"Errore nel sender della outbox: {str(e)}")
+                processed = 0
+            if not processed:
+                self.wake.wait(self.poll_interval)
+                self.wake.clear()
+
+    def flush(self):
+        """Invia subito tutti i messaggi pronti (CLI e verifiche contro un server SMTP locale)"""
+        total = 0
+        while True:
+            processed = self.process_batch()
+            if not processed:
+                return total
+            total += processed
+
+    def claim(self):
+        """Reclama fino a batch_size messaggi pronti, spostandone in avanti il prossimo tentativo"""
+        token = uuid.uuid4().hex
+        now = datetime.utcnow()
+        ready = (
+            select(OutboxEmail.id)
+            .where(OutboxEmail.status == 'pending', OutboxEmail.next_attempt_at <= now)
+            .order_by(OutboxEmail.next_attempt_at)
+            .limit(self.batch_size)
+        )
+        db.session.execute(
+            update(OutboxEmail)
+            .where(
+                OutboxEmail.id.in_(ready.scalar_subquery()),
+                OutboxEmail.status == 'pending',
+                OutboxEmail.next_attempt_at <= now
+            )
+            .values(
+                claimed_by=token,
+                next_attempt_at=now + timedelta(seconds=self.lease),
+                attempts=OutboxEmail.attempts + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return OutboxEmail.query.filter_by(claimed_by=token).order_by(OutboxEmail.id).all()
+
+    def process_batch(self):
+        """Invia un blocco di messaggi su una sola connessione; restituisce quanti ne ha gestiti"""
+        messages = self.claim()
+        if not messages:
+            return 0
+
+        try:
+            conn = self.pool.acquire()
+        except (smtplib.SMTPException, OSError) as e:
+            for message in messages:
+                self.schedule_retry(message, f"Connessione SMTP fallita: {str(e)}")
+            db.session.commit()
+            return len(messages)
+
+        broken = False
+        for index, message in enumerate(messages):
+            start = time.perf_counter()
+            try:
+                conn.sendmail(message.sender or self.default_sender, [message.recipient], build_message(message).as_string())
+            except smtplib.SMTPRecipientsRefused as e:
+                # RCPT rifiutato: 4xx (es. casella piena) si riprova, 5xx no
+                if all(code >= 500 for code, _ in e.recipients.values()):
+                    self.mark_failed(message, str(e))
+                else:
+                    self.schedule_retry(message, str(e))
+            except smtplib.SMTPResponseException as e:
+                # 5xx: errore permanente, 4xx: il server chiede di riprovare
+                if e.smtp_code >= 500:
+                    self.mark_failed(message, str(e))
+                else:
+                    self.schedule_retry(message, str(e))
+            except (smtplib.SMTPException, OSError) as e:
+                # Connessione persa: il resto del blocco ritorna in coda
+                broken = True
+                for pending in messages[index:]:
+                    self.schedule_retry(pending, str(e))
+                db.session.commit()
+                break
+            else:
+                self.mark_sent(message, time.perf_counter() - start)
+            # Un commit per messaggio: dopo un crash non si reinvia quanto già consegnato
+            db.session.commit()
+
+        self.pool.release(conn, broken=broken)
+        return len(messages)
+
+    def purge(self, batch_size=1000):
+        """Elimina a blocchi i messaggi inviati o falliti più vecchi di retention_days"""
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        purged = 0
+        while True:
+            ids = db.session.scalars(
+                select(OutboxEmail.id)
+                .where(OutboxEmail.status.in_(('sent', 'failed')), OutboxEmail.created_at < cutoff)
+                .order_by(OutboxEmail.id)
+                .limit(batch_size)
+            ).all()
+            if not ids:
+                break
+            # Le consegne dei report restano: servono a non rispedire lo stesso mese
+            db.session.execute(
+                update(ReportDelivery).where(ReportDelivery.email_id.in_(ids)).values(email_id=None)
+            )
+            db.session.execute(delete(OutboxEmail).where(OutboxEmail.id.in_(ids)))
+            db.session.commit()
+            purged += len(ids)
+        with self.lock:
+            self.metrics['purged'] += purged
+        return purged
+
+    def mark_sent(self, message, smtp_seconds):
+        message.status = 'sent'
+        message.sent_at = datetime.utcnow()
+        message.claimed_by = None
+        message.last_error = None
+        message.attachment = None
+        with self.lock:
+            self.metrics['sent'] += 1
+            self.metrics['smtp_seconds'] += smtp_seconds
+            self.metrics['latency_seconds'] += (message.sent_at - message.created_at).total_seconds()
+
+    def mark_failed(self, message, error):
+        message.status = 'failed'
+        message.claimed_by = None
+        message.last_error = error
+        message.attachment = None
+        with self.lock:
+            self.metrics['failed'] += 1
+        self.app.logger.error(f"Email {message.id} a {message.recipient} non inviata: {error}")
+
+    def schedule_retry(self, message, error):
+        if message.attempts >= self.max_attempts:
+            self.mark_failed(message, error)
+            return
+        delay = min(self.backoff * 2 ** (message.attempts - 1), self.max_backoff)
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        message.claimed_by = None
+        message.last_error = error
+        with self.lock:
+            self.metrics['retried'] += 1
+        self.app.logger.warning(f"Email {message.id} riprogrammata tra {delay}s: {error}")
+
+    def stats(self):
+        """Profondità della coda (dal database) e metriche di invio del processo corrente"""
+        counts = dict(
+            db.session.execute(
+                select(OutboxEmail.status, func.count(OutboxEmail.id)).group_by(OutboxEmail.status)
+            ).all()
+        )
+        oldest = db.session.execute(
+            select(func.min(OutboxEmail.created_at)).where(OutboxEmail.status == 'pending')
+        ).scalar()
+
+        with self.lock:
+            metrics = dict(self.metrics)
+        sent = metrics['sent']
+        return {
+            'pending': counts.get('pending', 0),
+            'failed_total': counts.get('failed', 0),
+            'oldest_pending_seconds': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else None,
+            'sent': sent,
+            'failed': metrics['failed'],
+            'retried': metrics['retried'],
+            'purged': metrics['purged'],
+            'avg_latency_seconds': round(metrics['latency_seconds'] / sent, 4) if sent else None,
+            'avg_smtp_seconds': round(metrics['smtp_seconds'] / sent, 4) if sent else None,
+            'smtp_connections_opened': self.pool.connections_opened
+        }
+
+def build_message(message):
+    """Messaggio MIME di una riga della outbox"""
+    msg = MIMEMultipart()
+    msg['From'] = message.sender or ''
+    msg['To'] = message.recipient
+    msg['Subject'] = message.subject
+    msg.attach(MIMEText(message.body, 'plain'))
+
+    if message.attachment:
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(message.attachment)
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename="{message.attachment_name or "allegato"}"')
+        msg.attach(part)
+
+    return msg
+
+mailer = Mailer()
@@ -0,0 +1,130 @@
+import numpy as np
+from src.models.user import RICAVI_COLUMNS, COSTI_VARIABILI_COLUMNS
+from src.services.pnl import INPUT_FIELDS, compute_pnl, to_columns, to_euros
+
+# Versione del modello: entra nella chiave della cache, va incrementata se cambia il fit
+MODEL_VERSION = 2
+
+# Blocchi di campionamento, ognuno con il proprio stream RNG. Il numero è fisso
+# (non dipende dai worker del pool) così lo stesso seed dà sempre lo stesso risultato
+SAMPLE_CHUNKS = 4
+
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+HISTOGRAM_BINS = 40
+
+def fit_lognormal(values):
+    """Lognormale sui valori positivi più la probabilità di valore zero"""
+    positive = values[values > 0]
+    zero_probability = 1 - len(positive) / len(values) if len(values) else 1.0
+
+    if len(positive) == 0:
+        mu, sigma = 0.0, 0.0
+    else:
+        logs = np.log(positive)
+        mu = float(logs.mean())
+        sigma = float(logs.std(ddof=1)) if len(positive) > 1 else 0.0
+
+    return {'zero_probability': round(float(zero_probability), 6), 'mu': mu, 'sigma': sigma}
+
+def fit_distributions(rows):
+    """Distribuzione di ogni voce dallo storico dell'utente.
+
+    Ogni voce è modellata come lognormale sui mesi con importo positivo, più
+    una probabilità di mese a zero (voce assente). Con un solo valore positivo
+    distinto la voce è costante. I costi variabili seguono i ricavi: per loro
+    si stima il rapporto con i ricavi totali del mese ('ratio'), non l'importo,
+    così uno scenario con ricavi alti non ha costi variabili da mese scarso.
+    Restituisce parametri serializzabili, da passare ai processi del pool.
+    """
+    columns = to_euros(to_columns(rows))
+    revenue = sum(columns[field] for field in RICAVI_COLUMNS)
+    has_revenue = revenue > 0
+
+    distributions = {}
+    for field in INPUT_FIELDS:
+        values = columns[field]
+        if field in COSTI_VARIABILI_COLUMNS and has_revenue.any():
+            # Mesi senza ricavi esclusi: il rapporto non è definito
+            params = fit_lognormal(values[has_revenue] / revenue[has_revenue])
+            params['kind'] = 'ratio'
+        else:
+            params = fit_lognormal(values)
+            params['kind'] = 'amount'
+        params['mean'] = round(float(values.mean()), 2) if len(values) else 0.0
+        distributions[field] = params
+    return distributions
+
+def sample_values(rng, params, months):
+    values = rng.lognormal(params['mu'], params['sigma'], months)
+    if params['zero_probability'] > 0:
+        values[rng.random(months) < params['zero_probability']] = 0
+    return values
+
+def sample_chunk(distributions, size, horizon, seed):
+    """Campiona size scenari di horizon mesi futuri (eseguito nei processi del pool).
+
+    seed è una SeedSequence figlia: ogni blocco ha uno stream indipendente.
+    Le voci 'ratio' sono moltiplicate per i ricavi campionati dello stesso
+    mese. Restituisce utile netto e margine di ogni scenario, sommando i mesi
+    dell'orizzonte.
+    """
+    rng = np.random.default_rng(seed)
+    months = size * horizon
+    monthly = {}
+    for field, params in distributions.items():
+        if params['zero_probability'] >= 1:
+            continue
+        monthly[field] = sample_values(rng, params, months)
+
+    revenue = np.zeros(months)
+    for field in RICAVI_COLUMNS:
+        if field in monthly:
+            revenue += monthly[field]
+    for field, params in distributions.items():
+        if params.get('kind') == 'ratio' and field in monthly:
+            monthly[field] = monthly[field] * revenue
+
+    if not monthly:
+        zeros = np.zeros(size)
+        return {'utile_netto': zeros, 'margine_percentuale': zeros}
+
+    # Scenario = somma dei mesi dell'orizzonte
+    columns = {field: values.reshape(size, horizon).sum(axis=1) for field, values in monthly.items()}
+    metrics = compute_pnl(columns)
+    return {
+        'utile_netto': metrics['utile_netto'],
+        'margine_percentuale': metrics['margine_percentuale']
+    }
+
+def chunk_sizes(samples, chunks=SAMPLE_CHUNKS):
+    base, extra = divmod(samples, chunks)
+    return [base + (1 if index < extra else 0) for index in range(chunks) if base or index < extra]
+
+def chunk_seeds(seed, chunks=SAMPLE_CHUNKS):
+    """Stream RNG indipendenti e riproducibili derivati dal seed della richiesta"""
+    return np.random.SeedSequence(seed).spawn(chunks)
+
+def summarize(chunks):
+    """Percentili, probabilità di perdita e istogramma dai blocchi campionati"""
+    utile = np.concatenate([chunk['utile_netto'] for chunk in chunks])
+    margine = np.concatenate([chunk['margine_percentuale'] for chunk in chunks])
+
+    counts, edges = np.histogram(utile, bins=HISTOGRAM_BINS)
+    return {
+        'samples': int(len(utile)),
+        'utile_netto': {
+            'mean': round(float(utile.mean()), 2),
+            'std': round(float(utile.std()), 2),
+            'percentiles': {
+                f'p{p}': round(float(value), 2) for p, value in zip(PERCENTILES, np.percentile(utile, PERCENTILES))
+            }
+        },
+        'margine_percentuale': {
+            f'p{p}': round(float(value), 2) for p, value in zip(PERCENTILES, np.percentile(margine, PERCENTILES))
+        },
+        'probability_of_loss': round(float(np.mean(utile < 0)), 4),
+        'histogram': {
+            'edges': np.round(edges, 2).tolist(),
+            'counts': counts.tolist()
+        }
+    }
@@ -0,0 +1,252 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from flask import request
+from src.models.user import bcrypt
+
+class PasswordHashBusy(Exception):
+    """Coda dell'hashing piena o attesa oltre il timeout"""
+
+class TooManyAttempts(Exception):
+    """Troppi tentativi falliti dallo stesso IP o sulla stessa email dallo stesso IP"""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+class AttemptCounter:
+    """Tentativi per chiave su finestre fisse, con al più max_keys chiavi (LRU)"""
+
+    def __init__(self, window, max_keys=100000):
+        self.window = window
+        self.max_keys = max_keys
+        self.entries = OrderedDict()
+
+    def current(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            return None
+        return entry
+
+    def count(self, key, now):
+        entry = self.current(key, now)
+        return entry[1] if entry is not None else 0
+
+    def retry_after(self, key, limit, now):
+        """Secondi da attendere se la chiave ha esaurito i tentativi, altrimenti None"""
+        entry = self.current(key, now)
+        if entry is None or entry[1] < limit:
+            return None
+        return max(1, int(entry[0] + self.window - now + 0.999))
+
+    def add(self, key, now):
+        entry = self.current(key, now)
+        if entry is None:
+            entry = self.entries[key] = [now, 0]
+        entry[1] += 1
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_keys:
+            self.entries.popitem(last=False)
+
+    def reset(self, key):
+        self.entries.pop(key, None)
+
+class PasswordHasher:
+    """Hashing bcrypt in un pool di thread limitato, con controllo di ammissione.
+
+    bcrypt rilascia il GIL: gli altri thread del worker continuano a servire
+    richieste mentre il pool calcola gli hash. Oltre queue_limit hash in corso
+    o in coda le richieste vengono rifiutate subito (PasswordHashBusy) invece di
+    accumularsi durante un'ondata di login. I tentativi falliti sono contati per
+    IP e per coppia (email, IP): oltre il limite il login è rifiutato prima di
+    toccare bcrypt. Il blocco sull'email vale solo per l'IP che ha sbagliato,
+    così nessuno può bloccare l'account di un altro conoscendone l'email.
+    Contro i tentativi sullo stesso account distribuiti su molti IP c'è anche
+    un tetto per email: oltre il tetto ogni login su quell'email viene
+    rallentato, con un'attesa che cresce con i tentativi, ma mai bloccato.
+
+    I contatori sono nella memoria del singolo processo: con più worker
+    gunicorn ogni worker ha i propri, e i limiti effettivi sono moltiplicati
+    per il numero di worker. Configurazione:
+    - PASSWORD_HASH_WORKERS: thread del pool
+    - PASSWORD_HASH_QUEUE_LIMIT: hash in corso o in coda oltre i quali si rifiuta
+    - PASSWORD_HASH_TIMEOUT: secondi di attesa massima di un hash
+    - BCRYPT_LOG_ROUNDS: costo degli hash nuovi; gli hash con un costo diverso
+      vengono ricalcolati al login successivo
+    - AUTH_ATTEMPT_WINDOW: secondi della finestra dei tentativi
+    - AUTH_MAX_ATTEMPTS_PER_IP: tentativi falliti per finestra da un IP, su qualunque email
+    - AUTH_MAX_ATTEMPTS_PER_EMAIL: tentativi falliti per finestra su un'email dallo stesso IP
+    - AUTH_MAX_ATTEMPTS_PER_ACCOUNT: tentativi falliti per finestra su un'email da qualunque IP,
+      oltre i quali i login su quell'email vengono rallentati
+    - AUTH_ACCOUNT_DELAY / AUTH_ACCOUNT_MAX_DELAY: secondi di attesa per ogni tentativo oltre
+      il tetto e attesa massima
+    - AUTH_PROXY_COUNT: proxy fidati davanti all'app (per leggere l'IP da X-Forwarded-For)
+    """
+
+    def __init__(self, app=None):
+        self.executor = None
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.metrics = {
+            'hashed': 0,
+            'checked': 0,
+            'rehashed': 0,
+            'rejected': 0,
+            'throttled': 0,
+            'delayed': 0,
+            'hash_seconds': 0.0
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        self.queue_limit = app.config.get('PASSWORD_HASH_QUEUE_LIMIT', self.workers * 4)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 10)
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        self.max_per_ip = app.config.get('AUTH_MAX_ATTEMPTS_PER_IP', 30)
+        self.max_per_email = app.config.get('AUTH_MAX_ATTEMPTS_PER_EMAIL', 10)
+        self.max_per_account = app.config.get('AUTH_MAX_ATTEMPTS_PER_ACCOUNT', 50)
+        self.account_delay = app.config.get('AUTH_ACCOUNT_DELAY', 0.5)
+        self.account_max_delay = app.config.get('AUTH_ACCOUNT_MAX_DELAY', 5)
+        self.proxy_count = app.config.get('AUTH_PROXY_COUNT', 0)
+        self.attempts = AttemptCounter(app.config.get('AUTH_ATTEMPT_WINDOW', 300))
+
+    def get_executor(self):
+        # Creato al primo utilizzo, quindi dopo il fork dei worker gunicorn
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+            return self.executor
+
+    def run(self, fn, *args):
+        """Esegue fn(*args) nel pool e ne attende il risultato"""
+        with self.lock:
+            if self.pending >= self.queue_limit:
+                self.metrics['rejected'] += 1
+                raise PasswordHashBusy()
+            self.pending += 1
+
+        start = time.perf_counter()
+        future = self.get_executor().submit(fn, *args)
+        future.add_done_callback(lambda done: self.on_done(start))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # L'hash resta in coda finché il pool non lo completa
+            raise PasswordHashBusy()
+
+    def on_done(self, start):
+        with self.lock:
+            self.pending -= 1
+            self.metrics['hash_seconds'] += time.perf_counter() - start
+
+    def hash(self, password):
+        """Hash bcrypt della password con il costo configurato"""
+        password_hash = self.run(bcrypt.generate_password_hash, password, self.rounds)
+        with self.lock:
+            self.metrics['hashed'] += 1
+        return password_hash.decode('utf-8')
+
+    def check(self, password_hash, password):
+        result = self.run(bcrypt.check_password_hash, password_hash, password)
+        with self.lock:
+            self.metrics['checked'] += 1
+        return result
+
+    def needs_rehash(self, password_hash):
+        """True se l'hash ($2b$<costo>$...) non usa il costo configurato"""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def rehash(self, user, password):
+        """Ricalcola l'hash con il costo attuale dopo un login riuscito.
+
+        Restituisce True se l'hash è cambiato (il commit è del chiamante); con il
+        pool saturo si rinuncia e si riprova al login successivo.
+        """
+        if not self.needs_rehash(user.password_hash):
+            return False
+        try:
+            user.password_hash = self.hash(password)
+        except PasswordHashBusy:
+            return False
+        with self.lock:
+            self.metrics['rehashed'] += 1
+        return True
+
+    def client_ip(self):
+        route = request.access_route
+        if self.proxy_count and len(route) >= self.proxy_count:
+            return route[-self.proxy_count]
+        return request.remote_addr
+
+    def attempt_keys(self, email=None):
+        ip = self.client_ip()
+        keys = [(('ip', ip), self.max_per_ip)]
+        if email:
+            keys.append((('email', email, ip), self.max_per_email))
+        return keys
+
+    def delay_for(self, email, now):
+        """Attesa imposta ai login su un'email oltre il tetto per account (0 sotto il tetto)"""
+        excess = self.attempts.count(('account', email), now) - self.max_per_account
+        if excess < 0:
+            return 0
+        return min(self.account_max_delay, self.account_delay * (excess + 1))
+
+    def admit(self, email=None):
+        """Solleva TooManyAttempts se l'IP della richiesta, o l'email da quell'IP, hanno esaurito i tentativi.
+
+        Se l'email ha superato il tetto per account il login viene solo ritardato.
+        """
+        now = time.monotonic()
+        with self.lock:
+            waits = [self.attempts.retry_after(key, limit, now) for key, limit in self.attempt_keys(email)]
+            waits = [wait for wait in waits if wait is not None]
+            if waits:
+                self.metrics['throttled'] += 1
+                raise TooManyAttempts(max(waits))
+            delay = self.delay_for(email, now) if email else 0
+            if delay:
+                self.metrics['delayed'] += 1
+        if delay:
+            time.sleep(delay)
+
+    def record_attempt(self, email=None):
+        """Conta un tentativo (login fallito o registrazione) per l'IP e l'email"""
+        now = time.monotonic()
+        with self.lock:
+            for key, _ in self.attempt_keys(email):
+                self.attempts.add(key, now)
+            if email:
+                self.attempts.add(('account', email), now)
+
+    def record_success(self, email):
+        with self.lock:
+            self.attempts.reset(('email', email, self.client_ip()))
+
+    def stats(self):
+        """Metriche del pool nel processo corrente"""
+        with self.lock:
+            metrics = dict(self.metrics)
+            pending = self.pending
+        done = metrics['hashed'] + metrics['checked']
+        return {
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'rounds': self.rounds,
+            'pending': pending,
+            'hashed': metrics['hashed'],
+            'checked': metrics['checked'],
+            'rehashed': metrics['rehashed'],
+            'rejected': metrics['rejected'],
+            'throttled': metrics['throttled'],
+            'delayed': metrics['delayed'],
+            'avg_hash_seconds': round(metrics['hash_seconds'] / done, 4) if done else None
+        }
+
+password_hasher = PasswordHasher()
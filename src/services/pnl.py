@@ -0,0 +1,82 @@
+import numpy as np
+from src.models.user import (
+    AMOUNT_COLUMNS, CENTS, RICAVI_COLUMNS, COSTI_VARIABILI_COLUMNS, COSTI_FISSI_COLUMNS
+)
+
+# Voci di input del conto economico, nell'ordine dei form e dei report
+INPUT_FIELDS = AMOUNT_COLUMNS
+
+# Metriche derivate, con le stesse formule delle colonne generate di FinancialData
+METRICS = ('ricavi_totali', 'costi_variabili', 'costi_fissi', 'totale_costi', 'utile_netto', 'margine_percentuale')
+
+def field_value(item, field):
+    """Valore di una voce da un oggetto (modello, riga SQLAlchemy) o da un dizionario"""
+    if isinstance(item, dict):
+        return item.get(field)
+    return getattr(item, field, None)
+
+def to_columns(items, fields=INPUT_FIELDS):
+    """Converte una sequenza di mesi in colonne NumPy int64 di centesimi (NULL = 0)"""
+    count = len(items)
+    return {
+        field: np.fromiter((field_value(item, field) or 0 for item in items), dtype=np.int64, count=count)
+        for field in fields
+    }
+
+def to_euros(columns, exclude=('margine_percentuale', 'period')):
+    """Colonne in centesimi -> float64 in euro, per la presentazione e i modelli statistici"""
+    return {
+        name: values if name in exclude else np.asarray(values) / CENTS
+        for name, values in columns.items()
+    }
+
+def column_sum(columns, fields, size, dtype):
+    total = np.zeros(size, dtype=dtype)
+    for field in fields:
+        if field in columns:
+            total += columns[field]
+    return total
+
+def compute_pnl(columns):
+    """Calcola tutte le metriche derivate di un blocco di mesi in un solo passaggio vettoriale.
+
+    columns mappa ogni voce di INPUT_FIELDS su un array (le voci mancanti valgono
+    zero); restituisce un dizionario metrica -> array della stessa lunghezza.
+    Con colonne intere (centesimi, da to_columns) i totali sono interi esatti;
+    con colonne float (scenari del simulatore) gli importi sono arrotondati al
+    centesimo. Il margine è sempre float a due decimali, come nel database.
+    """
+    size = len(next(iter(columns.values()))) if columns else 0
+    columns = {field: np.asarray(values) for field, values in columns.items()}
+    dtype = np.result_type(np.int64, *columns.values())
+    exact = np.issubdtype(dtype, np.integer)
+
+    ricavi_totali = column_sum(columns, RICAVI_COLUMNS, size, dtype)
+    costi_variabili = column_sum(columns, COSTI_VARIABILI_COLUMNS, size, dtype)
+    costi_fissi = column_sum(columns, COSTI_FISSI_COLUMNS, size, dtype)
+    totale_costi = costi_variabili + costi_fissi
+    utile_netto = ricavi_totali - totale_costi
+
+    margine_percentuale = np.zeros(size, dtype=np.float64)
+    np.divide(utile_netto * 100, ricavi_totali, out=margine_percentuale, where=ricavi_totali > 0)
+
+    def amount(values):
+        return values if exact else np.round(values, 2)
+
+    return {
+        'ricavi_totali': amount(ricavi_totali),
+        'costi_variabili': amount(costi_variabili),
+        'costi_fissi': amount(costi_fissi),
+        'totale_costi': amount(totale_costi),
+        'utile_netto': amount(utile_netto),
+        'margine_percentuale': np.round(margine_percentuale, 2)
+    }
+
+def compute_month(item):
+    """Voci e metriche di un singolo mese in euro, per PDF, anteprime e grafici.
+
+    Il calcolo avviene in centesimi interi; la conversione in euro è l'ultimo passo.
+    """
+    columns = to_columns([item])
+    columns.update(compute_pnl(columns))
+    return {name: float(values[0]) for name, values in to_euros(columns).items()}
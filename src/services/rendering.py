@@ -0,0 +1,240 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+class RenderQueueFull(Exception):
+    """La coda del servizio di rendering ha raggiunto il limite configurato"""
+
+def timed_call(fn, *args):
+    """Esegue fn nel processo del pool e ne misura il tempo di rendering"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+class RenderService:
+    """Pool di processi per il rendering dei report PDF fuori dal thread della richiesta.
+
+    I job possono essere attesi (wait) oppure, se asincroni, interrogati tramite
+    job id: stato e PDF vengono scritti in PDF_RENDER_JOBS_DIR, così qualunque
+    worker gunicorn può rispondere al polling. Configurazione:
+    - PDF_RENDER_WORKERS: processi del pool
+    - PDF_RENDER_QUEUE_LIMIT: job in corso o in coda oltre i quali si rifiuta
+    - PDF_RENDER_TIMEOUT: secondi di attesa massima per i job sincroni
+    - PDF_RENDER_JOB_TTL: secondi di conservazione dei job asincroni completati
+
+    Con un altro config_prefix la stessa classe gestisce un pool separato, con
+    limiti propri (es. MONTECARLO_WORKERS per il simulatore avanzato).
+    """
+
+    def __init__(self, app=None, config_prefix='PDF_RENDER', jobs_dirname='render_jobs'):
+        self.config_prefix = config_prefix
+        self.jobs_dirname = jobs_dirname
+        self.executor = None
+        self.lock = threading.Lock()
+        self.futures = {}
+        # Job accettati e non ancora terminati: il posto è riservato insieme al controllo del limite
+        self.pending = 0
+        self.metrics = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'render_seconds': 0.0,
+            'queue_seconds': 0.0
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def config(self, app, name, default):
+        return app.config.get(f'{self.config_prefix}_{name}', default)
+
+    def init_app(self, app):
+        self.workers = self.config(app, 'WORKERS', max(1, (os.cpu_count() or 2) // 2))
+        self.queue_limit = self.config(app, 'QUEUE_LIMIT', self.workers * 4)
+        self.timeout = self.config(app, 'TIMEOUT', 30)
+        self.job_ttl = self.config(app, 'JOB_TTL', 3600)
+        self.start_method = self.config(app, 'START_METHOD', 'spawn')
+        self.jobs_dir = self.config(app, 'JOBS_DIR', os.path.join(app.instance_path, self.jobs_dirname))
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def get_executor(self):
+        # Creato al primo utilizzo, quindi dopo il fork dei worker gunicorn
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method)
+                )
+            return self.executor
+
+    def job_path(self, job_id, suffix):
+        return os.path.join(self.jobs_dir, f'{job_id}{suffix}')
+
+    def write_job(self, job_id, job):
+        tmp_path = self.job_path(job_id, '.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self.job_path(job_id, '.json'))
+
+    def submit(self, owner, fn, *args, keep_result=False, on_result=None):
+        """Accoda fn(*args) nel pool e restituisce il job id.
+
+        Solleva RenderQueueFull se i job non terminati sono già queue_limit.
+        Con keep_result il risultato viene salvato per il polling; on_result
+        riceve il risultato appena il job termina con successo.
+        """
+        with self.lock:
+            if self.pending >= self.queue_limit:
+                self.metrics['rejected'] += 1
+                raise RenderQueueFull()
+            self.pending += 1
+            self.metrics['submitted'] += 1
+
+        job_id = uuid.uuid4().hex
+        submitted_at = time.time()
+
+        try:
+            if keep_result:
+                self.cleanup_jobs()
+                self.write_job(job_id, {'owner': str(owner), 'status': 'pending', 'submitted_at': submitted_at})
+            future = self.get_executor().submit(timed_call, fn, *args)
+        except Exception:
+            self.release()
+            raise
+        with self.lock:
+            self.futures[job_id] = future
+        future.add_done_callback(
+            lambda done: self.on_done(job_id, owner, submitted_at, done, keep_result, on_result)
+        )
+        # Il posto si libera dopo on_done: un job resta in corso finché il risultato non è salvato
+        future.add_done_callback(lambda done: self.release())
+        return job_id
+
+    def release(self):
+        with self.lock:
+            self.pending -= 1
+
+    def store(self, owner, result):
+        """Registra come job asincrono completato un risultato già disponibile (es. dalla cache)"""
+        job_id = uuid.uuid4().hex
+        with open(self.job_path(job_id, '.pdf'), 'wb') as f:
+            f.write(result)
+        self.write_job(job_id, {
+            'owner': str(owner),
+            'status': 'done',
+            'submitted_at': time.time(),
+            'total_seconds': 0,
+            'size': len(result)
+        })
+        return job_id
+
+    def on_done(self, job_id, owner, submitted_at, future, keep_result, on_result):
+        """Aggiorna metriche e, per i job asincroni, salva risultato e stato"""
+        total = time.time() - submitted_at
+        job = {'owner': str(owner), 'submitted_at': submitted_at, 'total_seconds': round(total, 4)}
+
+        try:
+            result, render_seconds = future.result()
+        except Exception as e:
+            with self.lock:
+                self.metrics['failed'] += 1
+            job.update({'status': 'failed', 'error': str(e)})
+        else:
+            with self.lock:
+                self.metrics['completed'] += 1
+                self.metrics['render_seconds'] += render_seconds
+                self.metrics['queue_seconds'] += max(total - render_seconds, 0)
+            job.update({
+                'status': 'done',
+                'render_seconds': round(render_seconds, 4),
+                'queue_seconds': round(max(total - render_seconds, 0), 4),
+                'size': len(result)
+            })
+            if keep_result:
+                with open(self.job_path(job_id, '.pdf'), 'wb') as f:
+                    f.write(result)
+            if on_result is not None:
+                on_result(result)
+
+        if keep_result:
+            self.write_job(job_id, job)
+            # Il risultato è su disco: il future non serve più
+            self.forget(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """Attende un job sincrono e ne restituisce il risultato"""
+        with self.lock:
+            future = self.futures[job_id]
+        try:
+            result, _ = future.result(timeout=timeout or self.timeout)
+            return result
+        finally:
+            # Dopo un timeout il job resta in coda finché il pool non lo completa
+            future.add_done_callback(lambda done: self.forget(job_id))
+
+    def discard(self, job_id):
+        """Rinuncia al risultato di un job sincrono che non verrà atteso"""
+        with self.lock:
+            future = self.futures.get(job_id)
+        if future is not None:
+            future.add_done_callback(lambda done: self.forget(job_id))
+
+    def forget(self, job_id):
+        with self.lock:
+            self.futures.pop(job_id, None)
+
+    def get_job(self, job_id, owner):
+        """Stato di un job asincrono, None se non esiste o appartiene a un altro utente"""
+        try:
+            with open(self.job_path(job_id, '.json')) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job.get('owner') != str(owner):
+            return None
+        return job
+
+    def get_result_path(self, job_id, owner):
+        """Percorso del PDF di un job completato"""
+        job = self.get_job(job_id, owner)
+        if not job or job['status'] != 'done':
+            return None
+        return self.job_path(job_id, '.pdf')
+
+    def cleanup_jobs(self):
+        """Elimina i job asincroni più vecchi di job_ttl"""
+        limit = time.time() - self.job_ttl
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        """Metriche del pool nel processo corrente"""
+        with self.lock:
+            metrics = dict(self.metrics)
+            pending = self.pending
+        completed = metrics['completed']
+        return {
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'pending': pending,
+            'submitted': metrics['submitted'],
+            'completed': completed,
+            'failed': metrics['failed'],
+            'rejected': metrics['rejected'],
+            'avg_render_seconds': round(metrics['render_seconds'] / completed, 4) if completed else None,
+            'avg_queue_seconds': round(metrics['queue_seconds'] / completed, 4) if completed else None
+        }
+
+render_service = RenderService()
+
+# Campionamenti Monte Carlo: pool distinto, una simulazione non occupa i processi dei PDF
+montecarlo_service = RenderService(config_prefix='MONTECARLO', jobs_dirname='montecarlo_jobs')
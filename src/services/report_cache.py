@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+import uuid
+
+class ReportCache:
+    """Cache su disco dei PDF generati, indirizzata per contenuto.
+
+    La chiave è l'hash degli input del report (utente, periodo, updated_at della
+    riga, versione del template): un dato modificato produce una chiave nuova e
+    le vecchie voci escono per LRU. Ogni lettura aggiorna l'mtime del file, così
+    l'eviction elimina i report usati meno di recente quando la dimensione
+    totale supera REPORT_CACHE_MAX_BYTES. Configurazione:
+    - REPORT_CACHE_DIR: cartella dei PDF in cache
+    - REPORT_CACHE_MAX_BYTES: dimensione massima della cartella
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('REPORT_CACHE_DIR', os.path.join(app.instance_path, 'report_cache'))
+        self.max_bytes = app.config.get('REPORT_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash stabile delle parti che determinano il contenuto del report"""
+        return hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_path(self, key):
+        """Percorso del PDF in cache (da servire con sendfile), None se assente"""
+        if self.directory is None:
+            return None
+
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            self.record(False)
+            return None
+
+        self.record(True)
+        return path
+
+    def get(self, key):
+        """Byte del PDF in cache, None se assente"""
+        path = self.get_path(key)
+        if path is None:
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            # Eliminato da un'eviction concorrente
+            return None
+
+    def set(self, key, content):
+        """Salva il PDF e applica il limite di dimensione"""
+        if self.directory is None:
+            return
+
+        # Scrittura atomica: gli altri worker non leggono mai un file parziale
+        tmp_path = os.path.join(self.directory, f'.{uuid.uuid4().hex}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """Elimina i report usati meno di recente finché la cartella supera max_bytes"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pdf'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self.lock:
+                self.evictions += 1
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        """Contatori hit/miss/eviction del processo corrente"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / total, 4) if total else None
+        }
+
+report_cache = ReportCache()
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import User, db
+from src.services.cache import dashboard_cache
 import stripe
 import os
 from datetime import datetime, timedelta
@@ -27,7 +28,8 @@ PLANS = {
             'max_months': 3,
             'pdf_export': False,
             'email_reports': False,
-            'advanced_simulator': False
+            'advanced_simulator': False,
+            'predictive_analytics': False
         }
     },
     'pro': {
@@ -45,7 +47,8 @@ PLANS = {
             'max_months': None,
             'pdf_export': True,
             'email_reports': True,
-            'advanced_simulator': False
+            'advanced_simulator': False,
+            'predictive_analytics': False
         }
     },
     'premium': {
@@ -63,7 +66,8 @@ PLANS = {
             'max_months': None,
             'pdf_export': True,
             'email_reports': True,
-            'advanced_simulator': True
+            'advanced_simulator': True,
+            'predictive_analytics': True
         }
     }
 }
@@ -252,6 +256,8 @@ def handle_checkout_session_completed(session):
                 user.subscription_end_date = datetime.fromtimestamp(subscription.current_period_end)
             
             db.session.commit()
+            # Il piano incide sui dati della dashboard (es. limite mesi del piano free)
+            dashboard_cache.bump_version(user.id)
             
     except Exception as e:
         print(f"Errore nel gestire checkout completato: {str(e)}")
@@ -274,6 +280,7 @@ def handle_subscription_updated(subscription):
                     break
             
             db.session.commit()
+            dashboard_cache.bump_version(user.id)
             
     except Exception as e:
         print(f"Errore nel gestire aggiornamento sottoscrizione: {str(e)}")
@@ -290,6 +297,7 @@ def handle_subscription_deleted(subscription):
             user.subscription_end_date = None
             
             db.session.commit()
+            dashboard_cache.bump_version(user.id)
             
     except Exception as e:
         print(f"Errore nel gestire cancellazione sottoscrizione: {str(e)}")
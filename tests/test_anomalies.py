@@ -0,0 +1,128 @@
+import re
+
+import numpy as np
+from sqlalchemy import event
+
+from src.models.user import db, FinancialData, month_ordinal
+from src.services.anomalies import anomalous, month_values, score_block
+from src.services.pnl import INPUT_FIELDS
+
+BASE = {'ricavi_servizi': 10000, 'affitto': 1500, 'stipendi': 4000, 'marketing_fisso': 0}
+
+def post_month(client, headers, month, **values):
+    response = client.post('/api/financial-data', headers=headers, json={
+        'month': month, 'year': 2025, **BASE, 'ricavi_servizi': 10000 + 150 * (month % 3), **values
+    })
+    assert response.status_code == 201
+
+def flagged(client, headers, month):
+    response = client.get(f'/api/anomalies?period=2025-{month:02d}', headers=headers)
+    assert response.status_code == 200
+    return {flag['field']: flag for flag in response.get_json()['anomalies']}
+
+def test_small_amount_on_a_zero_field_is_not_flagged(client, make_user):
+    _, headers = make_user()
+    for month in range(1, 7):
+        post_month(client, headers, month)
+
+    # 20 euro su una voce sempre a zero: z-score altissimo, scarto irrilevante
+    post_month(client, headers, 7, marketing_fisso=20)
+    assert flagged(client, headers, 7) == {}
+
+def test_extra_zero_on_salaries_is_flagged(client, make_user):
+    _, headers = make_user()
+    for month in range(1, 7):
+        post_month(client, headers, month)
+
+    post_month(client, headers, 7, stipendi=40000)
+    flags = flagged(client, headers, 7)
+    assert set(flags) == {'stipendi'}
+    assert flags['stipendi']['value'] == 40000
+    assert flags['stipendi']['expected'] == 4000
+
+def test_batch_applies_the_same_minimum_deviation():
+    # Stessi mesi per il ricalcolo notturno (rescore_anomalies.py)
+    def row(**values):
+        month = {**BASE, **values}
+        return [month.get(field, 0) for field in INPUT_FIELDS]
+
+    values = np.array([row()] * 6 + [row(marketing_fisso=20), row(stipendi=40000)], dtype=np.float64)
+    scores, mean, valid = score_block(np.zeros(len(values), dtype=np.int64), values)
+    mask = anomalous(scores, mean, values) & valid[:, None]
+    assert not mask[6].any()
+    assert [INPUT_FIELDS[index] for index in np.flatnonzero(mask[7])] == ['stipendi']
+
+def batch_flags(user_id, month):
+    """Voci che il ricalcolo notturno segnalerebbe per il mese, dai dati attuali"""
+    rows = FinancialData.query.filter_by(user_id=user_id).order_by(FinancialData.period).all()
+    values = np.array([month_values(row) for row in rows])
+    scores, mean, valid = score_block(np.full(len(rows), user_id, dtype=np.int64), values)
+    mask = anomalous(scores, mean, values) & valid[:, None]
+    index = [row.period for row in rows].index(month_ordinal(2025, month))
+    return {INPUT_FIELDS[column] for column in np.flatnonzero(mask[index])}
+
+def test_edited_month_is_scored_against_previous_months(client, make_user):
+    user_id, headers = make_user()
+    # L'attività cresce: dal mese 6 gli stipendi sono dieci volte tanto
+    for month in range(1, 11):
+        post_month(client, headers, month, stipendi=4000 if month <= 5 else 40000)
+
+    # Il mese 5 corretto al nuovo livello: anomalo rispetto ai mesi 1-4 che lo
+    # precedono, normale rispetto a una finestra che includesse i mesi 6-10
+    item = FinancialData.query.filter_by(user_id=user_id, period=month_ordinal(2025, 5)).one()
+    response = client.put(f'/api/financial-data/{item.id}', headers=headers, json={**BASE, 'stipendi': 40000})
+    assert response.status_code == 200
+
+    assert set(flagged(client, headers, 5)) == batch_flags(user_id, 5) == {'stipendi'}
+
+def test_backfilled_month_is_scored_like_the_batch(client, make_user):
+    user_id, headers = make_user()
+    for month in (1, 2, 3, 4, 6, 7, 8, 9, 10):
+        post_month(client, headers, month, stipendi=4000 if month <= 5 else 40000)
+
+    post_month(client, headers, 5, stipendi=40000)
+    assert set(flagged(client, headers, 5)) == batch_flags(user_id, 5) == {'stipendi'}
+
+    # Tornato al valore abituale il mese non è più anomalo, come nel batch
+    item = FinancialData.query.filter_by(user_id=user_id, period=month_ordinal(2025, 5)).one()
+    client.put(f'/api/financial-data/{item.id}', headers=headers, json={**BASE, 'stipendi': 4000})
+    assert set(flagged(client, headers, 5)) == batch_flags(user_id, 5) == set()
+
+def test_edit_of_the_latest_month_uses_the_window_without_itself(client, make_user):
+    user_id, headers = make_user()
+    for month in range(1, 9):
+        post_month(client, headers, month)
+
+    item = FinancialData.query.filter_by(user_id=user_id, period=month_ordinal(2025, 8)).one()
+    response = client.put(f'/api/financial-data/{item.id}', headers=headers, json={**BASE, 'stipendi': 40000})
+    assert response.status_code == 200
+    assert set(flagged(client, headers, 8)) == batch_flags(user_id, 8) == {'stipendi'}
+
+def import_csv(client, headers, rows, mode='create'):
+    lines = ['month,year,ricavi_servizi,affitto,stipendi'] + [','.join(map(str, row)) for row in rows]
+    return client.post(f'/api/financial-data/import?format=csv&mode={mode}', headers=headers,
+                       data='\n'.join(lines), content_type='text/csv')
+
+def test_multi_month_backfill_is_scored_with_one_read(client, make_user):
+    user_id, headers = make_user()
+    for month in (1, 2, 3, 4, 7, 8, 9, 10):
+        post_month(client, headers, month, stipendi=4000 if month <= 4 else 40000)
+
+    selects = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT') and re.search(r'\bFROM financial_data\b', statement):
+            selects.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        # Due mesi nel passato e uno nuovo in coda nello stesso import
+        response = import_csv(client, headers, [(month, 2025, 10000, 1500, 40000) for month in (5, 6, 11)])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    assert response.get_json()['imported'] == 3
+    assert len(selects) == 1
+    for month in (5, 6, 11):
+        assert set(flagged(client, headers, month)) == batch_flags(user_id, month)
+    assert batch_flags(user_id, 5) == {'stipendi'}
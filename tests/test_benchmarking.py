@@ -0,0 +1,113 @@
+import re
+import threading
+
+from sqlalchemy import event
+
+from src.models.user import db, User, BenchmarkSketch, month_ordinal
+from src.services import benchmarks
+from src.services.benchmarks import BENCHMARK_METRICS, MIN_TENANTS
+
+def add_month(client, headers, ricavi, month=3):
+    response = client.post('/api/financial-data', headers=headers, json={
+        'month': month, 'year': 2025, 'ricavi_servizi': ricavi, 'affitto': 1500
+    })
+    assert response.status_code == 201
+
+def test_etag_changes_when_the_group_changes(client, make_user):
+    _, headers = make_user()
+    add_month(client, headers, 10000)
+
+    first = client.get('/api/benchmark', headers=headers)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert client.get('/api/benchmark', headers={**headers, 'If-None-Match': etag}).status_code == 304
+
+    # I dati dell'utente non cambiano, il suo gruppo sì
+    for index in range(MIN_TENANTS):
+        _, other = make_user(email=f'altro{index}@esempio.it')
+        add_month(client, other, 8000 + 1000 * index)
+
+    refreshed = client.get('/api/benchmark', headers={**headers, 'If-None-Match': etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers['ETag'] != etag
+    assert set(refreshed.get_json()['metrics']) == set(BENCHMARK_METRICS)
+
+    # Scritture in un altro mese o in un altro gruppo non invalidano la risposta
+    etag = refreshed.headers['ETag']
+    _, elsewhere = make_user(email='ristorante@esempio.it', business_type='ristorante')
+    add_month(client, elsewhere, 9000)
+    add_month(client, other, 9000, month=4)
+    assert client.get('/api/benchmark', headers={**headers, 'If-None-Match': etag}).status_code == 304
+
+def test_etag_changes_with_the_business_type(client, make_user):
+    user_id, headers = make_user()
+    add_month(client, headers, 10000)
+    etag = client.get('/api/benchmark', headers=headers).headers['ETag']
+
+    db.session.get(User, user_id).business_type = 'Ristorante'
+    db.session.commit()
+
+    response = client.get('/api/benchmark', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+
+def test_concurrent_first_flushes_share_the_sketch_rows(app):
+    period = month_ordinal(2025, 3)
+    values = {'ricavi_totali': 10000.0, 'utile_netto': 8500.0, 'margine_percentuale': 85.0}
+
+    # Le due transazioni cercano gli sketch prima che l'altra li abbia creati
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def worker():
+        with app.app_context():
+            updates = benchmarks.SketchUpdates()
+            updates.apply('palestra', period, values, 1)
+            barrier.wait(timeout=5)
+            try:
+                updates.flush()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    sketches = BenchmarkSketch.query.filter_by(business_type='palestra', period=period).all()
+    assert sorted(sketch.metric for sketch in sketches) == sorted(BENCHMARK_METRICS)
+    assert all(sketch.count == 2 for sketch in sketches)
+
+def count_statements(table):
+    """Conta le istruzioni SQL eseguite su table, executemany compresi una sola volta"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if re.search(rf'\b(FROM|INTO|UPDATE)\s+{table}\b', statement):
+            statements.append(statement.split()[0])
+
+    return statements, before_cursor_execute
+
+def test_import_writes_sketches_with_a_fixed_number_of_statements(client, make_user):
+    _, headers = make_user()
+    lines = ['month,year,ricavi_servizi,affitto,stipendi']
+    lines += [f'{index % 12 + 1},{2020 + index // 12},{10000 + index},1500,4000' for index in range(60)]
+
+    counters = {table: count_statements(table) for table in ('benchmark_sketches', 'benchmark_entries')}
+    for _, listener in counters.values():
+        event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = client.post('/api/financial-data/import?format=csv', headers=headers,
+                               data='\n'.join(lines), content_type='text/csv')
+    finally:
+        for _, listener in counters.values():
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert response.get_json()['imported'] == 60
+    assert sorted(counters['benchmark_sketches'][0]) == ['INSERT', 'SELECT', 'UPDATE']
+    assert sorted(counters['benchmark_entries'][0]) == ['INSERT', 'SELECT']
+    assert BenchmarkSketch.query.count() == 60 * len(BENCHMARK_METRICS)
+    assert all(sketch.count == 1 for sketch in BenchmarkSketch.query)
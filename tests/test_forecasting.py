@@ -0,0 +1,56 @@
+import threading
+
+from src.models.user import db, ForecastModel
+from src.services import forecasting as forecasting_service
+from src.services.forecasting import MODEL_VERSION
+
+def add_months(client, headers, count=6):
+    for month in range(1, count + 1):
+        response = client.post('/api/financial-data', headers=headers, json={
+            'month': month, 'year': 2025, 'ricavi_servizi': 10000 + 100 * month, 'affitto': 1500
+        })
+        assert response.status_code == 201
+
+def test_first_forecast_creates_the_model(client, make_user):
+    user_id, headers = make_user(plan='premium')
+    add_months(client, headers)
+
+    response = client.get('/api/forecast', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['model']['observations'] == 6
+    assert ForecastModel.query.filter_by(user_id=user_id).count() == 1
+
+def test_concurrent_first_forecasts_share_one_model(app, client, make_user, monkeypatch):
+    user_id, headers = make_user(plan='premium')
+    add_months(client, headers)
+
+    # Le due richieste leggono lo storico insieme, dopo aver constatato che il
+    # modello non esiste; se una resta bloccata dall'altra il punto d'incontro salta
+    barrier = threading.Barrier(2)
+    load_months = forecasting_service.load_months
+
+    def meeting_load_months(owner_id):
+        try:
+            barrier.wait(timeout=1)
+        except threading.BrokenBarrierError:
+            pass
+        return load_months(owner_id)
+
+    monkeypatch.setattr(forecasting_service, 'load_months', meeting_load_months)
+    statuses = []
+
+    def worker():
+        statuses.append(app.test_client().get('/api/forecast', headers=headers).status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200, 200]
+    db.session.expire_all()
+    models = ForecastModel.query.filter_by(user_id=user_id).all()
+    assert len(models) == 1
+    assert models[0].model_version == MODEL_VERSION
+    assert models[0].observations == 6
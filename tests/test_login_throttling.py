@@ -0,0 +1,80 @@
+from src.models.user import db, User
+from src.services import passwords
+from src.services.passwords import password_hasher
+
+EMAIL = 'mario@esempio.it'
+PASSWORD = 'password-giusta'
+
+def login(client, ip, password=PASSWORD):
+    return client.post('/api/auth/login', json={'email': EMAIL, 'password': password},
+                       environ_base={'REMOTE_ADDR': ip})
+
+def make_account(app, max_per_email=3, max_per_ip=30, max_per_account=50):
+    app.config.update(
+        AUTH_MAX_ATTEMPTS_PER_EMAIL=max_per_email,
+        AUTH_MAX_ATTEMPTS_PER_IP=max_per_ip,
+        AUTH_MAX_ATTEMPTS_PER_ACCOUNT=max_per_account,
+        AUTH_ACCOUNT_DELAY=0.5,
+        AUTH_ACCOUNT_MAX_DELAY=2
+    )
+    password_hasher.init_app(app)
+    user = User(email=EMAIL, first_name='Mario', last_name='Rossi')
+    user.password_hash = password_hasher.hash(PASSWORD)
+    db.session.add(user)
+    db.session.commit()
+
+def test_failed_logins_lock_the_email_only_for_that_ip(app, client):
+    make_account(app)
+    for _ in range(3):
+        assert login(client, '203.0.113.7', 'sbagliata').status_code == 401
+
+    blocked = login(client, '203.0.113.7')
+    assert blocked.status_code == 429
+    assert int(blocked.headers['Retry-After']) > 0
+
+    # Chi conosce solo l'email non blocca il titolare, che accede da un altro IP
+    assert login(client, '198.51.100.20').status_code == 200
+
+def test_success_resets_only_the_callers_counter(app, client):
+    make_account(app)
+    for ip in ('203.0.113.7', '198.51.100.20'):
+        for _ in range(2):
+            assert login(client, ip, 'sbagliata').status_code == 401
+
+    assert login(client, '198.51.100.20').status_code == 200
+    assert login(client, '198.51.100.20', 'sbagliata').status_code == 401
+    assert login(client, '198.51.100.20', 'sbagliata').status_code == 401
+
+    assert login(client, '203.0.113.7', 'sbagliata').status_code == 401
+    assert login(client, '203.0.113.7').status_code == 429
+
+def test_per_ip_limit_still_covers_every_email(app, client):
+    make_account(app, max_per_email=10, max_per_ip=4)
+    for index in range(4):
+        response = client.post('/api/auth/login', json={'email': f'utente{index}@esempio.it', 'password': 'x'},
+                               environ_base={'REMOTE_ADDR': '203.0.113.7'})
+        assert response.status_code == 401
+
+    assert login(client, '203.0.113.7').status_code == 429
+    assert login(client, '198.51.100.20').status_code == 200
+
+def test_attempts_spread_over_many_ips_slow_the_account_down(app, client, monkeypatch):
+    make_account(app, max_per_account=4)
+    delayed_before = password_hasher.stats()['delayed']
+    delays = []
+    monkeypatch.setattr(passwords.time, 'sleep', delays.append)
+
+    # Un tentativo per IP: nessun IP raggiunge il proprio limite
+    for index in range(4):
+        assert login(client, f'203.0.113.{index}', 'sbagliata').status_code == 401
+    assert delays == []
+
+    for index in range(4, 9):
+        assert login(client, f'203.0.113.{index}', 'sbagliata').status_code == 401
+    # Oltre il tetto ogni tentativo attende di più, fino al massimo
+    assert delays == [0.5, 1.0, 1.5, 2, 2]
+
+    # Il titolare viene rallentato ma non bloccato
+    assert login(client, '198.51.100.20').status_code == 200
+    assert delays[-1] == 2
+    assert password_hasher.stats()['delayed'] - delayed_before == 6
@@ -0,0 +1,200 @@
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from src.models.user import db, OutboxEmail, ReportDelivery
+from src.services.mailer import mailer
+
+BACKOFF = 30
+
+class RecordingHandler:
+    """Server SMTP locale: registra i messaggi e risponde con i codici impostati per destinatario"""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+        self.rcpt_responses = {}
+        self.data_responses = {}
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        response = self.rcpt_responses.get(address)
+        if response:
+            return response
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        response = self.data_responses.get(envelope.rcpt_tos[0])
+        if response:
+            return response
+        self.sessions.add(id(session))
+        self.messages.append(envelope)
+        return '250 Message accepted for delivery'
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def smtp(app):
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    app.config.update(
+        MAIL_SERVER='127.0.0.1',
+        MAIL_PORT=controller.port,
+        MAIL_DEFAULT_SENDER='report@esempio.it',
+        MAIL_OUTBOX_BATCH_SIZE=10,
+        MAIL_OUTBOX_BACKOFF=BACKOFF,
+        MAIL_OUTBOX_MAX_ATTEMPTS=3
+    )
+    mailer.init_app(app)
+    yield handler
+    mailer.pool.close_all()
+    controller.stop()
+
+def enqueue(recipient, attachment=b'%PDF-1.4 report'):
+    return mailer.enqueue(recipient, 'Report mensile', 'In allegato il report.',
+                          attachment=attachment, attachment_name='report.pdf')
+
+def reload(message):
+    db.session.expire_all()
+    return db.session.get(OutboxEmail, message.id)
+
+def make_ready(message):
+    """Anticipa il prossimo tentativo come se il backoff fosse trascorso"""
+    message.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+def test_batch_is_sent_on_one_pooled_connection(smtp):
+    for index in range(5):
+        enqueue(f'cliente{index}@esempio.it')
+
+    assert mailer.flush() == 5
+    assert len(smtp.messages) == 5
+    assert len(smtp.sessions) == 1
+    assert mailer.pool.connections_opened == 1
+    assert b'report.pdf' in smtp.messages[0].content
+
+    # Il blocco successivo riusa la connessione inattiva del pool
+    for index in range(3):
+        enqueue(f'altro{index}@esempio.it')
+    assert mailer.flush() == 3
+    assert len(smtp.sessions) == 1
+    assert mailer.pool.connections_opened == 1
+
+    sent = OutboxEmail.query.all()
+    assert {message.status for message in sent} == {'sent'}
+    assert all(message.attachment is None for message in sent)
+
+def test_temporary_failure_is_retried_with_backoff(smtp):
+    smtp.data_responses['occupato@esempio.it'] = '451 4.3.0 Mailbox temporarily unavailable'
+    message = enqueue('occupato@esempio.it')
+
+    before = datetime.utcnow()
+    mailer.flush()
+    message = reload(message)
+    assert message.status == 'pending'
+    assert message.attempts == 1
+    assert '451' in message.last_error
+    assert message.attachment is not None
+    assert timedelta(seconds=BACKOFF - 1) <= message.next_attempt_at - before <= timedelta(seconds=BACKOFF + 5)
+
+    # Finché il backoff non scade il messaggio non viene reclamato
+    assert mailer.flush() == 0
+
+    # Secondo errore: l'attesa raddoppia
+    make_ready(message)
+    before = datetime.utcnow()
+    mailer.flush()
+    message = reload(message)
+    assert message.attempts == 2
+    assert message.next_attempt_at - before >= timedelta(seconds=2 * BACKOFF - 1)
+
+    # Il server torna disponibile
+    del smtp.data_responses['occupato@esempio.it']
+    make_ready(message)
+    mailer.flush()
+    message = reload(message)
+    assert message.status == 'sent'
+    assert message.attempts == 3
+    assert message.attachment is None
+    assert len(smtp.messages) == 1
+
+def test_temporary_failures_give_up_after_max_attempts(smtp):
+    smtp.rcpt_responses['occupato@esempio.it'] = '452 4.2.2 Mailbox full'
+    message = enqueue('occupato@esempio.it')
+
+    for _ in range(3):
+        make_ready(reload(message))
+        mailer.flush()
+
+    message = reload(message)
+    assert message.status == 'failed'
+    assert message.attempts == 3
+    assert message.attachment is None
+
+def test_permanent_failure_is_not_retried(smtp):
+    smtp.rcpt_responses['sconosciuto@esempio.it'] = '550 5.1.1 User unknown'
+    smtp.data_responses['rifiutato@esempio.it'] = '554 5.7.1 Message rejected'
+    unknown = enqueue('sconosciuto@esempio.it')
+    rejected = enqueue('rifiutato@esempio.it')
+    delivered = enqueue('cliente@esempio.it')
+
+    assert mailer.flush() == 3
+
+    for message in (unknown, rejected):
+        message = reload(message)
+        assert message.status == 'failed'
+        assert message.attempts == 1
+        assert message.attachment is None
+    assert '550' in reload(unknown).last_error
+    assert '554' in reload(rejected).last_error
+
+    # Gli errori di un destinatario non interrompono il resto del blocco
+    assert reload(delivered).status == 'sent'
+    assert len(smtp.sessions) == 1
+
+def test_stats_report_queue_depth(smtp):
+    smtp.rcpt_responses['sconosciuto@esempio.it'] = '550 5.1.1 User unknown'
+    for index in range(4):
+        enqueue(f'cliente{index}@esempio.it')
+    enqueue('sconosciuto@esempio.it')
+
+    stats = mailer.stats()
+    assert stats['pending'] == 5
+    assert stats['failed_total'] == 0
+    assert stats['oldest_pending_seconds'] is not None
+
+    sent_before = stats['sent']
+    mailer.flush()
+
+    stats = mailer.stats()
+    assert stats['pending'] == 0
+    assert stats['failed_total'] == 1
+    assert stats['oldest_pending_seconds'] is None
+    assert stats['sent'] - sent_before == 4
+    assert stats['avg_smtp_seconds'] is not None
+
+def test_purge_removes_old_messages_and_keeps_deliveries(app, smtp, make_user):
+    user_id, _ = make_user()
+    old = enqueue('vecchio@esempio.it')
+    recent = enqueue('recente@esempio.it')
+    mailer.flush()
+
+    old = reload(old)
+    old.created_at = datetime.utcnow() - timedelta(days=app.config.get('MAIL_OUTBOX_RETENTION_DAYS', 30) + 1)
+    db.session.add(ReportDelivery(user_id=user_id, period=2025 * 12 + 1, status='queued', email_id=old.id))
+    db.session.commit()
+
+    old_id, recent_id = old.id, recent.id
+
+    assert mailer.purge() == 1
+    db.session.expunge_all()
+    assert db.session.get(OutboxEmail, old_id) is None
+    assert db.session.get(OutboxEmail, recent_id) is not None
+    delivery = ReportDelivery.query.one()
+    assert delivery.email_id is None
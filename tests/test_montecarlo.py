@@ -0,0 +1,44 @@
+import numpy as np
+
+from src.services.montecarlo import fit_distributions, sample_chunk
+from src.services.rendering import render_service, montecarlo_service
+
+def month(period, ricavi, costo_merci, affitto=1500):
+    # Importi in centesimi, come nelle righe di FinancialData
+    return {'period': period, 'ricavi_servizi': ricavi * 100, 'costo_merci': costo_merci * 100, 'affitto': affitto * 100}
+
+def test_variable_costs_follow_sampled_revenue():
+    # Costo merci sempre al 40% dei ricavi, ricavi molto variabili
+    rows = [month(period, ricavi, ricavi * 0.4) for period, ricavi in enumerate((5000, 12000, 8000, 20000, 3000))]
+    distributions = fit_distributions(rows)
+    assert distributions['costo_merci']['kind'] == 'ratio'
+    assert distributions['ricavi_servizi']['kind'] == 'amount'
+    assert abs(np.exp(distributions['costo_merci']['mu']) - 0.4) < 1e-9
+    assert distributions['costo_merci']['sigma'] < 1e-9
+
+    result = sample_chunk(distributions, 20000, 1, np.random.SeedSequence(1))
+    # Utile = 60% dei ricavi - affitto: con costi campionati a parte i mesi di
+    # ricavi alti e costi bassi darebbero margini sopra il 60%
+    assert result['margine_percentuale'].max() <= 60
+
+def test_variable_costs_without_revenue_are_sampled_as_amounts():
+    rows = [month(period, 0, 300) for period in range(4)]
+    assert fit_distributions(rows)['costo_merci']['kind'] == 'amount'
+
+def test_montecarlo_runs_on_its_own_pool(client, make_user):
+    _, headers = make_user(plan='premium')
+    for index, ricavi in enumerate((9000, 11000, 10000, 12000)):
+        response = client.post('/api/financial-data', headers=headers, json={
+            'month': index + 1, 'year': 2025, 'ricavi_servizi': ricavi, 'costo_merci': ricavi * 0.3, 'affitto': 1500
+        })
+        assert response.status_code == 201
+
+    # I servizi sono singleton di processo: contano anche i job dei test precedenti
+    montecarlo_before = montecarlo_service.stats()['submitted']
+    render_before = render_service.stats()['submitted']
+
+    response = client.get('/api/simulator/montecarlo?samples=4000', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['samples'] == 4000
+    assert montecarlo_service.stats()['submitted'] - montecarlo_before == 4
+    assert render_service.stats()['submitted'] - render_before == 0
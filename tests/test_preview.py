@@ -0,0 +1,19 @@
+def test_preview_etag_changes_after_a_profile_edit(client, make_user):
+    _, headers = make_user()
+    response = client.post('/api/financial-data', headers=headers, json={
+        'month': 3, 'year': 2025, 'ricavi_servizi': 10000, 'affitto': 1500
+    })
+    assert response.status_code == 201
+
+    body = {'month': 3, 'year': 2025}
+    first = client.post('/api/export/preview-data', headers=headers, json=body)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert client.post('/api/export/preview-data', headers={**headers, 'If-None-Match': etag}, json=body).status_code == 304
+
+    response = client.put('/api/auth/profile', headers=headers, json={'business_name': 'Palestra Centrale'})
+    assert response.status_code == 200
+
+    refreshed = client.post('/api/export/preview-data', headers={**headers, 'If-None-Match': etag}, json=body)
+    assert refreshed.status_code == 200
+    assert refreshed.get_json()['user']['business_name'] == 'Palestra Centrale'
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from src.services.rendering import render_service
+from src.services.report_cache import report_cache
+
+MONTHS = 4
+
+@pytest.fixture
+def temp_dir(tmp_path, monkeypatch):
+    """Cartella temporanea di processo isolata, per contare i file lasciati dai download"""
+    path = tmp_path / 'tmp'
+    path.mkdir()
+    monkeypatch.setenv('TMPDIR', str(path))
+    monkeypatch.setattr(tempfile, 'tempdir', str(path))
+    return path
+
+@pytest.fixture
+def reports(client, make_user):
+    _, headers = make_user()
+    for month in range(1, MONTHS + 1):
+        response = client.post('/api/financial-data', headers=headers, json={
+            'month': month, 'year': 2025, 'ricavi_servizi': 10000 + month, 'affitto': 1500, 'stipendi': 4000
+        })
+        assert response.status_code == 201
+    return headers
+
+def listing(path):
+    return sorted(os.listdir(path))
+
+def cache_files():
+    return [entry for entry in os.scandir(report_cache.directory)]
+
+def wait_until_idle(timeout=10):
+    """Attende che il pool abbia finito anche i salvataggi successivi ai job"""
+    deadline = time.monotonic() + timeout
+    while render_service.stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert render_service.stats()['pending'] == 0
+
+def download(client, headers, month, **extra):
+    return client.get(f'/api/export/report/2025/{month}', headers={**headers, **extra})
+
+def test_repeated_downloads_leave_no_files(app, client, reports, temp_dir):
+    first = download(client, reports, 1)
+    assert first.status_code == 200
+    assert first.mimetype == 'application/pdf'
+    assert first.data.startswith(b'%PDF')
+    assert int(first.headers['Content-Length']) == len(first.data)
+
+    for _ in range(20):
+        response = download(client, reports, 1)
+        assert response.status_code == 200
+        assert response.data == first.data
+        assert int(response.headers['Content-Length']) == len(first.data)
+
+    wait_until_idle()
+    assert listing(temp_dir) == []
+    assert listing(render_service.jobs_dir) == []
+    # Un solo report in cache, nessun file temporaneo della scrittura atomica
+    assert [entry.name for entry in cache_files()] == [f"{first.headers['ETag'].strip(chr(34))}.pdf"]
+
+def test_conditional_and_ranged_downloads(client, reports, temp_dir):
+    full = download(client, reports, 2)
+    etag = full.headers['ETag']
+    size = len(full.data)
+
+    not_modified = download(client, reports, 2, **{'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+
+    head = download(client, reports, 2, Range='bytes=0-99')
+    assert head.status_code == 206
+    assert head.data == full.data[:100]
+    assert head.headers['Content-Length'] == '100'
+    assert head.headers['Content-Range'] == f'bytes 0-99/{size}'
+
+    tail = download(client, reports, 2, Range='bytes=100-')
+    assert tail.status_code == 206
+    assert head.data + tail.data == full.data
+
+    unsatisfiable = download(client, reports, 2, Range=f'bytes={size + 10}-')
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers['Content-Range'] == f'bytes */{size}'
+
+    assert listing(temp_dir) == []
+
+def test_concurrent_downloads_keep_directories_bounded(app, client, reports, temp_dir):
+    # Spazio per circa due report: l'eviction deve intervenire
+    size = len(download(client, reports, 1).data)
+    app.config['REPORT_CACHE_MAX_BYTES'] = int(size * 2.5)
+    report_cache.init_app(app)
+
+    statuses = []
+    lock = threading.Lock()
+
+    def worker(index):
+        local = app.test_client()
+        for round_ in range(5):
+            month = (index + round_) % MONTHS + 1
+            if round_ % 2:
+                response = download(local, reports, month, Range='bytes=0-499')
+                expected = 206
+            else:
+                response = download(local, reports, month)
+                expected = 200
+            with lock:
+                statuses.append(response.status_code == expected)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses and all(statuses)
+    # Le risposte partono appena il PDF è pronto, la scrittura in cache segue
+    wait_until_idle()
+    assert listing(temp_dir) == []
+    assert listing(render_service.jobs_dir) == []
+
+    entries = cache_files()
+    assert all(entry.name.endswith('.pdf') for entry in entries)
+    assert len(entries) <= MONTHS
+    assert sum(entry.stat().st_size for entry in entries) <= report_cache.max_bytes